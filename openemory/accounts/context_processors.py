@@ -23,7 +23,7 @@ from django.db.models import Count
 from django.utils.translation import ugettext_lazy as _
 from taggit.models import Tag
 from openemory.accounts.models import Bookmark, EsdPerson
-from openemory.util import solr_interface
+from openemory.util import solr_interface, CachedStatistics
 
 
 # really? do we have to extend the auth form just for style/design?
@@ -74,12 +74,13 @@ def statistics(request):
     <https://docs.djangoproject.com/en/dev/ref/settings/#template-context-processors>`_
     to add account and session statistics to page context under the name
     ACCOUNT_STATISTICS. The object currently has only one property:
-    ``total_users``.'''
+    ``total_users``.  Statistics are only calculated when used, and are
+    cached (see :class:`~openemory.util.CachedStatistics`).'''
+    return { 'ACCOUNT_STATISTICS': CachedStatistics('accounts', _account_statistics) }
 
+def _account_statistics():
     solr_query = solr_interface().query() \
                                  .filter(record_type=EsdPerson.record_type) \
                                  .paginate(rows=0)
     faculty_count = solr_query.execute().result.numFound
-    stats = { 'total_users': faculty_count }
-
-    return { 'ACCOUNT_STATISTICS': stats }
+    return { 'total_users': faculty_count }
@@ -22,8 +22,8 @@ from eulfedora.server import Repository
 from sunburnt import SolrError
 
 from openemory.accounts.models import UserProfile, EsdPerson
-from openemory.publication.models import Article
-from openemory.util import solr_interface
+from openemory.publication.models import Article, AuthorEsdResolver
+from openemory.util import solr_interface, invalidate_statistics
 
 
 class Command(BaseCommand):
@@ -49,7 +49,7 @@ class Command(BaseCommand):
 
         try:
             solr_url = options.get('index_url', None)
-            self.solr = solr_interface(solr_url)
+            self.solr = solr_interface(solr_url, indexing=True)
         except socket.error as se:
             raise CommandError('Failed to connect to Solr (%s)' % se)
 
@@ -78,6 +78,8 @@ class Command(BaseCommand):
         self.cascade_updated_articles()
         # commit all changes in Solr so they will be immediately available
         self.solr.commit()
+        # cached site statistics include the number of faculty in Solr
+        invalidate_statistics()
 
     def index_faculty(self):
         '''Add or update solr index for every EsdPerson record in the
@@ -151,10 +153,13 @@ class Command(BaseCommand):
                 updated_articles.add(article['pid'])
 
         repo = Repository()
+        # share author ESD lookups across articles by the same faculty
+        esd_resolver = AuthorEsdResolver()
         for pid in updated_articles:
             if self.verbosity >= self.v_all:
                 print 'Indexing article', pid
             article = repo.get_object(pid, type=Article)
+            article.esd_resolver = esd_resolver
             self.solr.add(article.index_data())
 
     def indexed_faculty(self):
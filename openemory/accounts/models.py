@@ -31,7 +31,8 @@ import logging
 from PIL import Image
 from south.modelsinspector import add_introspection_rules
 
-from openemory.util import solr_interface
+from openemory.util import solr_interface, solr_pid_filter, solr_fetch_pids, \
+     PID_CHUNK_SIZE
 from openemory.accounts.fields import YesNoBooleanField
 from openemory.publication.models import Article
 from openemory.publication.views import ARTICLE_VIEW_FIELDS
@@ -321,21 +322,27 @@ def articles_by_tag(user, tag):
     Calls :meth:`pids_by_tag` to find the pids of bookmarked objects
     for the specified user and tag, and then queries Solr to get
     display information for those objects.
+
+    Returns a Solr query that can be paginated; if there are more
+    bookmarked pids than can be looked up in a single Solr request,
+    they are looked up in chunks (see :meth:`~openemory.util.solr_fetch_pids`)
+    and a list of results in the same order is returned instead, which
+    :meth:`~openemory.util.paginate` pages with a django
+    :class:`~django.core.paginator.Paginator`.
     '''
     solr = solr_interface()
-    pidfilter = None
     # find any objects with pids bookmarked by the user
-    # - generates a filter that looks like Q(pid=pid1) | Q(pid=pid2) | Q(pid=pid3)
-    tagged_pids = pids_by_tag(user, tag)
+    tagged_pids = list(pids_by_tag(user, tag))
     # if no pids are found, just return an empty list
     if not tagged_pids:
         return []
-    for pid in tagged_pids:
-        if pidfilter is None:
-            pidfilter = solr.Q(pid=pid)
-        else:
-            pidfilter |= solr.Q(pid=pid)
-    solrquery = solr.query(pidfilter) \
+    if len(tagged_pids) > PID_CHUNK_SIZE:
+        # too many pids for a single filter; look up in chunks and sort here
+        articles = solr_fetch_pids(solr, tagged_pids,
+                                   solr.query().field_limit(ARTICLE_VIEW_FIELDS))
+        return sorted(articles, key=lambda a: a.get('last_modified'), reverse=True)
+
+    solrquery = solr.query().filter(solr_pid_filter(solr, tagged_pids)) \
                         .field_limit(ARTICLE_VIEW_FIELDS) \
                         .sort_by('-last_modified')	# best option ?
 
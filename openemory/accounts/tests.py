@@ -53,7 +53,8 @@ from openemory.accounts.views import _get_profile_user
 from openemory.publication.models import Article
 from openemory.publication.views import ARTICLE_VIEW_FIELDS
 from openemory.rdfns import DC, FRBR, FOAF
-from openemory.util import solr_interface
+from openemory.util import solr_interface, solr_pool, invalidate_statistics, \
+     PID_CHUNK_SIZE
 
 # re-use pdf fixture from publication app
 pdf_filename = os.path.join(settings.BASE_DIR, 'publication', 'fixtures', 'test.pdf')
@@ -679,6 +680,9 @@ class AccountViewsTest(TestCase):
     @patch('openemory.util.sunburnt.SolrInterface', mocksolr)
     @patch('openemory.accounts.views.EmoryLDAPBackend')
     def test_profile_rdf(self, mockldap):
+        # pooled clients were created before SolrInterface was patched
+        solr_pool.discard()
+        self.addCleanup(solr_pool.discard)
         # mock solr result
         result =  [
             {'title': 'article one', 'created': 'today',
@@ -1901,11 +1905,14 @@ class AccountViewsTest(TestCase):
         '''
         settings.TEMPLATE_CONTEXT_PROCESSORS.append('openemory.accounts.context_processors.statistics')
         context._standard_context_processors = None
+        # don't use statistics cached by the live site or other tests
+        invalidate_statistics()
         try:
             yield
         finally:
             settings.TEMPLATE_CONTEXT_PROCESSORS.remove('openemory.accounts.context_processors.statistics')
             context._standard_context_processors = None
+            invalidate_statistics()
 
 
     FEEDBACK_POST_DATA = {
@@ -2246,6 +2253,22 @@ class ArticlesByTagTest(TestCase):
         t = Tag(name='not tagged')
         self.assertEqual([], articles_by_tag(self.user, t))
 
+        # many bookmarks are looked up PID_CHUNK_SIZE at a time and
+        # returned as a list, most recently modified first
+        pids = ['test:%d' % i for i in range(PID_CHUNK_SIZE * 2 + 200)]
+        chunks = [[{'pid': pid, 'last_modified': pid} for pid in pids[i:i + PID_CHUNK_SIZE]]
+                  for i in range(0, len(pids), PID_CHUNK_SIZE)]
+        with patch('openemory.accounts.models.pids_by_tag') as mockpids:
+            with patch.object(self.mocksolr.query, 'execute') as mockexecute:
+                mockpids.return_value = pids
+                mockexecute.side_effect = chunks
+                self.mocksolr.query.paginate.reset_mock()
+                articles = articles_by_tag(self.user, self.tag)
+        self.assertEqual(3, mockexecute.call_count)
+        self.assertEqual([{'rows': PID_CHUNK_SIZE}, {'rows': PID_CHUNK_SIZE}, {'rows': 200}],
+                         [kwargs for args, kwargs in self.mocksolr.query.paginate.call_args_list])
+        self.assertEqual(sorted(pids, reverse=True), [a['pid'] for a in articles])
+
 
 class FacultyOrLocalAdminBackendTest(TestCase):
     multi_db = True
@@ -48,7 +48,7 @@ from openemory.accounts.auth import login_required, require_self_or_admin
 from openemory.accounts.forms import ProfileForm, InterestFormSet, FeedbackForm
 from openemory.accounts.models import researchers_by_interest as users_by_interest, \
      Bookmark, articles_by_tag, Degree, EsdPerson, Grant, UserProfile, Announcement, Position
-from openemory.util import paginate, solr_interface
+from openemory.util import paginate, solr_interface, search_cache
 
 logger = logging.getLogger(__name__)
 
@@ -752,10 +752,10 @@ def departments(request):
     grouped by division name.'''
     solr = solr_interface()
     div_dept_field = 'division_dept_id'
-    r = solr.query(record_type=EsdPerson.record_type) \
-            .facet_by(div_dept_field, limit=-1, sort='index') \
-            .paginate(rows=0) \
-            .execute()
+    r = search_cache.execute(
+            solr.query(record_type=EsdPerson.record_type) \
+                .facet_by(div_dept_field, limit=-1, sort='index') \
+                .paginate(rows=0))
     div_depts = r.facet_counts.facet_fields[div_dept_field]
 
     # division_dept_id field is indexed in Solr as
@@ -778,10 +778,11 @@ def view_department(request, id):
     '''
     # get a list of people by department code
     solr = solr_interface()
-    people = solr.query(department_id=id) \
-                 .filter(record_type=EsdPerson.record_type) \
-                 .sort_by('last_name') \
-                 .paginate(rows=150).execute()
+    people = search_cache.execute(
+                 solr.query(department_id=id) \
+                     .filter(record_type=EsdPerson.record_type) \
+                     .sort_by('last_name') \
+                     .paginate(rows=150))
 
     if len(people):
         division = people[0]['division_name']
@@ -15,7 +15,7 @@
 #   limitations under the License.
 
 from django.contrib import admin
-from openemory.harvest.models import HarvestRecord
+from openemory.harvest.models import HarvestRecord, HarvestRun
 
 class HarvestRecordAdmin(admin.ModelAdmin):
     date_hierarchy = 'harvested'
@@ -25,3 +25,12 @@ class HarvestRecordAdmin(admin.ModelAdmin):
     search_fields = ['pmcid', 'title']
 
 admin.site.register(HarvestRecord, HarvestRecordAdmin)
+
+class HarvestRunAdmin(admin.ModelAdmin):
+    date_hierarchy = 'started'
+    list_display = ('started', 'mindate', 'maxdate', 'status', 'retstart',
+                    'total', 'harvested', 'updated')
+    list_filter = ('status',)
+    readonly_fields = ('webenv', 'query_key')
+
+admin.site.register(HarvestRun, HarvestRunAdmin)
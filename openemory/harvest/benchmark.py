@@ -0,0 +1,391 @@
+# file openemory/harvest/benchmark.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Benchmark harness for harvesting articles from PubMed Central,
+without querying NCBI.
+
+:class:`EUtilsReplayServer` is a local stand-in for the E-utilities
+web service that replays the recorded ESearch and EFetch fixture
+responses, at any volume: EFetch requests are answered by repeating the
+recorded articles with unique PubMed Central ids.
+:class:`HarvestBenchmark` runs the ``fetch_pmc_metadata`` command end to
+end against the stand-in server, and reports articles processed per
+second, time spent in each stage of the harvest (see
+:class:`~openemory.harvest.pipeline.StageMetrics`), and peak memory use.
+
+Use the ``benchmark_harvest`` management command to run benchmarks.
+'''
+
+import BaseHTTPServer
+from collections import defaultdict
+from contextlib import contextmanager
+from cStringIO import StringIO
+import gzip
+import logging
+import os
+import resource
+import shutil
+import SocketServer
+import tempfile
+import threading
+import time
+import urlparse
+
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from lxml import etree
+
+from openemory.harvest.entrez import EntrezClient
+from openemory.harvest.management.commands.fetch_pmc_metadata import \
+     Command as FetchCommand
+from openemory.harvest.models import HarvestRecord, HarvestRun
+from openemory.publication import models as publication_models
+
+logger = logging.getLogger(__name__)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+ESEARCH_FIXTURE = os.path.join(FIXTURE_DIR, 'esearch-response-withhist.xml')
+'recorded ESearch response replayed by :class:`EUtilsReplayServer`'
+EFETCH_FIXTURE = os.path.join(FIXTURE_DIR, 'efetch-retrieval-from-hist.xml')
+'recorded EFetch response whose articles are replayed by :class:`EUtilsReplayServer`'
+
+BENCHMARK_PMCID_BASE = 900000000
+'''first PubMed Central id used for replayed articles; well above real
+ids, so benchmark records can be identified and removed'''
+
+BENCHMARK_USERNAME = 'harvest-benchmark'
+'username of the stand-in author for replayed articles'
+
+
+class _ReplayHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # HTTP/1.1 so that client connections are kept alive, as with NCBI
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        params = dict((key, val[0]) for key, val
+                      in urlparse.parse_qs(query).iteritems())
+        body = self.server.replay.response(path.rsplit('/', 1)[-1], params)
+        if body is None:
+            self.send_error(404)
+            return
+
+        gzipped = self.server.replay.compress and \
+                  'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            buf = StringIO()
+            gz = gzip.GzipFile(fileobj=buf, mode='wb')
+            gz.write(body)
+            gz.close()
+            body = buf.getvalue()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.replay.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        logger.debug('EUtils replay server: ' + format % args)
+
+
+class _ReplayHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class EUtilsReplayServer(object):
+    '''Local HTTP server standing in for NCBI E-utilities.  ESearch
+    requests get the recorded search response, with the number of
+    results set to **total**; EFetch requests get the requested range
+    of articles (**retstart** and **retmax**), made by repeating the
+    recorded articles with PubMed Central ids starting at
+    **pmcid_base**.  Use as a context manager, or call :meth:`start`
+    and :meth:`stop`.
+
+    :param total: number of articles found by searches
+    :param latency: seconds to wait before answering each request, to
+        simulate network and server time
+    :param compress: gzip responses for clients that accept it, as NCBI
+        does; compressing large responses in the benchmark process
+        takes time away from the harvest being measured, so this is
+        off by default
+    '''
+
+    def __init__(self, total, latency=0, compress=False,
+                 pmcid_base=BENCHMARK_PMCID_BASE,
+                 esearch_fixture=ESEARCH_FIXTURE, efetch_fixture=EFETCH_FIXTURE):
+        self.total = total
+        self.latency = latency
+        self.compress = compress
+        self.pmcid_base = pmcid_base
+        self.requests = defaultdict(int)
+        self.bytes_sent = 0
+        self.server = None
+        self._thread = None
+
+        esearch = etree.parse(esearch_fixture).getroot()
+        esearch.find('Count').text = str(total)
+        self.esearch_response = etree.tostring(esearch, xml_declaration=True,
+                                               encoding='UTF-8')
+        self.article_templates = self._article_templates(efetch_fixture)
+
+    @staticmethod
+    def _article_templates(fixture):
+        # serialized articles from the fixture, with a marker in place of
+        # the PubMed Central id
+        templates = []
+        for article in etree.parse(fixture).getroot().iterchildren('article'):
+            pmcid = article.find('front/article-meta/article-id[@pub-id-type="pmc"]')
+            if pmcid is None:
+                continue
+            pmcid.text = '__PMCID__'
+            # default ascii serialization, with no xml declaration
+            templates.append(etree.tostring(article, with_tail=False))
+        return templates
+
+    @property
+    def query_root(self):
+        'URL root for E-utilities queries to this server'
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d/entrez/eutils/' % (host, port)
+
+    def response(self, utility, params):
+        '''Response body for a request to one of the E-utilities (e.g.,
+        ``efetch.fcgi``), or None if the utility is not supported.'''
+        self.requests[utility] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if utility == 'esearch.fcgi':
+            return self.esearch_response
+        if utility == 'efetch.fcgi':
+            start = int(params.get('retstart', 0))
+            stop = min(start + int(params.get('retmax', 20)), self.total)
+            return self.efetch_response(start, stop)
+
+    def efetch_response(self, start, stop):
+        '''EFetch response body for the articles from offset **start**
+        (inclusive) to **stop** (exclusive) in the search results.'''
+        count = len(self.article_templates)
+        articles = [self.article_templates[i % count].replace('__PMCID__',
+                                                              str(self.pmcid_base + i))
+                    for i in xrange(start, stop)]
+        return '<?xml version="1.0" encoding="UTF-8"?>\n<pmc-articleset>' + \
+               ''.join(articles) + '</pmc-articleset>'
+
+    def start(self):
+        '''Start serving requests on a free local port, in a background
+        thread.'''
+        self.server = _ReplayHTTPServer(('127.0.0.1', 0), _ReplayHandler)
+        self.server.replay = self
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        name='eutils-replay')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''Stop the server and close its socket.'''
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self._thread.join()
+            self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class MemorySampler(object):
+    '''Background thread that samples the resident memory of the current
+    process, to find the peak during part of a run.  Sampling requires
+    ``/proc`` (i.e., Linux); elsewhere the peak for the whole process so
+    far is reported.'''
+
+    STATUS = '/proc/self/status'
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def current(cls):
+        '''Current resident memory in KB, or None if not available.'''
+        try:
+            with open(cls.STATUS) as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1])
+        except (IOError, ValueError):
+            pass
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, self.current() or 0)
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        if self.current() is not None:
+            self._thread = threading.Thread(target=self._sample,
+                                            name='memory-sampler')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        else:
+            # ru_maxrss is reported in KB on Linux, bytes on Mac OS X
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _LDAPStandIn(object):
+    # stand-in for EmoryLDAPBackend, identifying every email address
+    # looked up as the same user; used in place of the backend class
+
+    def __init__(self, user, delay=0):
+        self.user = user
+        self.delay = delay
+
+    def __call__(self):
+        return self
+
+    def find_user_by_email(self, email, derive=False):
+        if self.delay:
+            time.sleep(self.delay)
+        return 'uid=%s' % self.user.username, self.user
+
+
+@contextmanager
+def _patched(obj, name, value):
+    # temporarily replace an attribute
+    original = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, original)
+
+
+class HarvestBenchmark(object):
+    '''Run the ``fetch_pmc_metadata`` command against an
+    :class:`EUtilsReplayServer` and measure it.
+
+    Replayed articles are saved as real
+    :class:`~openemory.harvest.models.HarvestRecord` objects (with
+    content in a temporary directory), so the database stages are
+    included in the measurements; the records, harvest run, and
+    stand-in author created by a benchmark are removed afterwards.
+    Any other records and harvest runs are left alone.
+    LDAP look-ups of authors are answered by a stand-in that identifies
+    every Emory email address as the benchmark author.
+
+    :param articles: number of articles to harvest
+    :param count: ``fetch_pmc_metadata`` chunk size (``--count``)
+    :param fetch_count: articles per EFetch request (``--fetch-count``)
+    :param threads: worker threads (``--threads``)
+    :param latency: seconds the stand-in server takes for each request
+    :param query_delay: minimum seconds between E-utilities requests;
+        by default, requests are not rate-limited
+    :param lookup_delay: seconds each stand-in LDAP look-up takes
+    :param compress: gzip server responses
+    '''
+
+    def __init__(self, articles, count=20, fetch_count=None, threads=4,
+                 latency=0, query_delay=0, lookup_delay=0, compress=False):
+        self.articles = articles
+        self.count = count
+        self.fetch_count = fetch_count
+        self.threads = threads
+        self.latency = latency
+        # token bucket rate limiter needs a non-zero delay
+        self.query_delay = query_delay or 0.0001
+        self.lookup_delay = lookup_delay
+        self.compress = compress
+
+    def run(self):
+        '''Run the benchmark.
+
+        :returns: dictionary of results: harvest counts, elapsed seconds,
+            ``articles_per_sec``, ``stages`` (count and elapsed seconds for
+            each stage), ``peak_memory_kb``, and ``requests`` (number of
+            requests made to each E-utility)
+        '''
+        # records saved by this benchmark are the ones for replayed
+        # articles added after the current last record
+        last_record = HarvestRecord.objects.order_by('-id').values_list('id', flat=True)[:1]
+        last_record = last_record[0] if last_record else 0
+        author, created_author = User.objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={'first_name': 'Harvest',
+                                                   'last_name': 'Benchmark'})
+        content_dir = tempfile.mkdtemp(prefix='openemory-harvest-benchmark-')
+        content_field = HarvestRecord._meta.get_field('content')
+
+        options = dict((opt.dest, opt.default) for opt in FetchCommand.option_list)
+        options.update({'verbosity': 0, 'count': self.count,
+                        'fetch_count': self.fetch_count, 'threads': self.threads,
+                        'resume': False})
+        cmd = FetchCommand()
+        cmd.stdout = StringIO()
+
+        server = EUtilsReplayServer(self.articles, latency=self.latency,
+                                    compress=self.compress)
+        try:
+            # patches are applied after the server has started
+            with server, \
+                 _patched(EntrezClient, 'ESEARCH', server.query_root + 'esearch.fcgi?'), \
+                 _patched(EntrezClient, 'EFETCH', server.query_root + 'efetch.fcgi?'), \
+                 _patched(EntrezClient, 'EUTILS_QUERY_DELAY_SECONDS', self.query_delay), \
+                 _patched(publication_models, 'EmoryLDAPBackend',
+                          _LDAPStandIn(author, self.lookup_delay)), \
+                 _patched(content_field, 'storage', FileSystemStorage(location=content_dir)):
+                with MemorySampler() as memory:
+                    start = time.time()
+                    cmd.handle(**options)
+                    elapsed = time.time() - start
+        finally:
+            HarvestRecord.objects.filter(id__gt=last_record,
+                                         pmcid__gte=BENCHMARK_PMCID_BASE,
+                                         pmcid__lt=BENCHMARK_PMCID_BASE + self.articles) \
+                                 .delete()
+            run = getattr(cmd, 'run', None)
+            if run is not None and run.pk is not None:
+                run.delete()
+            if created_author:
+                author.delete()
+            shutil.rmtree(content_dir, ignore_errors=True)
+
+        results = dict((name, cmd.stats[name]) for name in HarvestRun.COUNTS)
+        results.update({
+            'elapsed': elapsed,
+            'articles_per_sec': cmd.stats['articles'] / max(elapsed, 0.001),
+            'stages': dict((stage, {'count': cmd.metrics.counts[stage],
+                                    'elapsed': cmd.metrics.elapsed[stage]})
+                           for stage in cmd.metrics.counts),
+            'peak_memory_kb': memory.peak,
+            'requests': dict(server.requests),
+            'bytes': server.bytes_sent,
+        })
+        return results
@@ -16,13 +16,19 @@
 
 '''Tools for querying NCBI Entrez E-utilities, notably including PubMed.'''
 
-from datetime import datetime, timedelta
 import logging
+import shutil
+import tempfile
+import threading
+import time
 from time import sleep
 from urllib import urlencode
 
 from eullocal.django.emory_ldap.backends import EmoryLDAPBackend
 from eulxml import xmlmap
+from lxml import etree
+import requests
+from requests.adapters import HTTPAdapter
 from django.contrib.auth.models import User
 
 from openemory.publication.models import NlmArticle
@@ -34,6 +40,40 @@ from openemory.publication.models import NlmArticle
 
 logger = logging.getLogger(__name__)
 
+
+class TokenBucket(object):
+    '''Thread-safe token bucket rate limiter: allows up to ``capacity``
+    requests at once, refilled at ``rate`` tokens per second.  With the
+    default capacity of 1, consecutive requests are spaced at least
+    ``1/rate`` seconds apart.'''
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Take a token, sleeping first until one is available.
+
+        :returns: number of seconds slept
+        '''
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # if the bucket is overdrawn, wait until the token is replaced;
+            # sleeping while holding the lock keeps waiting threads in line
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+            if delay:
+                logger.debug('EntrezClient sleeping for ' + str(delay))
+                sleep(delay)
+        return delay
+
+
 class EntrezClient(object):
     '''Generic client for making web requests to NCBI Entrez E-utilities in
     accordance with their `guidlines and requirements
@@ -54,9 +94,27 @@ class EntrezClient(object):
     '``email`` query argument added to all eutils queries'
     EUTILS_QUERY_DELAY_SECONDS = 0.34
     'minimum seconds to pause between consecutive eutils requests'
-
-    def __init__(self):
-        self.last_query_time = None
+    EUTILS_TIMEOUT_SECONDS = (10, 120)
+    'connect and read timeouts for eutils requests'
+    EUTILS_MAX_RETRIES = 4
+    'number of times to retry a failed eutils request'
+    EUTILS_RETRY_DELAY_SECONDS = 2
+    '''seconds to wait before the first retry of a failed request; doubled
+    for each subsequent retry'''
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    'HTTP status codes for eutils responses that should be retried'
+
+    def __init__(self, session=None):
+        # token bucket shared by all threads using this client
+        self.rate_limiter = TokenBucket(1 / self.EUTILS_QUERY_DELAY_SECONDS)
+        if session is None:
+            # keep-alive connections are pooled and reused for all
+            # requests made through this client
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.session = session
 
     def esearch(self, **kwargs):
         '''Query ESearch, forwarding all arguments as URL query arguments.
@@ -79,42 +137,117 @@ class EntrezClient(object):
             kwargs['retmode'] = 'xml'
         return self._query(self.EFETCH, kwargs, EFetchResponse)
 
+    def efetch_articles(self, **kwargs):
+        '''Query EFetch as :meth:`efetch`, but iterate over the articles
+        in the response one at a time as they are parsed, rather than
+        loading the whole response as a single document.  The response
+        body is spooled to a temporary file (so the connection is not held
+        open while articles are processed), and each article is removed
+        from the parsed document as it is yielded, so it can be freed as
+        soon as the caller is finished with it.
+
+        :returns: generator of
+            :class:`~openemory.publication.models.NlmArticle`
+        '''
+        if 'retmode' not in kwargs:
+            kwargs = kwargs.copy()
+            kwargs['retmode'] = 'xml'
+        response = self._request(self.EFETCH, kwargs)
+        body = tempfile.TemporaryFile()
+        try:
+            shutil.copyfileobj(response.raw, body)
+        finally:
+            response.close()
+        body.seek(0)
+
+        try:
+            for event, element in etree.iterparse(body, tag='article'):
+                parent = element.getparent()
+                # only top-level articles in the article set
+                if parent is None or parent.getparent() is not None:
+                    continue
+                parent.remove(element)
+                element.tail = None
+                yield NlmArticle(element)
+        finally:
+            body.close()
+
     def _query(self, base_url, qargs, response_xmlclass):
         '''Utility method: Adds required query arguments, returns response
         as a caller-specified :class:`~eulxml.xmlmap.XmlObject`. Delays if
         necessary to enforce EUtils query speed policy.
         '''
+        response = self._request(base_url, qargs)
+        try:
+            # parse the response body as it is read instead of loading
+            # it into memory first
+            return xmlmap.load_xmlobject_from_file(response.raw,
+                    xmlclass=response_xmlclass)
+        finally:
+            response.close()
+
+    def _request(self, base_url, qargs):
+        '''Utility method: Adds required query arguments and makes a
+        request, delaying if necessary to enforce EUtils query speed policy.
+
+        :returns: :class:`requests.Response` with streaming content
+        '''
         self._enforce_query_timing()
         qargs = qargs.copy()
         if 'tool' not in qargs:
             qargs['tool'] = self.EUTILS_TOOL
         if 'email' not in qargs:
             qargs['email'] = self.EUTILS_EMAIL
-        # TODO: When we start making more than one query we need to sleep to
-        # avoid making more than 3 requests per second per E-Utilities
-        # policies.
         qurl = base_url + urlencode(qargs)
         logger.debug('EntrezClient querying: ' + qurl)
-        return xmlmap.load_xmlobject_from_file(qurl,
-                xmlclass=response_xmlclass)
+        return self._get(qurl)
+
+    def _get(self, qurl):
+        '''Utility method: make a streaming GET request, retrying on
+        connection errors, timeouts, and HTTP status codes that indicate
+        the request should be tried again later (see
+        :data:`RETRY_STATUS_CODES`), with exponential backoff.  Retries
+        honor any **Retry-After** header and the EUtils query speed
+        policy.
+
+        :returns: :class:`requests.Response` with successful status
+        '''
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                response = self.session.get(qurl, stream=True,
+                                            timeout=self.EUTILS_TIMEOUT_SECONDS)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if attempt >= self.EUTILS_MAX_RETRIES:
+                    raise
+                error = err
+            else:
+                if response.status_code not in self.RETRY_STATUS_CODES or \
+                        attempt >= self.EUTILS_MAX_RETRIES:
+                    response.raise_for_status()
+                    # decompress gzipped content as the raw body is read
+                    response.raw.decode_content = True
+                    return response
+                error = '%s %s' % (response.status_code, response.reason)
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+
+            delay = self.EUTILS_RETRY_DELAY_SECONDS * 2 ** attempt
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            logger.warn('EntrezClient request failed (%s); retrying in %s sec' \
+                        % (error, delay))
+            sleep(delay)
+            attempt += 1
+            self._enforce_query_timing()
 
     def _enforce_query_timing(self):
         '''Enforce EUtils query speed policy by sleeping to keep queries
-        separated by at least :data:`EUTILS_QUERY_DELAY_SECONDS`.
+        separated by at least :data:`EUTILS_QUERY_DELAY_SECONDS`, across
+        all threads using this client.
         '''
-        now = datetime.now()
-        if self.last_query_time is not None:
-            next_query_allowed = self.last_query_time + timedelta(seconds=self.EUTILS_QUERY_DELAY_SECONDS)
-            logger.debug('EntrezClient timing next=%s; now=%s' % \
-                    (str(next_query_allowed), str(now)))
-            if now < next_query_allowed:
-                delay = next_query_allowed - now
-                # don't calculate anything larger than seconds: this assumes
-                # that EUTILS_QUERY_DELAY_SECONDS < 1day
-                delay_seconds = delay.seconds + delay.microseconds / 1000000.0
-                logger.debug('EntrezClient sleeping for ' + str(delay_seconds))
-                sleep(delay_seconds)
-        self.last_query_time = now
+        self.rate_limiter.acquire()
 
 
 class ArticleQuerySet(object):
@@ -191,17 +324,29 @@ class ArticleQuerySet(object):
         else:
             raise TypeError('index must be a number or a slice')
 
-    def _execute(self):
+    def _fetch_opts(self):
         query_opts = self.query_opts.copy()
         query_opts['retstart'] = self.start
         query_opts['retmax'] = len(self)
-        return self.entrez.efetch(**query_opts)
+        return query_opts
+
+    def _execute(self):
+        return self.entrez.efetch(**self._fetch_opts())
 
     def __iter__(self):
         if self._chunk is None:
             self._chunk = self._execute()
         return iter(self._chunk.articles)
 
+    def iterator(self):
+        '''Iterate over the articles in this query set as they are parsed
+        from the EFetch response (see
+        :meth:`EntrezClient.efetch_articles`), without caching them, so
+        that each article can be freed after it is processed.'''
+        if self._chunk is not None:
+            return iter(self._chunk.articles)
+        return self.entrez.efetch_articles(**self._fetch_opts())
+
     @property
     def count(self):
         return self.results.count
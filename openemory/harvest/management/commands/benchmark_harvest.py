@@ -0,0 +1,169 @@
+# file openemory/harvest/management/commands/benchmark_harvest.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import logging
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from openemory.harvest.benchmark import HarvestBenchmark
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    '''Benchmark harvesting with ``fetch_pmc_metadata``, replaying
+    recorded PubMed Central responses from a local stand-in for NCBI
+    E-utilities instead of querying NCBI.  Reports articles processed
+    per second, time spent in each stage of the harvest, and peak memory
+    use, for each of the requested numbers of articles.
+
+    Results can be saved as JSON and used as a baseline for later runs;
+    the command fails if throughput drops by more than the tolerance
+    compared to the baseline.
+
+    Since the benchmark saves and removes harvest records and a harvest
+    run in the site database, it only runs with **DEBUG** enabled unless
+    ``--force`` is specified.
+    '''
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('--articles', '-a',
+                    default='200',
+                    help='Comma-separated numbers of articles to harvest, ' +
+                    'one benchmark run each (default: %default)'),
+        make_option('--count', '-c',
+                    type='int',
+                    default=20,
+                    help='Number of articles in a chunk to process at a time (default: %default)'),
+        make_option('--fetch-count', '-f',
+                    type='int',
+                    default=None,
+                    help='Number of articles to fetch per request (default: same as count)'),
+        make_option('--threads', '-t',
+                    type='int',
+                    default=4,
+                    help='Number of threads for identifying authors (default: %default)'),
+        make_option('--latency',
+                    type='float',
+                    default=0,
+                    help='Seconds the stand-in server takes to answer each request (default: %default)'),
+        make_option('--query-delay',
+                    type='float',
+                    default=0,
+                    help='''Minimum seconds between requests, as required by NCBI
+                            (default: %default, not rate-limited)'''),
+        make_option('--lookup-delay',
+                    type='float',
+                    default=0,
+                    help='Seconds each simulated LDAP author look-up takes (default: %default)'),
+        make_option('--gzip',
+                    action='store_true',
+                    default=False,
+                    help='Compress responses from the stand-in server'),
+        make_option('--save',
+                    default=None,
+                    help='Save results as JSON to the specified file'),
+        make_option('--baseline',
+                    default=None,
+                    help='Compare with results previously saved with --save'),
+        make_option('--tolerance',
+                    type='float',
+                    default=20,
+                    help='''Percent drop in articles per second compared to the
+                            baseline allowed before failing (default: %default)'''),
+        make_option('--force',
+                    action='store_true',
+                    default=False,
+                    help='Run even if DEBUG is not enabled (e.g., against a production database)'),
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])    # 1 = normal, 0 = minimal, 2 = all
+        if not (settings.DEBUG or options['force']):
+            raise CommandError('Benchmark saves harvest records in the site database; ' +
+                               'enable DEBUG or use --force to run it anyway')
+        try:
+            volumes = [int(n) for n in options['articles'].split(',')]
+        except ValueError:
+            raise CommandError('Number of articles must be a comma-separated list of numbers')
+        if any(n < 1 for n in volumes):
+            raise CommandError('Number of articles must be at least 1')
+        if options['threads'] < 0:
+            raise CommandError('threads must not be negative')
+
+        baseline = {}
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (IOError, ValueError) as err:
+                raise CommandError('Error loading baseline %s: %s' % (options['baseline'], err))
+
+        results = {}
+        for volume in volumes:
+            self.output(1, 'Harvesting %d articles' % volume)
+            benchmark = HarvestBenchmark(volume, count=options['count'],
+                                         fetch_count=options['fetch_count'],
+                                         threads=options['threads'],
+                                         latency=options['latency'],
+                                         query_delay=options['query_delay'],
+                                         lookup_delay=options['lookup_delay'],
+                                         compress=options['gzip'])
+            results[str(volume)] = result = benchmark.run()
+            self.report(volume, result)
+
+        if options['save']:
+            with open(options['save'], 'w') as save_file:
+                json.dump(results, save_file, indent=2, sort_keys=True)
+            self.output(1, 'Saved results to %s' % options['save'])
+
+        # compare throughput with the baseline for the same volumes
+        regressions = []
+        for volume, result in sorted(results.iteritems()):
+            if volume not in baseline:
+                continue
+            expected = baseline[volume]['articles_per_sec']
+            change = 100.0 * (result['articles_per_sec'] - expected) / max(expected, 0.001)
+            self.stdout.write('%s articles: %.1f articles/sec, %+.1f%% compared to baseline %.1f\n' % \
+                              (volume, result['articles_per_sec'], change, expected))
+            if change < -options['tolerance']:
+                regressions.append(volume)
+        if regressions:
+            raise CommandError('Harvest throughput dropped by more than %s%% for %s articles' % \
+                               (options['tolerance'], ', '.join(regressions)))
+
+    def report(self, volume, result):
+        '''Summarize the results of one benchmark run.'''
+        self.stdout.write('%d articles: %d harvested, %d without identifiable authors, %d errors\n' % \
+                          (volume, result['harvested'], result['noauthor'], result['errors']))
+        self.stdout.write('Elapsed: %.2f sec (%.1f articles/sec)\n' % \
+                          (result['elapsed'], result['articles_per_sec']))
+        self.stdout.write('Peak memory: %.1f MB\n' % (result['peak_memory_kb'] / 1024.0))
+        for stage, stats in sorted(result['stages'].iteritems()):
+            self.stdout.write('  %s: %d in %.2f sec (%.2f ms avg)\n' % \
+                              (stage, stats['count'], stats['elapsed'],
+                               1000 * stats['elapsed'] / max(stats['count'], 1)))
+        self.output(2, '  requests: %s; %d bytes' % \
+                    (', '.join('%s %d' % r for r in sorted(result['requests'].iteritems())),
+                     result['bytes']))
+
+    def output(self, v, msg):
+        '''simple function to handle logging output based on verbosity'''
+        if self.verbosity >= v:
+            self.stdout.write("%s\n" % msg)
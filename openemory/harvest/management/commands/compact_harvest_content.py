@@ -0,0 +1,144 @@
+# file openemory/harvest/management/commands/compact_harvest_content.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from openemory.harvest.models import HarvestRecord
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    '''Reclaim disk space used by harvested article xml: removes content
+    files for records that have already been ingested or ignored,
+    compresses and deduplicates content files saved before harvested
+    content was stored compressed, and deletes content files that are no
+    longer referenced by any harvest record.  Recently modified files are
+    not removed, since a harvest saves content files before the records
+    that reference them.
+    '''
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('--noact', '-n',
+                    action='store_true',
+                    default=False,
+                    help='Report what would be done, but do not change or delete anything'),
+        make_option('--min-age',
+                    type='float',
+                    default=24,
+                    help='Only remove unreferenced files last modified at least this ' +
+                    'many hours ago (default: %default)'),
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])    # 1 = normal, 0 = minimal, 2 = all
+        self.noact = options['noact']
+        self.min_age = options['min_age']
+
+        #counters
+        self.counts = defaultdict(int)
+
+        self.purge_processed()
+        self.compress_legacy()
+        self.remove_orphans()
+
+        # summarize what was done
+        self.stdout.write("Content removed from ingested/ignored records: %s\n" % \
+                          self.counts['purged'])
+        self.stdout.write("Content files compressed: %s\n" % self.counts['compressed'])
+        self.stdout.write("Orphaned files removed: %s\n" % self.counts['orphans'])
+        if self.counts['recent']:
+            self.stdout.write("Recent unreferenced files skipped: %s\n" % self.counts['recent'])
+        if self.counts['errors']:
+            self.stdout.write("Errors: %s\n" % self.counts['errors'])
+
+    def purge_processed(self):
+        # records that were ingested or ignored but still have content
+        records = HarvestRecord.objects.filter(status__in=['ingested', 'ignored']) \
+                                       .exclude(content='')
+        names = list(records.values_list('content', flat=True))
+        self.counts['purged'] = len(names)
+        for name in names:
+            self.output(2, 'Removing content %s' % name)
+        if not self.noact and names:
+            records.update(content='')
+            HarvestRecord.release_content(names)
+
+    def compress_legacy(self):
+        # records with uncompressed content, saved before content was
+        # stored compressed and named by checksum
+        records = HarvestRecord.objects.exclude(content='') \
+                                       .exclude(content__endswith='.gz')
+        for record in records:
+            name = record.content.name
+            self.output(2, 'Compressing %s for PMC%d' % (name, record.pmcid))
+            if self.noact:
+                self.counts['compressed'] += 1
+                continue
+            try:
+                xml = record.content.read()
+                record.content.close()
+            except Exception as e:
+                self.output(1, 'Error reading %s for PMC%d: %s' % (name, record.pmcid, e))
+                self.counts['errors'] += 1
+                continue
+            compressed = HarvestRecord.store_content(xml)
+            HarvestRecord.objects.filter(id=record.id).update(content=compressed)
+            HarvestRecord.release_content([name])
+            self.counts['compressed'] += 1
+
+    def remove_orphans(self):
+        # content files not referenced by any record, e.g. left behind by
+        # an interrupted harvest; files are listed before checking which
+        # are referenced, and recent files are skipped, so content saved by
+        # a harvest in progress is not removed before its record is saved
+        storage = HarvestRecord._meta.get_field('content').storage
+        cutoff = datetime.now() - timedelta(hours=self.min_age)
+        names = list(self._storage_files(storage, 'harvest'))
+        in_use = set(HarvestRecord.objects.exclude(content='') \
+                                          .values_list('content', flat=True))
+        for name in names:
+            if name in in_use:
+                continue
+            if storage.modified_time(name) > cutoff:
+                self.output(2, 'Skipping recently modified file %s' % name)
+                self.counts['recent'] += 1
+                continue
+            self.output(2, 'Removing orphaned file %s' % name)
+            if not self.noact:
+                storage.delete(name)
+            self.counts['orphans'] += 1
+
+    def _storage_files(self, storage, path):
+        # generator: names of all files in a storage directory, recursively
+        if not storage.exists(path):
+            return
+        dirs, files = storage.listdir(path)
+        for name in files:
+            yield '%s/%s' % (path, name)
+        for dir in dirs:
+            for name in self._storage_files(storage, '%s/%s' % (path, dir)):
+                yield name
+
+    def output(self, v, msg):
+        '''simple function to handle logging output based on verbosity'''
+        if self.verbosity >= v:
+            self.stdout.write("%s\n" % msg)
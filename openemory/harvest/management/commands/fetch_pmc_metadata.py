@@ -18,14 +18,18 @@ from collections import defaultdict
 import logging
 from optparse import make_option
 import os
+import time
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.db.models import Max
 from django.core.paginator import Paginator
 from eulxml import xmlmap
 
 from openemory.harvest.entrez import EFetchResponse
-from openemory.harvest.models import OpenEmoryEntrezClient, HarvestRecord
+from openemory.harvest.models import OpenEmoryEntrezClient, HarvestRecord, \
+     HarvestRun
+from openemory.harvest.pipeline import HarvestPipeline, StageMetrics
 from datetime import datetime, timedelta
 from openemory.harvest.entrez import ArticleQuerySet
 from progressbar import ETA, Percentage, ProgressBar, Bar
@@ -38,6 +42,14 @@ class Command(BaseCommand):
 
     This command connects to PubMed Central via its public web interface and
     finds articles that include Emory in their "Affiliation" metadata.
+    Chunks of articles are fetched (at the rate allowed by E-Utilities) while
+    authors for previously fetched articles are identified in worker threads.
+
+    Progress is saved as a :class:`~openemory.harvest.models.HarvestRun`
+    after each chunk; an interrupted harvest for the same dates resumes
+    after the last completed chunk.  With ``--auto-date``, an interrupted
+    run is resumed, or else the next run searches the dates since the last
+    completed run.
     '''
     help = __doc__
 
@@ -51,6 +63,12 @@ class Command(BaseCommand):
                     type='int',
                     default=20,
                     help='Number of Articles in a chunk to process at a time.'),
+        make_option('--fetch-count', '-f',
+                    type='int',
+                    default=None,
+                    help='''Number of Articles to fetch per request (default: same as count).
+                            Fetched articles are streamed and processed count at a time,
+                            so this can be larger than count without using more memory.'''),
         make_option('--max-articles', '-m',
                     default=None,
                     help='Number of articles to harvest. If not specified, all available are harvested.'),
@@ -65,7 +83,18 @@ class Command(BaseCommand):
         make_option('--auto-date',
                     action='store_true',
                     default=False,
-                    help='Calculate min and max dates based on most recently harvested records'),
+                    help='''Calculate min and max dates based on the last completed harvest
+                            (or most recently harvested records)'''),
+        make_option('--no-resume',
+                    action='store_false',
+                    dest='resume',
+                    default=True,
+                    help='Start a new harvest even if an interrupted harvest could be resumed'),
+        make_option('--threads', '-t',
+                    type='int',
+                    default=4,
+                    help='''Number of threads for identifying authors while articles are
+                            fetched (default: %default); 0 to identify authors in the main thread'''),
         make_option('--progress',
                     action='store_true',
                     default=False,
@@ -77,6 +106,8 @@ class Command(BaseCommand):
     
     def handle(self, *args, **options):
         self.verbosity = int(options['verbosity'])    # 1 = normal, 0 = minimal, 2 = all
+        if options['threads'] < 0:
+            raise CommandError('threads must not be negative')
         # number of articles we want to harvest in this run
         self.max_articles = int(options['max_articles']) if options['max_articles'] else None
 
@@ -85,61 +116,103 @@ class Command(BaseCommand):
         self.auto_date = options['auto_date']
         self.v_normal = 1
 
-        stats = defaultdict(int)
-        done= False
-        chunks = self.article_chunks(**options)
+        self.stats = stats = defaultdict(int)
+        self.run = None
+        if self.auto_date and options['resume'] and not options['simulate']:
+            # an interrupted run takes priority over searching new dates
+            self.run = HarvestRun.last_incomplete(mindate__isnull=False)
+        if self.run is not None:
+            self.date_opts = self.run.date_opts
+        else:
+            self.date_opts = self._date_opts(self.min_date, self.max_date, self.auto_date)
+            if self.date_opts and self.date_opts['mindate'] > self.date_opts['maxdate']:
+                self.stdout.write('No new dates to harvest (next harvest starts %s)\n' \
+                                  % self.date_opts['mindate'])
+                return
+            if options['resume'] and not options['simulate']:
+                window = HarvestRun.init_from_date_opts(self.date_opts)
+                self.run = HarvestRun.last_incomplete(mindate=window.mindate,
+                                                      maxdate=window.maxdate)
+
+        # don't record simulated runs
+        if self.run is None and not options['simulate']:
+            self.run = HarvestRun.init_from_date_opts(self.date_opts)
+            self.run.save()
+        elif self.run is not None:
+            self.stdout.write('Resuming harvest started %s at article %d of %d\n' % \
+                              (self.run.started, self.run.retstart, self.run.total))
+            for name in HarvestRun.COUNTS:
+                stats[name] = getattr(self.run, name)
+
+        self.chunk_size = options['fetch_count'] or options['count']
+        chunks = self.article_chunks(self.chunk_size)
+        self.metrics = StageMetrics()
+        pipeline = HarvestPipeline(chunks, threads=options['threads'],
+                                   metrics=self.metrics,
+                                   chunk_done=self.checkpoint,
+                                   batch_size=options['count'])
+        self.pipeline = pipeline
+        finished = True
 
         if options['progress']:
             pbar = ProgressBar(widgets=[Percentage(), ' ', ETA(),  ' ', Bar()], maxval=chunks.count).start()
-        for p in chunks.page_range:
+        self.batch = batch = []
+        for result in pipeline:
+            status, article = result[:2]
+            stats['articles'] += 1
+
             if self.verbosity > self.v_normal:
-                self.stdout.write('Starting article chunk.\n')
-
-            for article in chunks.page(p).object_list:
-                stats['articles'] += 1
-
-                if self.verbosity > self.v_normal:
-                    # python2.6 fails with ascii encoding errors (on unicode
-                    # titles) unless we explicitly encode output to
-                    # sys.stdout.write
-                    msg = u'Processing [%s] "%s"\n' % \
-                          (article.docid, article.article_title)
-                    self.stdout.write(msg.encode(self.stdout.encoding))
-                
-                if HarvestRecord.objects.filter(pmcid=article.docid).exists():
-                    if self.verbosity >= self.v_normal:
-                        self.stdout.write('[%s] has already been harvested; skipping\n' \
-                                          % (article.docid,))
-                    continue
-                    
-                if article.identifiable_authors(derive=True):
-                    try:
-                        # don't save when sinulated
-                        if options['simulate']:
-                            self.stdout.write('Not Saving [%s] (simulated run)\n' % article.docid)
-                        #really save when not simulated
-                        else:
-                            HarvestRecord.init_from_fetched_article(article)
-                        stats['harvested'] += 1
-                        if self.max_articles and stats['harvested'] >= self.max_articles:
-                            done = True
-                            break
-                    except Exception as err:
-                        self.stdout.write('Error creating record from article: %s\n' % err)
-                        stats['errors'] += 1
-                        
+                # python2.6 fails with ascii encoding errors (on unicode
+                # titles) unless we explicitly encode output to
+                # sys.stdout.write
+                msg = u'Processing [%s] "%s"\n' % \
+                      (article.docid, article.article_title)
+                self.stdout.write(msg.encode(self.stdout.encoding))
+
+            if status == 'duplicate':
+                if self.verbosity >= self.v_normal:
+                    self.stdout.write('[%s] has already been harvested; skipping\n' \
+                                      % (article.docid,))
+                continue
+
+            if status == 'authors':
+                # don't save when sinulated
+                if options['simulate']:
+                    self.stdout.write('Not Saving [%s] (simulated run)\n' % article.docid)
+                    stats['harvested'] += 1
+                #really save when not simulated, a chunk at a time
                 else:
-                    if self.verbosity >= self.v_normal:
-                        self.stdout.write('[%s] has no identifiable authors; skipping\n' \
-                                          % (article.docid,))
-                    stats['noauthor'] += 1
-
-                if options['progress']:
-                    pbar.update(stats['articles'])
-            if done:
-                if self.verbosity > self.v_normal:
-                    self.stdout.write('Harvested %s articles ... stopping \n' % stats['harvested'])
-                break
+                    batch.append(article)
+                    if len(batch) >= options['count']:
+                        self.save_batch()
+                if self.max_articles and stats['harvested'] + len(batch) >= self.max_articles:
+                    if self.verbosity > self.v_normal:
+                        self.stdout.write('Harvested %s articles ... stopping \n' % \
+                                          (stats['harvested'] + len(batch)))
+                    pipeline.stop()
+                    finished = False
+                    break
+
+            elif status == 'error':
+                self.stdout.write('Error identifying authors for [%s]: %s\n' % \
+                                  (article.docid, result[2]))
+                stats['errors'] += 1
+
+            else:
+                if self.verbosity >= self.v_normal:
+                    self.stdout.write('[%s] has no identifiable authors; skipping\n' \
+                                      % (article.docid,))
+                stats['noauthor'] += 1
+
+            if options['progress']:
+                pbar.update(stats['articles'])
+        self.save_batch()
+        if self.run is not None:
+            if finished:
+                self.run.mark_complete(stats)
+            else:
+                # leave the run in progress so the next harvest continues it
+                self.checkpoint()
         if options['progress']:
             pbar.finish()
 
@@ -150,6 +223,52 @@ class Command(BaseCommand):
         self.stdout.write('Articles harvested: %(harvested)d\n' % stats)
         self.stdout.write('Errors harvesting articles: %(errors)d\n' % stats)
         self.stdout.write('Articles skipped (no identifiable authors): %(noauthor)d\n' % stats)
+        if self.verbosity >= self.v_normal:
+            elapsed = time.time() - self.metrics.start
+            self.stdout.write('Elapsed: %.1f sec (%.1f articles/sec)\n' % \
+                              (elapsed, stats['articles'] / max(elapsed, 0.001)))
+            for line in self.metrics.report():
+                self.stdout.write('  %s\n' % line)
+            self.stdout.write('  author look-ups: %s\n' % pipeline.author_cache.report())
+
+    def save_batch(self):
+        '''Save records for the current batch of articles, if any.'''
+        if self.batch:
+            self.save_records(self.batch)
+            del self.batch[:]
+
+    def checkpoint(self, page=None):
+        '''Save any pending records and record progress through the
+        search results on the current :class:`HarvestRun`, after a chunk
+        of articles has been processed.'''
+        self.save_batch()
+        if self.run is not None:
+            self.run.checkpoint(self.start + self.pipeline.completed_chunks * self.chunk_size,
+                                self.stats)
+
+    def save_records(self, articles):
+        '''Save new :class:`~openemory.harvest.models.HarvestRecord`
+        instances for a batch of articles.  If the batch cannot be saved
+        at once, records are saved one at a time so that a single bad
+        article does not prevent the rest from being harvested.'''
+        try:
+            with self.metrics.time('save', len(articles)):
+                HarvestRecord.init_from_fetched_articles(articles)
+            self.stats['harvested'] += len(articles)
+            return
+        except Exception as err:
+            transaction.rollback_unless_managed()
+            logger.warn('Error saving batch of %d records; saving individually: %s' \
+                        % (len(articles), err))
+
+        for article in articles:
+            try:
+                with self.metrics.time('save'):
+                    HarvestRecord.init_from_fetched_article(article)
+                self.stats['harvested'] += 1
+            except Exception as err:
+                self.stdout.write('Error creating record from article: %s\n' % err)
+                self.stats['errors'] += 1
 
     def article_chunks(self, count, **kwargs):
         '''
@@ -157,8 +276,15 @@ class Command(BaseCommand):
         '''
         entrez = OpenEmoryEntrezClient()
 
-        self.date_opts = self._date_opts(self.min_date, self.max_date, self.auto_date)
         qs = entrez.get_emory_articles(**self.date_opts)
+        self.start = 0
+        if self.run is not None:
+            # a resumed run searches the same dates again; the search
+            # history may have expired, but results are in the same order
+            self.run.set_search(qs.results)
+            if self.run.retstart:
+                self.start = self.run.retstart
+                qs = qs[self.start:]
         return Paginator(qs, count)
 
 
@@ -172,8 +298,13 @@ class Command(BaseCommand):
         date_args = {}
 
         if auto_date:
-            min = datetime.strftime(HarvestRecord.objects.all().aggregate(Max('harvested'))['harvested__max'], '%Y/%m/%d')
-            max = datetime.strftime(datetime.now()+ timedelta(1),'%Y/%m/%d')
+            # start the day after the last completed harvest, so runs
+            # don't overlap; end yesterday, so the next run starts with
+            # a day that has not been searched yet
+            min = HarvestRun.next_mindate() or \
+                  HarvestRecord.objects.all().aggregate(Max('harvested'))['harvested__max']
+            min = min.strftime('%Y/%m/%d')
+            max = datetime.strftime(datetime.now() - timedelta(1), '%Y/%m/%d')
             date_args['mindate'] = min
             date_args['maxdate'] = max
 
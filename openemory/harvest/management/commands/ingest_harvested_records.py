@@ -0,0 +1,128 @@
+# file openemory/harvest/management/commands/ingest_harvested_records.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import defaultdict
+import logging
+from optparse import make_option
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from eulfedora.server import Repository
+
+from openemory.harvest.models import HarvestRecord
+from openemory.publication.ingest import ingest_harvested_records
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    '''Ingest harvested records into the repository as new Articles, in
+    batches, using parallel workers.  Takes a list of
+    :class:`~openemory.harvest.models.HarvestRecord` ids, or ``--all`` to
+    ingest every record in the harvest queue.  Records that have already
+    been ingested or ignored are skipped.
+    '''
+    help = __doc__
+
+    args = '[record id record id ...]'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all', '-a',
+                    action='store_true',
+                    default=False,
+                    help='Ingest all records in the harvest queue'),
+        make_option('--username', '-u',
+                    help='Username of the person responsible for the ingest ' +
+                    '(required; recorded in the harvest premis event)'),
+        make_option('--batch-size', '-b',
+                    type='int',
+                    default=50,
+                    help='Number of records to claim and ingest at a time (default: %default)'),
+        make_option('--threads', '-t',
+                    type='int',
+                    default=4,
+                    help='Number of worker threads for ingest (default: %default); ' +
+                    '0 to ingest in the main thread'),
+        make_option('--max', '-m',
+                    type='int',
+                    default=None,
+                    help='Maximum number of records to ingest'),
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])    # 1 = normal, 0 = minimal, 2 = all
+        if not options['username']:
+            raise CommandError('username is required')
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User %s not found' % options['username'])
+        if options['batch_size'] < 1:
+            raise CommandError('batch size must be at least 1')
+        if options['threads'] < 0:
+            raise CommandError('threads must not be negative')
+
+        if options['all']:
+            ids = HarvestRecord.objects.filter(status='harvested') \
+                                       .order_by('harvested', 'id') \
+                                       .values_list('id', flat=True)
+        elif args:
+            try:
+                ids = [int(id) for id in args]
+            except ValueError:
+                raise CommandError('Record ids must be numbers')
+        else:
+            raise CommandError('Specify record ids or --all')
+        ids = list(ids)
+        if options['max']:
+            ids = ids[:options['max']]
+
+        #counters
+        counts = defaultdict(int)
+
+        #connection to repository
+        #uses default user / pass configured in localsettings.py
+        repo = Repository()
+
+        start = time.time()
+        size = options['batch_size']
+        for i in range(0, len(ids), size):
+            batch = ids[i:i + size]
+            ingested, failed = ingest_harvested_records(batch, user,
+                                                        threads=options['threads'],
+                                                        repo=repo)
+            for id, pid in ingested.iteritems():
+                self.output(2, 'Ingested record %d as %s' % (id, pid))
+            for id, error in failed.iteritems():
+                self.output(1, 'Error ingesting record %d: %s' % (id, error))
+            counts['ingested'] += len(ingested)
+            counts['failed'] += len(failed)
+            counts['skipped'] += len(batch) - len(ingested) - len(failed)
+            self.output(1, 'Processed %d of %d records' % (min(i + size, len(ids)), len(ids)))
+
+        # summarize what was done
+        elapsed = time.time() - start
+        self.stdout.write("Records ingested: %s\n" % counts['ingested'])
+        self.stdout.write("Failed: %s\n" % counts['failed'])
+        self.stdout.write("Skipped (not in harvest queue): %s\n" % counts['skipped'])
+        self.output(1, 'Elapsed: %.1f sec (%.2f records/sec)' % \
+                    (elapsed, counts['ingested'] / max(elapsed, 0.001)))
+
+    def output(self, v, msg):
+        '''simple function to handle logging output based on verbosity'''
+        if self.verbosity >= v:
+            self.stdout.write("%s\n" % msg)
@@ -0,0 +1,120 @@
+# file openemory/harvest/migrations/0002_auto__add_harvestrun.py
+# 
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        
+        # Adding model 'HarvestRun'
+        db.create_table('harvest_harvestrun', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('started', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+            ('updated', self.gf('django.db.models.fields.DateTimeField')(auto_now=True, blank=True)),
+            ('status', self.gf('django.db.models.fields.CharField')(default='inprogress', max_length=25)),
+            ('mindate', self.gf('django.db.models.fields.DateField')(null=True, blank=True)),
+            ('maxdate', self.gf('django.db.models.fields.DateField')(null=True, blank=True)),
+            ('webenv', self.gf('django.db.models.fields.CharField')(max_length=255, blank=True)),
+            ('query_key', self.gf('django.db.models.fields.IntegerField')(null=True, blank=True)),
+            ('total', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('retstart', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('articles', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('harvested', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('errors', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('noauthor', self.gf('django.db.models.fields.IntegerField')(default=0)),
+        ))
+        db.send_create_signal('harvest', ['HarvestRun'])
+
+
+    def backwards(self, orm):
+        
+        # Deleting model 'HarvestRun'
+        db.delete_table('harvest_harvestrun')
+
+
+    models = {
+        'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        'auth.permission': {
+            'Meta': {'ordering': "('content_type__app_label', 'content_type__model', 'codename')", 'unique_together': "(('content_type', 'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'harvest.harvestrecord': {
+            'Meta': {'object_name': 'HarvestRecord'},
+            'authors': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.User']", 'symmetrical': 'False'}),
+            'content': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'blank': 'True'}),
+            'fulltext': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'harvested': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'pmcid': ('django.db.models.fields.IntegerField', [], {'unique': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'harvested'", 'max_length': '25'}),
+            'title': ('django.db.models.fields.TextField', [], {})
+        },
+        'harvest.harvestrun': {
+            'Meta': {'object_name': 'HarvestRun'},
+            'articles': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'errors': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'harvested': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'maxdate': ('django.db.models.fields.DateField', [], {'null': 'True', 'blank': 'True'}),
+            'mindate': ('django.db.models.fields.DateField', [], {'null': 'True', 'blank': 'True'}),
+            'noauthor': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'query_key': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'retstart': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'started': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'inprogress'", 'max_length': '25'}),
+            'total': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'updated': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'webenv': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['harvest']
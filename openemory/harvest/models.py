@@ -14,7 +14,13 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+from cStringIO import StringIO
+from datetime import datetime, timedelta
+import gzip
+import hashlib
+
 from django.db import models
+from django.db.models import Max
 from django.core.files.base import ContentFile
 from django.contrib.auth.models import User
 from eulfedora.server import Repository
@@ -30,6 +36,8 @@ class HarvestRecord(models.Model):
     STATUSES = ('harvested', 'inprocess', 'ingested', 'ignored')
     DEFAULT_STATUS = STATUSES[0]
     STATUS_CHOICES = [(val, val) for val in STATUSES]
+    CONTENT_DIR = 'harvest/xml'
+    'storage directory for compressed, deduplicated article xml'
     pmcid = models.IntegerField('PubMed Central ID', unique=True, editable=False)
     authors = models.ManyToManyField(User)
     title = models.TextField('Article Title')
@@ -38,8 +46,9 @@ class HarvestRecord(models.Model):
                               default=DEFAULT_STATUS)
     fulltext = models.BooleanField(editable=False)
     content = models.FileField(upload_to='harvest/%Y/%m/%d', blank=True)
-    # file storage for the full Article XML fetched from PMC
-    # TODO: content file should be removed when record is ingested or ignored
+    # file storage for the full Article XML fetched from PMC; stored
+    # gzip-compressed and named by checksum (see store_content), and
+    # removed when the record is ingested or ignored
     
     class Meta:
         permissions = (
@@ -48,6 +57,8 @@ class HarvestRecord(models.Model):
             ('ingest_harvestrecord', 'Can ingest harvested record to Fedora'),
             ('ignore_harvestrecord', 'Can mark a harvested record as ignored')
         )
+        # queue of records to review is filtered by status and sorted by date
+        index_together = [['status', 'harvested']]
 
     def __unicode__(self):
         return u'%s (PMC%d, %s)' % (self.title, self.pmcid, self.status)
@@ -67,9 +78,7 @@ class HarvestRecord(models.Model):
         '''Mark this record as ingested into the repository.  Updates
         the status and removes the harvestd Article xml file.'''
         self.status = 'ingested'
-        if self.content:
-            self.content.delete()
-        self.save()
+        self._remove_content()
 
     @property
     def ingestable(self):
@@ -84,10 +93,122 @@ class HarvestRecord(models.Model):
         repository0.  Updates the status and removes the harvestd
         Article xml file.'''
         self.status = 'ignored'
-        if self.content:
-            self.content.delete()
+        self._remove_content()
+
+    def _remove_content(self):
+        # save with no content file, then delete the file if no other
+        # record shares it
+        name = self.content.name
+        self.content = ''
         self.save()
+        HarvestRecord.release_content([name])
+
+    @staticmethod
+    def content_name(xml):
+        '''Storage name for compressed article xml, based on the SHA-1
+        checksum of the uncompressed content.'''
+        digest = hashlib.sha1(xml).hexdigest()
+        return '%s/%s/%s.xml.gz' % (HarvestRecord.CONTENT_DIR, digest[:2], digest)
+
+    @staticmethod
+    def store_content(xml):
+        '''Save article xml gzip-compressed in the storage for the
+        :attr:`content` file field.  Files are named by checksum, so
+        identical content is only stored once.
+
+        :param xml: serialized xml, as a string
+        :returns: storage name, to be set as the :attr:`content` name
+        '''
+        if isinstance(xml, unicode):
+            xml = xml.encode('utf-8')
+        name = HarvestRecord.content_name(xml)
+        storage = HarvestRecord._meta.get_field('content').storage
+        if not storage.exists(name):
+            buf = StringIO()
+            # mtime 0 so compressed output depends only on the content
+            gz = gzip.GzipFile(fileobj=buf, mode='wb', mtime=0)
+            gz.write(xml)
+            gz.close()
+            name = storage.save(name, ContentFile(buf.getvalue()))
+        return name
+
+    @staticmethod
+    def release_content(names):
+        '''Delete content files that are no longer referenced by any
+        record.  Should be called after records referencing them have
+        been updated or deleted.
+
+        :param names: list of content storage names
+        :returns: number of files deleted
+        '''
+        names = set(name for name in names if name)
+        if not names:
+            return 0
+        in_use = set(HarvestRecord.objects.filter(content__in=list(names)) \
+                                          .values_list('content', flat=True))
+        storage = HarvestRecord._meta.get_field('content').storage
+        unused = names - in_use
+        for name in unused:
+            storage.delete(name)
+        return len(unused)
+
+    def content_file(self):
+        '''File-like object for reading the (uncompressed) article xml
+        in :attr:`content`; decompresses gzip content transparently, and
+        returns uncompressed content from before compression was
+        introduced as is.  Returns None if there is no content.'''
+        # content file field has a read method only if there is a file
+        if not hasattr(self.content, 'read'):
+            return None
+        if self.content.name.endswith('.gz'):
+            return gzip.GzipFile(fileobj=self.content, mode='rb')
+        return self.content
+
 
+    @staticmethod
+    def claim_for_ingest(ids):
+        '''Mark all of the specified records that can be ingested (see
+        :attr:`ingestable`) as in process, and return them (with authors
+        loaded) for ingest.  Each record is claimed with a conditional
+        update, so a record claimed by another process at the same time
+        is only returned to one of them.
+
+        :param ids: list of :class:`HarvestRecord` ids
+        :returns: list of :class:`HarvestRecord` instances claimed by this
+            process
+        '''
+        candidates = HarvestRecord.objects.filter(id__in=list(ids), status='harvested') \
+                                          .values_list('id', flat=True)
+        claimed = [id for id in list(candidates)
+                   if HarvestRecord.objects.filter(id=id, status='harvested') \
+                                           .update(status='inprocess') == 1]
+        if not claimed:
+            return []
+        return list(HarvestRecord.objects.filter(id__in=claimed) \
+                                         .prefetch_related('authors'))
+
+    @staticmethod
+    def mark_all_ingested(records):
+        '''Mark a list of records as ingested with a single update, as
+        in :meth:`mark_ingested`.'''
+        names = []
+        for record in records:
+            names.append(record.content.name)
+            record.content = ''
+            record.status = 'ingested'
+        HarvestRecord.objects.filter(id__in=[r.id for r in records]) \
+                             .update(status='ingested', content='')
+        HarvestRecord.release_content(names)
+
+    @staticmethod
+    def mark_all_harvested(records):
+        '''Return a list of records that could not be ingested to
+        harvested status, with a single update, so they can be ingested
+        again later.'''
+        for record in records:
+            record.status = record.DEFAULT_STATUS
+        HarvestRecord.objects.filter(id__in=[r.id for r in records]) \
+                             .update(status=HarvestRecord.DEFAULT_STATUS)
 
     @staticmethod
     def init_from_fetched_article(article):
@@ -113,12 +234,63 @@ class HarvestRecord(models.Model):
             record.authors = article.identifiable_authors()
 
         # save article xml as a file associated with this record
-        record.content.save('%d.xml' % article.docid,
-                            ContentFile(article.serialize(pretty=True)))
+        record.content = HarvestRecord.store_content(article.serialize())
         record.save()
         return record
 
 
+    @staticmethod
+    def harvested_pmcids(pmcids):
+        '''Find which of the specified PubMed Central ids have already
+        been harvested, with a single database query.
+
+        :param pmcids: list of PubMed Central ids
+        :returns: set of the ids that already have a :class:`HarvestRecord`
+        '''
+        return set(HarvestRecord.objects.filter(pmcid__in=list(pmcids)) \
+                                        .values_list('pmcid', flat=True))
+
+    @staticmethod
+    def init_from_fetched_articles(articles):
+        '''Create new :class:`HarvestRecord` instances for a batch of
+        :class:`~openemory.publication.models.NlmArticle` objects, as
+        in :meth:`init_from_fetched_article`, but with a single insert
+        for all of the records and one more for all of their authors.
+        Articles should already be checked for existing records (see
+        :meth:`harvested_pmcids`).
+
+        :returns: list of saved :class:`HarvestRecord` instances
+        '''
+        records = []
+        for article in articles:
+            # see init_from_fetched_article about unicode conversion
+            record = HarvestRecord(title=unicode(article.article_title),
+                                   pmcid=article.docid,
+                                   fulltext=article.fulltext_available)
+            # save article xml as a file associated with this record
+            record.content = HarvestRecord.store_content(article.serialize())
+            records.append(record)
+
+        try:
+            HarvestRecord.objects.bulk_create(records)
+        except:
+            # don't leave orphaned content files
+            HarvestRecord.release_content([r.content.name for r in records])
+            raise
+
+        # bulk_create does not set ids; look them up to relate authors
+        ids = dict(HarvestRecord.objects.filter(pmcid__in=[r.pmcid for r in records]) \
+                                        .values_list('pmcid', 'id'))
+        author_links = []
+        for record, article in zip(records, articles):
+            record.id = ids[record.pmcid]
+            user_ids = set(user.id for user in article.identifiable_authors())
+            author_links.extend(HarvestRecord.authors.through(harvestrecord_id=record.id,
+                                                              user_id=user_id)
+                                for user_id in user_ids)
+        HarvestRecord.authors.through.objects.bulk_create(author_links)
+        return records
+
     def as_publication_article(self, repo=None):
         '''Initialize (but do not save) a new
         :class:`~openemory.publication.models.Article` instance and
@@ -146,10 +318,9 @@ class HarvestRecord(models.Model):
                                                'PMC%d' % self.pmcid])
 
         # set the XML article content as the contentMetadata datastream
-        # - record content is a file field with a read method, which should be
-        #   handled correctly by eulfedora for ingest
-        if hasattr(self.content, 'read'):
-            article.contentMetadata.content = load_xmlobject_from_file(self.content, NlmArticle)
+        content = self.content_file()
+        if content is not None:
+            article.contentMetadata.content = load_xmlobject_from_file(content, NlmArticle)
 
         if article.contentMetadata.content:
             article.descMetadata.content = article.contentMetadata.content.as_article_mods()
@@ -161,6 +332,115 @@ class HarvestRecord(models.Model):
         return article
     
 
+class HarvestRun(models.Model):
+    '''Checkpoint for a run of the ``fetch_pmc_metadata`` harvest: the
+    date window searched, the Entrez search history used to fetch
+    articles, how far through the search results the run has gotten, and
+    counts of what was done.  A run that is interrupted remains in
+    progress, so that the next harvest for the same window can resume from
+    the last completely processed chunk of articles.'''
+    STATUSES = ('inprogress', 'complete')
+    DEFAULT_STATUS = STATUSES[0]
+    STATUS_CHOICES = [(val, val) for val in STATUSES]
+    COUNTS = ('articles', 'harvested', 'errors', 'noauthor')
+    'names of the count fields, as used in harvest statistics'
+
+    started = models.DateTimeField(auto_now_add=True, editable=False)
+    updated = models.DateTimeField(auto_now=True, editable=False)
+    status = models.CharField(choices=STATUS_CHOICES, max_length=25,
+                              default=DEFAULT_STATUS)
+    mindate = models.DateField('Earliest Entrez date', null=True, blank=True)
+    maxdate = models.DateField('Latest Entrez date', null=True, blank=True)
+    webenv = models.CharField('Entrez WebEnv', max_length=255, blank=True)
+    query_key = models.IntegerField('Entrez query key', null=True, blank=True)
+    total = models.IntegerField('Articles found', default=0)
+    retstart = models.IntegerField('Articles completed', default=0,
+        help_text='offset in the search results of the first article not yet processed')
+    articles = models.IntegerField('Articles processed', default=0)
+    harvested = models.IntegerField('Articles harvested', default=0)
+    errors = models.IntegerField(default=0)
+    noauthor = models.IntegerField('Articles with no identifiable authors', default=0)
+
+    def __unicode__(self):
+        window = '%s - %s' % (self.mindate, self.maxdate) if self.mindate \
+                 else 'all dates'
+        return u'%s (%s, %d/%d)' % (window, self.status, self.retstart, self.total)
+
+    @property
+    def date_opts(self):
+        '''Entrez search arguments for this run's date window, in the
+        format used by ``fetch_pmc_metadata``.'''
+        if not self.mindate:
+            return {}
+        return {
+            'datetype': 'edat',
+            'mindate': self.mindate.strftime('%Y/%m/%d'),
+            'maxdate': self.maxdate.strftime('%Y/%m/%d'),
+        }
+
+    @staticmethod
+    def init_from_date_opts(date_opts):
+        '''Initialize (but do not save) a new :class:`HarvestRun` for
+        Entrez search date arguments (**mindate** and **maxdate** in
+        YYYY/MM/DD format), if any.'''
+        run = HarvestRun()
+        if date_opts:
+            run.mindate = datetime.strptime(date_opts['mindate'], '%Y/%m/%d').date()
+            run.maxdate = datetime.strptime(date_opts['maxdate'], '%Y/%m/%d').date()
+        return run
+
+    @staticmethod
+    def last_incomplete(**kwargs):
+        '''Find the most recently started run that is still in progress
+        (i.e., was interrupted), optionally filtered by any keyword
+        arguments (e.g., a date window).
+
+        :returns: :class:`HarvestRun` or None
+        '''
+        runs = HarvestRun.objects.filter(status='inprogress', **kwargs) \
+                                 .order_by('-started')[:1]
+        return runs[0] if runs else None
+
+    @staticmethod
+    def next_mindate():
+        '''The day after the latest date window that has been
+        completely harvested, so that consecutive runs search new dates
+        only.
+
+        :returns: :class:`datetime.date` or None if no run with a date
+            window has been completed
+        '''
+        maxdate = HarvestRun.objects.filter(status='complete') \
+                            .aggregate(Max('maxdate'))['maxdate__max']
+        if maxdate is not None:
+            return maxdate + timedelta(1)
+
+    def set_search(self, results):
+        '''Store the Entrez search history and number of results for this
+        run, from an :class:`~openemory.harvest.entrez.ESearchResponse`.'''
+        if self.total and self.total != results.count:
+            logger.warn('Number of articles for harvest run %s changed from %d to %d' \
+                        % (self.pk, self.total, results.count))
+        self.webenv = results.webenv or ''
+        self.query_key = results.query_key
+        self.total = results.count
+        self.save()
+
+    def checkpoint(self, retstart, counts):
+        '''Record the offset of the first article in the search results
+        that has not been completely processed, along with current counts
+        (a dictionary with keys in :attr:`COUNTS`).'''
+        self.retstart = retstart
+        for name in self.COUNTS:
+            setattr(self, name, counts.get(name, 0))
+        self.save()
+
+    def mark_complete(self, counts):
+        '''Mark this run as complete, with final counts.'''
+        self.status = 'complete'
+        self.checkpoint(self.total, counts)
+
+
 class OpenEmoryEntrezClient(EntrezClient):
     '''Project-specific methods build on top of an
     :class:`~openemory.harvest.entrez.EntrezClient`.
@@ -0,0 +1,325 @@
+# file openemory/harvest/pipeline.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Pipelined harvesting of articles from PubMed Central.
+
+Fetching article chunks from EFetch (rate-limited by the
+:class:`~openemory.harvest.entrez.EntrezClient`), checking for
+previously harvested records and identifying Emory authors (database and
+LDAP look-ups) run concurrently in separate threads, so that the caller
+can save harvested records while the next articles are being fetched
+and resolved.
+'''
+
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+import logging
+import Queue
+import threading
+import time
+
+from django.db import connection
+
+from openemory.harvest.models import HarvestRecord
+from openemory.publication.authors import AuthorLookupCache
+
+logger = logging.getLogger(__name__)
+
+
+class StageMetrics(object):
+    '''Thread-safe counts and cumulative elapsed time for named
+    processing stages, for reporting harvest throughput.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.elapsed = defaultdict(float)
+        self.start = time.time()
+
+    @contextmanager
+    def time(self, stage, count=1):
+        '''Context manager to time one or more items processed by a stage.'''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(stage, time.time() - start, count)
+
+    def add(self, stage, elapsed, count=1):
+        with self._lock:
+            self.counts[stage] += count
+            self.elapsed[stage] += elapsed
+
+    def report(self):
+        '''Summary of each stage as a list of strings, with number of
+        items, total and average time, and items per second.'''
+        lines = []
+        for stage in sorted(self.counts):
+            count, elapsed = self.counts[stage], self.elapsed[stage]
+            lines.append('%s: %d in %.2f sec (%.3f sec avg, %.1f/sec)' % \
+                         (stage, count, elapsed, elapsed / max(count, 1),
+                          count / max(elapsed, 0.001)))
+        return lines
+
+
+_DONE = object()
+'sentinel put on queues to indicate a thread has finished'
+
+_CHUNK_DONE = object()
+'marker for results indicating all articles in a chunk have been processed'
+
+
+class HarvestPipeline(object):
+    '''Iterate over the articles in a paginated
+    :class:`~openemory.harvest.entrez.ArticleQuerySet`, fetching the next
+    chunks and checking for duplicates and resolving authors for each chunk
+    in background threads.  Yields tuples of
+    status and :class:`~openemory.publication.models.NlmArticle`, where
+    status is one of:
+
+      * ``duplicate`` - article has already been harvested
+      * ``authors`` - article has identifiable Emory authors
+      * ``noauthor`` - article has no identifiable authors
+      * ``error`` - an error occurred identifying authors; the exception
+        is included as a third item in the tuple
+
+    Articles are not necessarily yielded in the order they were fetched.
+
+    :param chunks: :class:`django.core.paginator.Paginator` of an
+        :class:`~openemory.harvest.entrez.ArticleQuerySet`
+    :param threads: number of threads for processing fetched chunks; if 0,
+        chunks are processed in the iterating thread
+    :param prefetch: number of chunks (or batches) to fetch ahead of
+        processing
+    :param metrics: optional :class:`StageMetrics`
+    :param chunk_done: optional callback, called in the iterating thread
+        with the page number of each chunk once all of its articles have
+        been yielded (and handled by the caller)
+    :param batch_size: optional number of articles to process at a time;
+        if specified, articles in each chunk are streamed from the EFetch
+        response (see
+        :meth:`~openemory.harvest.entrez.ArticleQuerySet.iterator`) and
+        queued for processing in batches of this size, so that large
+        chunks don't need to be held in memory all at once
+    :param author_cache: optional
+        :class:`~openemory.publication.authors.AuthorLookupCache` for
+        identifying authors; by default, a new cache is shared by all of
+        the worker threads
+    '''
+
+    def __init__(self, chunks, threads=4, prefetch=2, metrics=None,
+                 chunk_done=None, batch_size=None, author_cache=None):
+        self.chunks = chunks
+        self.author_cache = author_cache or AuthorLookupCache()
+        self.threads = threads
+        self.metrics = metrics or StageMetrics()
+        self.chunk_done = chunk_done
+        self.batch_size = batch_size
+        self.fetched = Queue.Queue(maxsize=max(1, prefetch))
+        self.results = Queue.Queue()
+        self._stop = threading.Event()
+        self.error = None
+        self.completed = set()
+        # number of batches processed and total number of batches for
+        # each chunk, to determine when a chunk is complete
+        self._batches_done = defaultdict(int)
+        self._batches_total = {}
+
+    def stop(self):
+        '''Stop fetching and processing articles, e.g. when enough
+        articles have been harvested.'''
+        self._stop.set()
+
+    @property
+    def completed_chunks(self):
+        '''Number of consecutive chunks, starting from the first, whose
+        articles have all been yielded.  Chunks may complete out of order
+        when there is more than one thread.'''
+        count = 0
+        while count + 1 in self.completed:
+            count += 1
+        return count
+
+    def __iter__(self):
+        fetcher = threading.Thread(target=self._fetch, name='harvest-fetch')
+        workers = [threading.Thread(target=self._resolve_worker,
+                                    name='harvest-authors-%d' % i)
+                   for i in range(self.threads)]
+        for thread in [fetcher] + workers:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            if self.threads:
+                results = self._results()
+            else:
+                results = self._resolve_articles()
+            for result in results:
+                if result[0] is _CHUNK_DONE:
+                    self._batch_done(*result[1:])
+                    continue
+                yield result
+                if self._stop.is_set():
+                    break
+        finally:
+            self.stop()
+            for thread in [fetcher] + workers:
+                thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def _put(self, queue, item):
+        # put an item on a bounded queue, unless processing is stopped
+        while not self._stop.is_set():
+            try:
+                queue.put(item, timeout=0.5)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _batch_done(self, page, total):
+        # called in the iterating thread when a batch has been processed;
+        # total is the number of batches in the chunk, for the last batch
+        self._batches_done[page] += 1
+        if total:
+            self._batches_total[page] = total
+        if self._batches_done[page] == self._batches_total.get(page):
+            self.completed.add(page)
+            if self.chunk_done is not None:
+                self.chunk_done(page)
+
+    def _get_chunk(self):
+        while not self._stop.is_set():
+            try:
+                return self.fetched.get(timeout=0.5)
+            except Queue.Empty:
+                pass
+        return _DONE
+
+    def _fetch(self):
+        try:
+            for p in self.chunks.page_range:
+                if self._stop.is_set():
+                    break
+                if not self._fetch_chunk(p):
+                    return
+        except Exception as e:
+            logger.error('Error fetching articles: %s' % e)
+            self.error = e
+        finally:
+            # one end marker for each worker (or the iterating thread)
+            for i in range(max(self.threads, 1)):
+                self._put(self.fetched, _DONE)
+
+    def _fetch_chunk(self, p):
+        # queue the articles for one chunk, in batches if batch_size is
+        # set; the last batch is marked with the number of batches
+        elapsed = 0
+        start = time.time()
+        # executes the efetch query for this chunk
+        articles = self.chunks.page(p).object_list
+        if self.batch_size and hasattr(articles, 'iterator'):
+            articles = articles.iterator()
+        articles = iter(articles)
+        batch = list(islice(articles, self.batch_size))
+        count = 0
+        while True:
+            next_batch = list(islice(articles, self.batch_size)) \
+                         if self.batch_size else []
+            elapsed += time.time() - start
+            count += 1
+            total = count if not next_batch else None
+            if not self._put(self.fetched, (p, batch, total)):
+                return False
+            if not next_batch:
+                break
+            batch = next_batch
+            start = time.time()
+        self.metrics.add('fetch', elapsed)
+        return True
+
+    def _resolve(self, articles):
+        # generator: results for one chunk of articles
+        # check the whole chunk for existing records at once
+        with self.metrics.time('duplicates', len(articles)):
+            harvested = HarvestRecord.harvested_pmcids(a.docid for a in articles)
+        # look up authors of all the new articles in the local database at once
+        emails = [email for a in articles if a.docid not in harvested
+                  for email in a.emory_emails]
+        with self.metrics.time('author prefetch', len(emails)):
+            self.author_cache.prefetch(emails)
+        for article in articles:
+            if self._stop.is_set():
+                return
+            if article.docid in harvested:
+                yield ('duplicate', article)
+                continue
+            try:
+                with self.metrics.time('authors'):
+                    authors = article.identifiable_authors(derive=True,
+                                                           cache=self.author_cache)
+            except Exception as e:
+                yield ('error', article, e)
+                continue
+            yield ('authors' if authors else 'noauthor', article)
+
+    def _resolve_chunk(self, chunk):
+        # generator: results for one fetched batch, followed by a marker
+        # if every article in the batch was processed
+        page, articles, total = chunk
+        for result in self._resolve(articles):
+            yield result
+        if not self._stop.is_set():
+            yield (_CHUNK_DONE, page, total)
+
+    def _resolve_articles(self):
+        # generator: identify authors in the current thread
+        while True:
+            chunk = self._get_chunk()
+            if chunk is _DONE:
+                return
+            for result in self._resolve_chunk(chunk):
+                yield result
+
+    def _resolve_worker(self):
+        try:
+            while True:
+                chunk = self._get_chunk()
+                if chunk is _DONE:
+                    break
+                for result in self._resolve_chunk(chunk):
+                    self.results.put(result)
+        except Exception as e:
+            logger.error('Error processing articles: %s' % e)
+            self.error = e
+            self.stop()
+        finally:
+            # database connections are per-thread; don't leave them open
+            connection.close()
+            self.results.put(_DONE)
+
+    def _results(self):
+        # generator: results from the worker threads until all are done
+        finished = 0
+        while finished < self.threads:
+            result = self.results.get()
+            if result is _DONE:
+                finished += 1
+            else:
+                yield result
@@ -15,24 +15,39 @@
 #   limitations under the License.
 
 import os
+import shutil
+from StringIO import StringIO
+import tempfile
 
-from datetime import timedelta, datetime
+from datetime import date, timedelta, datetime
 
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.core.management.base import CommandError
 from django.core import paginator
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from mock import patch, Mock
 from eulxml import xmlmap
+import requests
 
 from openemory.accounts.models import EsdPerson
 from openemory.accounts.tests import USER_CREDENTIALS
 from openemory.harvest.entrez import (EntrezClient, ArticleQuerySet,
-    EFetchResponse, ESearchResponse)
-from openemory.harvest.models import OpenEmoryEntrezClient, HarvestRecord
+    EFetchResponse, ESearchResponse, TokenBucket)
+from openemory.harvest.models import OpenEmoryEntrezClient, HarvestRecord, \
+     HarvestRun
+from openemory.harvest.benchmark import EUtilsReplayServer, HarvestBenchmark, \
+     BENCHMARK_PMCID_BASE, BENCHMARK_USERNAME
+from openemory.harvest.pipeline import HarvestPipeline, StageMetrics
 from openemory.publication.models import NlmArticle
+from openemory.publication.ingest import ingest_harvested_records
+from openemory.util import KeysetPaginator
 from openemory.harvest.management.commands.fetch_pmc_metadata import Command as fetch_pmc_cmd
+from openemory.harvest.management.commands.compact_harvest_content import Command as compact_cmd
+from openemory.harvest.management.commands.benchmark_harvest import Command as benchmark_cmd
 
 
 import logging
@@ -111,6 +126,32 @@ class HarvestViewsTest(TestCase):
 #        self.assertContains(response, 'Articles 1-5 of 5',
 #             msg_prefix='page should include total number of articles')
 
+    def test_queue_pagination(self):
+        records = HarvestRecord.objects.filter(status='harvested')
+        ordered = list(records.order_by('harvested', 'id'))
+        pages = KeysetPaginator(records, 2, ('harvested', 'id'))
+        self.assertEqual(3, pages.num_pages)
+        # numbered pages, from the start or the end of the results
+        page1, page3 = pages.page(1), pages.page(3)
+        self.assertEqual(ordered[:2], page1.object_list)
+        self.assertEqual(ordered[4:], page3.object_list)
+        self.assertEqual(None, page1.previous_cursor)
+        self.assertEqual(None, page3.next_cursor)
+        # pages relative to cursors
+        page2 = pages.page(2, after=page1.next_cursor)
+        self.assertEqual(ordered[2:4], page2.object_list)
+        self.assertEqual(3, page2.start_index())
+        self.assertEqual(ordered[2:4],
+                         pages.page(2, before=page3.previous_cursor).object_list)
+        # invalid cursors are ignored
+        self.assertEqual(ordered[2:4], pages.page(2, after='bogus').object_list)
+
+        # queue view uses cursors
+        self.assertTrue(self.client.login(**USER_CREDENTIALS['admin']))
+        response = self.client.get(reverse('harvest:queue'),
+                                   {'page': 1, 'after': pages.cursor(ordered[0])})
+        self.assertEqual(ordered[1:], response.context['results'].object_list)
+
     def test_queue_ajax(self):
         queue_url = reverse('harvest:queue')
 
@@ -171,84 +212,132 @@ class HarvestViewsTest(TestCase):
                 % (expected, got, record_url))
 
 
+def mock_response(fixture, status_code=200, headers=None):
+    # Shared utility method used by multiple tests
+    # generate a mock HTTP response with a fixture file as the raw body
+    response = Mock(status_code=status_code, headers=headers or {},
+                    reason='Error' if status_code >= 400 else 'OK')
+    response.raw = open(fixture_path(fixture)) if fixture else None
+    return response
+
+
 class EntrezTest(TestCase):
     def setUp(self):
         self.entrez = OpenEmoryEntrezClient()
 
     @patch('openemory.harvest.entrez.sleep')
-    @patch('openemory.harvest.entrez.xmlmap')
-    def test_get_emory_articles(self, mock_xmlmap, mock_sleep):
+    def test_get_emory_articles(self, mock_sleep):
         '''Verify that test_emory_articles makes an appropriate request to
         E-Utils and interprets the result appropriately.'''
 
-        # set up mocks
-        def mock_load(url, xmlclass):
-            '''mock-like method wrapping load_xmlobject_from_file without
-            actually making a network query, but still calling the requested
-            xmlclass constructor.
-            '''
-            # figure out what fixture to return
-            fixture = (mock_load.return_fixtures[mock_load.call_count]
-                       if mock_load.call_count < len(mock_load.return_fixtures)
-                       else mock_load.return_fixtures[-1])
-
-            mock_load.call_count += 1
-            mock_load.urls.append(url)
-            test_response_path = fixture_path(fixture)
-            test_response_obj = xmlmap.load_xmlobject_from_file(test_response_path,
-                    xmlclass=xmlclass)
-            return test_response_obj
-        mock_load.call_count = 0
-        mock_load.urls = []
-        mock_xmlmap.load_xmlobject_from_file = mock_load
-        # configure the return values
-        mock_load.return_fixtures = [
+        # set up mocks: return fixture responses without actually making a
+        # network query
+        urls = []
+        fixtures = [
             'esearch-response-withhist.xml',
             'efetch-retrieval-from-hist.xml',
             ]
+        def mock_get(url, **kwargs):
+            urls.append(url)
+            return mock_response(fixtures[min(len(urls), len(fixtures)) - 1])
+        self.entrez.session = Mock()
+        self.entrez.session.get.side_effect = mock_get
 
         # make the call
         article_qs = self.entrez.get_emory_articles()
 
-        self.assertEqual(mock_xmlmap.load_xmlobject_from_file.call_count, 1)
+        self.assertEqual(self.entrez.session.get.call_count, 1)
+        # response is streamed
+        args, kwargs = self.entrez.session.get.call_args
+        self.assertTrue(kwargs['stream'])
+        self.assertEqual(EntrezClient.EUTILS_TIMEOUT_SECONDS, kwargs['timeout'])
         # check the first query url
-        self.assertTrue('esearch.fcgi' in mock_load.urls[0])
+        self.assertTrue('esearch.fcgi' in urls[0])
         # these should always be in there per E-Utils policy (see entrez.py)
-        self.assertTrue('tool=' in mock_load.urls[0])
-        self.assertTrue('email=' in mock_load.urls[0])
+        self.assertTrue('tool=' in urls[0])
+        self.assertTrue('email=' in urls[0])
         # these are what we're currently querying for. note that these may
         # change as our implementation develops. if they do (causing these
         # assertions to fail) then we probably need to update our fixture.
-        self.assertTrue('db=pmc' in mock_load.urls[0])
-        self.assertTrue('term=emory' in mock_load.urls[0])
-        self.assertTrue('field=affl' in mock_load.urls[0])
-        self.assertTrue('usehistory=y' in mock_load.urls[0])
+        self.assertTrue('db=pmc' in urls[0])
+        self.assertTrue('term=emory' in urls[0])
+        self.assertTrue('field=affl' in urls[0])
+        self.assertTrue('usehistory=y' in urls[0])
+        self.assertEqual(article_qs.count, article_qs.results.count)
 
         # fetch one
         articles = article_qs[:20] # grab a slice to limit the query
         articles[0]
 
-        self.assertEqual(mock_xmlmap.load_xmlobject_from_file.call_count, 2)
+        self.assertEqual(self.entrez.session.get.call_count, 2)
         # check that we slept between calls (reqd by eutils policies)
         self.assertEqual(mock_sleep.call_count, 1)
         sleep_args, sleep_kwargs = mock_sleep.call_args
         self.assertTrue(sleep_args[0] >= 0.3)
         # check the second query url
-        self.assertTrue('efetch.fcgi' in mock_load.urls[1])
+        self.assertTrue('efetch.fcgi' in urls[1])
         # always required
-        self.assertTrue('tool=' in mock_load.urls[1])
-        self.assertTrue('email=' in mock_load.urls[1])
+        self.assertTrue('tool=' in urls[1])
+        self.assertTrue('email=' in urls[1])
         # what we're currently querying for
-        self.assertTrue('db=pmc' in mock_load.urls[1])
-        self.assertTrue('usehistory=y' in mock_load.urls[1])
-        self.assertTrue('query_key=' in mock_load.urls[1])
-        self.assertTrue('WebEnv=' in mock_load.urls[1])
-        self.assertTrue('retmode=xml' in mock_load.urls[1])
-        self.assertTrue('retstart=0' in mock_load.urls[1])
-        self.assertTrue('retmax=20' in mock_load.urls[1])
+        self.assertTrue('db=pmc' in urls[1])
+        self.assertTrue('usehistory=y' in urls[1])
+        self.assertTrue('query_key=' in urls[1])
+        self.assertTrue('WebEnv=' in urls[1])
+        self.assertTrue('retmode=xml' in urls[1])
+        self.assertTrue('retstart=0' in urls[1])
+        self.assertTrue('retmax=20' in urls[1])
 
         # article field testing handled below in EFetchArticleTest
 
+    @patch('openemory.harvest.entrez.sleep')
+    def test_retry(self, mock_sleep):
+        self.entrez.session = Mock()
+        # server errors and throttling are retried, with increasing delays
+        self.entrez.session.get.side_effect = [
+            mock_response(None, 503),
+            mock_response(None, 429, {'Retry-After': '10'}),
+            mock_response('esearch-response-withhist.xml'),
+        ]
+        response = self.entrez.esearch(db='pmc', term='emory')
+        self.assert_(isinstance(response, ESearchResponse))
+        self.assertEqual(3, self.entrez.session.get.call_count)
+        delays = [args[0] for args, kwargs in mock_sleep.call_args_list]
+        self.assert_(EntrezClient.EUTILS_RETRY_DELAY_SECONDS in delays)
+        # Retry-After header is honored if longer than the backoff delay
+        self.assert_(10 in delays)
+
+        # other errors are not retried
+        self.entrez.session.get.reset_mock()
+        error = mock_response(None, 400)
+        error.raise_for_status.side_effect = requests.HTTPError
+        self.entrez.session.get.side_effect = [error]
+        self.assertRaises(requests.HTTPError, self.entrez.esearch, db='pmc')
+        self.assertEqual(1, self.entrez.session.get.call_count)
+
+        # give up after the maximum number of retries
+        self.entrez.session.get.reset_mock()
+        self.entrez.session.get.side_effect = lambda *args, **kwargs: error
+        error.status_code = 503
+        self.assertRaises(requests.HTTPError, self.entrez.esearch, db='pmc')
+        self.assertEqual(EntrezClient.EUTILS_MAX_RETRIES + 1,
+                         self.entrez.session.get.call_count)
+
+
+class TokenBucketTest(TestCase):
+
+    @patch('openemory.harvest.entrez.sleep')
+    def test_acquire(self, mock_sleep):
+        bucket = TokenBucket(rate=2, capacity=2)
+        # requests up to capacity don't wait
+        self.assertEqual(0, bucket.acquire())
+        self.assertEqual(0, bucket.acquire())
+        self.assertEqual(0, mock_sleep.call_count)
+        # bucket is empty; next request waits for a token
+        delay = bucket.acquire()
+        self.assert_(0.4 < delay <= 0.5)
+        mock_sleep.assert_called_with(delay)
+
 
 class ArticleQuerySetTest(TestCase):
     def fixture_path(self, fname):
@@ -266,31 +355,34 @@ class ArticleQuerySetTest(TestCase):
         self.mock_client = Mock(spec=EntrezClient)
 
     @patch('openemory.harvest.entrez.sleep')
-    @patch('openemory.harvest.entrez.xmlmap')
-    def test_query_set_requests(self, mock_xmlmap, mock_sleep):
-        mock_xmlmap.load_xmlobject_from_file.return_value = self.fetch_response
-        
+    def test_query_set_requests(self, mock_sleep):
+        client = EntrezClient()
+        client.session = Mock()
+        client.session.get.side_effect = lambda *args, **kwargs: \
+            mock_response('efetch-retrieval-from-hist.xml')
+        mock_get = client.session.get
+
         # use query args here from openemory.harvest.models. specific values
         # aren't important for these tests, though: we just want to verify
         # that they get passed to the query.
-        qs = ArticleQuerySet(EntrezClient(), results=self.search_response,
+        qs = ArticleQuerySet(client, results=self.search_response,
                 db='pmc', usehistory='y',
                 WebEnv=self.search_response.webenv,
                 query_key=self.search_response.query_key)
         # creating the queryset doesn't execute any queries
-        self.assertEqual(mock_xmlmap.load_xmlobject_from_file.call_count, 0)
+        self.assertEqual(mock_get.call_count, 0)
 
         # restrict (slice) the queryset
         s = qs[20:35]
         # this doesn't execute any queries
-        self.assertEqual(mock_xmlmap.load_xmlobject_from_file.call_count, 0)
+        self.assertEqual(mock_get.call_count, 0)
 
         # request three items from the slice
         objs = s[0], s[5], s[14]
         # this made only a single query
-        self.assertEqual(mock_xmlmap.load_xmlobject_from_file.call_count, 1)
+        self.assertEqual(mock_get.call_count, 1)
         # the query included the initial queryset args
-        args, kwargs = mock_xmlmap.load_xmlobject_from_file.call_args
+        args, kwargs = mock_get.call_args
         query_url = args[0]
         self.assertTrue('db=pmc' in query_url)
         self.assertTrue('usehistory=y' in query_url)
@@ -305,15 +397,15 @@ class ArticleQuerySetTest(TestCase):
         self.assertRaises(IndexError, lambda: s[-16])
 
         # and still just that one call
-        self.assertEqual(mock_xmlmap.load_xmlobject_from_file.call_count, 1)
+        self.assertEqual(mock_get.call_count, 1)
 
         # making a second slice doesn't make a query
         s = qs[35:50]
         # but getting an item from it does
         obj = s[3]
-        self.assertEqual(mock_xmlmap.load_xmlobject_from_file.call_count, 2)
+        self.assertEqual(mock_get.call_count, 2)
         # this call had the new start/max
-        args, kwargs = mock_xmlmap.load_xmlobject_from_file.call_args_list[-1]
+        args, kwargs = mock_get.call_args_list[-1]
         query_url = args[0]
         self.assertTrue('retstart=35' in query_url)
         self.assertTrue('retmax=15' in query_url)
@@ -367,6 +459,32 @@ class ArticleQuerySetTest(TestCase):
         check(qs[10:20][:9000],  10, 20, 'very large positive subslice stop')
         check(qs[10:20][:-9000], 10, 10, 'very large negative subslice stop')
 
+    @patch('openemory.harvest.entrez.sleep')
+    def test_iterator(self, mock_sleep):
+        client = EntrezClient()
+        client.session = Mock()
+        client.session.get.side_effect = lambda *args, **kwargs: \
+            mock_response('efetch-retrieval-from-hist.xml')
+        qs = ArticleQuerySet(client, results=self.search_response,
+                db='pmc', usehistory='y',
+                WebEnv=self.search_response.webenv,
+                query_key=self.search_response.query_key)
+
+        # articles are streamed, one at a time, and not cached
+        articles = qs[0:20].iterator()
+        self.assertEqual(0, client.session.get.call_count)
+        article = articles.next()
+        self.assertEqual(1, client.session.get.call_count)
+        args, kwargs = client.session.get.call_args
+        self.assertTrue('retstart=0' in args[0])
+        self.assertTrue('retmax=20' in args[0])
+        self.assert_(isinstance(article, NlmArticle))
+        self.assertEqual(self.fetch_response.articles[0].docid, article.docid)
+        # each article is detached from the response document
+        self.assertEqual(None, article.node.getparent())
+        self.assertEqual(19, len(list(articles)))
+        self.assertEqual(1, client.session.get.call_count)
+
 
 class HarvestRecordTest(TestCase):
     fixtures = ['site_admin_group', 'users', 'harvest_records']
@@ -391,9 +509,11 @@ class HarvestRecordTest(TestCase):
             self.assertEqual(self.article.fulltext_available, record.fulltext)
             self.assertEqual(0, record.authors.count())
 
-            self.assertEqual(self.article.serialize(pretty=True),
-                             record.content.read(),
+            self.assertEqual(self.article.serialize(),
+                             record.content_file().read(),
                 'article xml should be saved in content file field')
+            self.assert_(record.content.name.endswith('.xml.gz'),
+                'article xml should be stored compressed')
             
             # remove the new record so we can test creating it again
             record.content.delete()
@@ -409,6 +529,135 @@ class HarvestRecordTest(TestCase):
             self.assert_(testauthor in record.authors.all())
             record.content.delete()
 
+    def test_harvested_pmcids(self):
+        self.assertEqual(set([self.article.docid]),
+                         HarvestRecord.harvested_pmcids([self.article.docid, 1234]))
+        self.assertEqual(set(), HarvestRecord.harvested_pmcids([]))
+
+    def test_init_from_fetched_articles(self):
+        HarvestRecord.objects.get(pmcid=self.article.docid).delete()
+        article2 = self.fetch_response.articles[1]
+        HarvestRecord.objects.filter(pmcid=article2.docid).delete()
+
+        testauthor = User(username='author')
+        testauthor.save()
+        with patch.object(self.article, 'identifiable_authors',
+                          new=Mock(return_value=[testauthor, testauthor])):
+            with patch.object(article2, 'identifiable_authors',
+                              new=Mock(return_value=[])):
+                records = HarvestRecord.init_from_fetched_articles([self.article, article2])
+
+        self.assertEqual(2, len(records))
+        record = HarvestRecord.objects.get(pmcid=self.article.docid)
+        self.assertEqual(records[0].id, record.id)
+        self.assertEqual(self.article.article_title, record.title)
+        self.assertEqual(self.article.fulltext_available, record.fulltext)
+        self.assertEqual([testauthor], list(record.authors.all()))
+        self.assertEqual(self.article.serialize(),
+                         record.content_file().read(),
+            'article xml should be saved in content file field')
+        record2 = HarvestRecord.objects.get(pmcid=article2.docid)
+        self.assertEqual(0, record2.authors.count())
+        for r in records:
+            r.content.delete()
+
+    def test_store_content(self):
+        xml = self.article.serialize()
+        name = HarvestRecord.store_content(xml)
+        self.assert_(name.startswith(HarvestRecord.CONTENT_DIR))
+        # identical content is stored once, under the same name
+        self.assertEqual(name, HarvestRecord.store_content(xml))
+
+        record = HarvestRecord.objects.get(pmcid=self.article.docid)
+        record.content = name
+        record.save()
+        self.assertEqual(xml, record.content_file().read())
+        self.assert_(len(xml) > record.content.size,
+                     'stored content should be compressed')
+
+        # shared content is only deleted when no longer referenced
+        other = HarvestRecord.objects.exclude(id=record.id)[0]
+        other.content = name
+        other.save()
+        storage = record.content.storage
+        record.mark_ignored()
+        self.assert_(storage.exists(name))
+        other.mark_ignored()
+        self.assertFalse(storage.exists(name))
+
+    def test_compact_content(self):
+        # use a temporary storage directory, since the command removes
+        # any content files not referenced by the test database
+        tmpdir = tempfile.mkdtemp(prefix='openemory-harvest-')
+        storage = FileSystemStorage(location=tmpdir)
+        try:
+            with patch.object(HarvestRecord._meta.get_field('content'),
+                              'storage', storage):
+                self._test_compact_content(storage)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_compact_content_recent(self):
+        tmpdir = tempfile.mkdtemp(prefix='openemory-harvest-')
+        storage = FileSystemStorage(location=tmpdir)
+        try:
+            with patch.object(HarvestRecord._meta.get_field('content'),
+                              'storage', storage):
+                # content just saved by a harvest in progress, before
+                # the record referencing it
+                new_content = HarvestRecord.store_content('<article/>')
+                cmd = compact_cmd()
+                cmd.stdout = StringIO()
+                cmd.handle(verbosity=0, noact=False, min_age=24)
+                self.assert_(storage.exists(new_content),
+                             'recently saved content should not be removed')
+                output = cmd.stdout.getvalue()
+                self.assert_('Orphaned files removed: 0' in output)
+                self.assert_('Recent unreferenced files skipped: 1' in output)
+
+                # removed once older than the minimum age
+                cmd.stdout = StringIO()
+                cmd.handle(verbosity=0, noact=False, min_age=0)
+                self.assertFalse(storage.exists(new_content))
+                self.assert_('Orphaned files removed: 1' in cmd.stdout.getvalue())
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def _test_compact_content(self, storage):
+        xml = self.article.serialize(pretty=True)
+        # uncompressed content from before content was compressed
+        legacy = storage.save('harvest/test/%d.xml' % self.article.docid,
+                              ContentFile(xml))
+        record = HarvestRecord.objects.get(pmcid=self.article.docid)
+        HarvestRecord.objects.filter(id=record.id).update(content=legacy)
+        # content left on an ingested record, and an orphaned file
+        ingested = HarvestRecord.objects.exclude(id=record.id)[0]
+        ingested_content = HarvestRecord.store_content('<article/>')
+        HarvestRecord.objects.filter(id=ingested.id) \
+                             .update(status='ingested', content=ingested_content)
+        orphan = HarvestRecord.store_content('<orphan/>')
+
+        cmd = compact_cmd()
+        cmd.stdout = StringIO()
+        # no changes with noact
+        cmd.handle(verbosity=0, noact=True, min_age=0)
+        self.assert_(all(storage.exists(name)
+                         for name in [legacy, ingested_content, orphan]))
+        self.assert_('Content files compressed: 1' in cmd.stdout.getvalue())
+
+        cmd.stdout = StringIO()
+        cmd.handle(verbosity=0, noact=False, min_age=0)
+        record = HarvestRecord.objects.get(id=record.id)
+        self.assert_(record.content.name.endswith('.xml.gz'))
+        self.assertEqual(xml, record.content_file().read())
+        self.assertFalse(storage.exists(legacy))
+        self.assertEqual('', HarvestRecord.objects.get(id=ingested.id).content.name)
+        self.assertFalse(storage.exists(ingested_content))
+        self.assertFalse(storage.exists(orphan))
+        output = cmd.stdout.getvalue()
+        self.assert_('Content removed from ingested/ignored records: 1' in output)
+        self.assert_('Content files compressed: 1' in output)
+
     def test_mark_ingested(self):
         record = HarvestRecord.objects.get(pmcid=self.article.docid)
         record.mark_ingested()
@@ -421,6 +670,65 @@ class HarvestRecordTest(TestCase):
         self.assertEqual('', record.content.name,
             'article content file should be removed by mark_ingested')
 
+    def test_claim_for_ingest_concurrent(self):
+        ids = list(HarvestRecord.objects.filter(status='harvested') \
+                                        .values_list('id', flat=True))
+        objects_filter = HarvestRecord.objects.filter
+        def select_then_claim_elsewhere(*args, **kwargs):
+            candidates = list(objects_filter(*args, **kwargs).values_list('id', flat=True))
+            # another process claims a record after this one selected it
+            objects_filter(id=ids[0]).update(status='inprocess')
+            mockfilter.side_effect = objects_filter
+            selected = Mock()
+            selected.values_list.return_value = candidates
+            return selected
+        with patch.object(HarvestRecord.objects, 'filter') as mockfilter:
+            mockfilter.side_effect = select_then_claim_elsewhere
+            records = HarvestRecord.claim_for_ingest(ids)
+        # only records claimed by this process are returned
+        self.assertEqual(sorted(ids[1:]), sorted(r.id for r in records))
+
+    def test_batch_ingest_status(self):
+        ids = list(HarvestRecord.objects.values_list('id', flat=True))
+        harvested = HarvestRecord.objects.filter(status='harvested').count()
+        # only records in harvested status are claimed
+        records = HarvestRecord.claim_for_ingest(ids)
+        self.assertEqual(harvested, len(records))
+        self.assert_(all(r.status == 'inprocess' for r in records))
+        self.assertEqual([], HarvestRecord.claim_for_ingest(ids))
+
+        HarvestRecord.mark_all_ingested(records[:2])
+        HarvestRecord.mark_all_harvested(records[2:])
+        for record in HarvestRecord.objects.filter(id__in=[r.id for r in records[:2]]):
+            self.assertEqual('ingested', record.status)
+            self.assertEqual('', record.content.name)
+        self.assertEqual(len(records) - 2,
+                         HarvestRecord.objects.filter(id__in=[r.id for r in records[2:]],
+                                                      status='harvested').count())
+
+    @patch('openemory.publication.ingest.Repository')
+    @patch('openemory.publication.ingest.ingest_harvested_record')
+    def test_ingest_harvested_records(self, mock_ingest, mock_repo):
+        user = User.objects.get(username='mmouse')
+        records = list(HarvestRecord.objects.filter(status='harvested'))
+        # fail one ingest
+        def ingest(record, user, collection, repo=None):
+            if record.id == records[0].id:
+                raise Exception('Fedora error')
+            return Mock(pid='test:%d' % record.pmcid)
+        mock_ingest.side_effect = ingest
+
+        ingested, failed = ingest_harvested_records([r.id for r in records], user,
+                                                    threads=0)
+        self.assertEqual(len(records), mock_ingest.call_count)
+        self.assertEqual([records[0].id], failed.keys())
+        self.assertEqual(len(records) - 1, len(ingested))
+        self.assertEqual('test:%d' % records[1].pmcid, ingested[records[1].id])
+        self.assertEqual('harvested', HarvestRecord.objects.get(id=records[0].id).status)
+        self.assertEqual(len(records) - 1,
+                         HarvestRecord.objects.filter(status='ingested',
+                                                      id__in=ingested.keys()).count())
+
     def test_ingestable(self):
         record = HarvestRecord.objects.get(pmcid=self.article.docid)
         self.assertTrue(record.ingestable)
@@ -476,6 +784,101 @@ class HarvestRecordTest(TestCase):
              'Article object returned should not yet be saved to Fedora')
 
 
+class HarvestPipelineTest(TestCase):
+    fixtures = ['site_admin_group', 'users', 'harvest_records']
+
+    def mock_article(self, docid, authors):
+        article = Mock(NlmArticle)
+        article.docid = docid
+        article.emory_emails = ['%s@emory.edu' % user.username for user in authors]
+        article.identifiable_authors.return_value = authors
+        return article
+
+    def test_pipeline(self):
+        user = User.objects.get(username='mmouse')
+        articles = [
+            self.mock_article(2701312, [user]),  # already harvested (fixture)
+            self.mock_article(1, [user]),
+            self.mock_article(2, []),
+            self.mock_article(3, [user]),
+        ]
+        articles[3].identifiable_authors.side_effect = Exception('ldap error')
+        metrics = StageMetrics()
+        # authors identified in the current thread
+        pipeline = HarvestPipeline(paginator.Paginator(articles, 2),
+                                   threads=0, metrics=metrics)
+        results = dict((r[1].docid, r[0]) for r in pipeline)
+        self.assertEqual({2701312: 'duplicate', 1: 'authors', 2: 'noauthor',
+                          3: 'error'}, results)
+        articles[1].identifiable_authors.assert_called_with(derive=True,
+                                                            cache=pipeline.author_cache)
+        self.assertEqual(2, metrics.counts['fetch'])
+        self.assertEqual(4, metrics.counts['duplicates'])
+        self.assertEqual(3, metrics.counts['authors'])
+        self.assertEqual(4, len(metrics.report()))
+        self.assertEqual(2, metrics.counts['author prefetch'])
+        self.assertEqual(2, pipeline.completed_chunks)
+
+        # completed chunks are reported to the caller
+        done = []
+        pipeline = HarvestPipeline(paginator.Paginator(articles, 2), threads=0,
+                                   chunk_done=done.append)
+        self.assertEqual(4, len(list(pipeline)))
+        self.assertEqual([1, 2], sorted(done))
+
+        # chunks processed in batches are complete when all batches are done
+        done = []
+        metrics = StageMetrics()
+        pipeline = HarvestPipeline(paginator.Paginator(articles, 3), threads=0,
+                                   metrics=metrics, chunk_done=done.append,
+                                   batch_size=2)
+        self.assertEqual(4, len(list(pipeline)))
+        self.assertEqual([1, 2], done)
+        self.assertEqual(2, pipeline.completed_chunks)
+        self.assertEqual(2, metrics.counts['fetch'])
+        self.assertEqual(4, metrics.counts['duplicates'])
+
+        # stopping the pipeline ends iteration
+        pipeline = HarvestPipeline(paginator.Paginator(articles, 2), threads=0)
+        results = []
+        for result in pipeline:
+            results.append(result)
+            pipeline.stop()
+        self.assertEqual(1, len(results))
+
+
+class HarvestRunTest(TestCase):
+
+    def test_last_incomplete(self):
+        self.assertEqual(None, HarvestRun.last_incomplete())
+        run = HarvestRun.init_from_date_opts({'mindate': '2012/01/01',
+                                              'maxdate': '2012/02/02'})
+        self.assertEqual(date(2012, 1, 1), run.mindate)
+        self.assertEqual('2012/02/02', run.date_opts['maxdate'])
+        self.assertEqual('edat', run.date_opts['datetype'])
+        run.save()
+        self.assertEqual(run, HarvestRun.last_incomplete(mindate=run.mindate,
+                                                         maxdate=run.maxdate))
+        self.assertEqual(None, HarvestRun.last_incomplete(mindate=None, maxdate=None))
+
+        # checkpoint progress
+        results = Mock(count=100, webenv='NCID_1_2', query_key=1)
+        run.set_search(results)
+        run.checkpoint(40, {'articles': 40, 'harvested': 3})
+        run = HarvestRun.objects.get(pk=run.pk)
+        self.assertEqual(('NCID_1_2', 1, 100), (run.webenv, run.query_key, run.total))
+        self.assertEqual(40, run.retstart)
+        self.assertEqual(3, run.harvested)
+        self.assertEqual(0, run.errors)
+        self.assertEqual(None, HarvestRun.next_mindate())
+
+        # completed runs are not resumed
+        run.mark_complete({'articles': 100, 'harvested': 7})
+        self.assertEqual(100, run.retstart)
+        self.assertEqual(None, HarvestRun.last_incomplete())
+        self.assertEqual(date(2012, 2, 3), HarvestRun.next_mindate())
+
+
 class FetchPMCMetadataTest(TestCase):
     fixtures = ['site_admin_group', 'users', 'harvest_records']
 
@@ -489,7 +892,14 @@ class FetchPMCMetadataTest(TestCase):
         opts = fetch_pmc_cmd._date_opts(c, None, None, True)
         self.assertEquals(opts['datetype'], 'edat')
         self.assertEquals(opts['mindate'], '2011/09/07')
-        self.assertEquals(opts['maxdate'], datetime.strftime(datetime.now()+ timedelta(1), '%Y/%m/%d'))
+        self.assertEquals(opts['maxdate'], datetime.strftime(datetime.now() - timedelta(1), '%Y/%m/%d'))
+
+        # after a completed run, start the day after its window
+        HarvestRun.objects.create(mindate=date(2012, 1, 1), maxdate=date(2012, 2, 2),
+                                  status='complete')
+        opts = fetch_pmc_cmd._date_opts(c, None, None, True)
+        self.assertEquals(opts['mindate'], '2012/02/03')
+        HarvestRun.objects.all().delete()
 
         # pass in good dates for min and max
         opts = fetch_pmc_cmd._date_opts(c, '2012/01/01', '2012/02/02', False)
@@ -501,7 +911,7 @@ class FetchPMCMetadataTest(TestCase):
         opts = fetch_pmc_cmd._date_opts(c, '2012/01/01', '2012/02/02', True)
         self.assertEquals(opts['datetype'], 'edat')
         self.assertEquals(opts['mindate'], '2011/09/07')
-        self.assertEquals(opts['maxdate'], datetime.strftime(datetime.now()+ timedelta(1), '%Y/%m/%d'))
+        self.assertEquals(opts['maxdate'], datetime.strftime(datetime.now() - timedelta(1), '%Y/%m/%d'))
 
         # no max date
         with self.assertRaises(CommandError) as context:
@@ -532,4 +942,49 @@ class FetchPMCMetadataTest(TestCase):
         with self.assertRaises(CommandError) as context:
             fetch_pmc_cmd._date_opts(c, '2013/01/01', '2012/01/01', False)
 
-        self.assertEqual(context.exception.message, 'Max date must be greter than Min date')
\ No newline at end of file
+        self.assertEqual(context.exception.message, 'Max date must be greter than Min date')
+
+class HarvestBenchmarkTest(TestCase):
+    fixtures = ['site_admin_group', 'users', 'harvest_records']
+
+    def test_replay_server(self):
+        with EUtilsReplayServer(45) as server:
+            with patch.object(EntrezClient, 'ESEARCH', server.query_root + 'esearch.fcgi?'):
+                with patch.object(EntrezClient, 'EFETCH', server.query_root + 'efetch.fcgi?'):
+                    entrez = EntrezClient()
+                    self.assertEqual(45, entrez.esearch(term='emory').count)
+                    # last partial chunk, with articles repeated from the fixture
+                    response = entrez.efetch(retstart=40, retmax=20)
+        self.assertEqual(range(BENCHMARK_PMCID_BASE + 40, BENCHMARK_PMCID_BASE + 45),
+                         [a.docid for a in response.articles])
+        self.assert_(all(a.article_title for a in response.articles))
+        self.assertEqual({'esearch.fcgi': 1, 'efetch.fcgi': 1}, dict(server.requests))
+
+    def test_benchmark(self):
+        # records and runs not created by the benchmark are left alone
+        other_run = HarvestRun.objects.create(mindate=date(2012, 1, 1),
+                                              maxdate=date(2012, 2, 2),
+                                              status='complete')
+        HarvestRecord.objects.create(pmcid=BENCHMARK_PMCID_BASE + 1000,
+                                     title='not a benchmark article')
+        records = HarvestRecord.objects.count()
+        results = HarvestBenchmark(30, count=10, threads=0).run()
+        self.assertEqual(30, results['articles'])
+        self.assertEqual(30, results['harvested'] + results['noauthor'] + results['errors'])
+        self.assert_(results['harvested'], 'articles with Emory emails should be harvested')
+        self.assertEqual(3, results['requests']['efetch.fcgi'])
+        self.assert_('fetch' in results['stages'])
+        self.assert_(results['peak_memory_kb'] > 0)
+        # benchmark records, runs and author are removed
+        self.assertEqual(records, HarvestRecord.objects.count())
+        self.assertEqual([other_run.pk], list(HarvestRun.objects.values_list('pk', flat=True)))
+        self.assertFalse(User.objects.filter(username=BENCHMARK_USERNAME).exists())
+
+    def test_benchmark_command_debug(self):
+        # refuses to run against the site database without DEBUG or --force
+        cmd = benchmark_cmd()
+        cmd.stdout = StringIO()
+        with override_settings(DEBUG=False):
+            self.assertRaises(CommandError, cmd.handle, verbosity=0,
+                              force=False, articles='10')
+        self.assertFalse(HarvestRecord.objects.filter(pmcid__gte=BENCHMARK_PMCID_BASE).exists())
@@ -20,7 +20,7 @@ from django.views.decorators.http import require_http_methods
 
 from openemory.accounts.auth import permission_required
 from openemory.harvest.models import HarvestRecord
-from openemory.util import  paginate
+from openemory.util import keyset_paginate
 
 import logging
 
@@ -31,8 +31,12 @@ def queue(request):
     '''Display the queue of harvested records. '''
 
     # - Restrict to only harvested records (which can be ingested or ignored)
-    records = HarvestRecord.objects.filter(status='harvested').order_by('harvested').all()
-    results, show_pages = paginate(request, records)
+    # - status and harvested date are indexed together; id makes the
+    #   ordering unique for keyset pagination
+    records = HarvestRecord.objects.filter(status='harvested') \
+                                   .prefetch_related('authors')
+    results, show_pages = keyset_paginate(request, records,
+                                          ordering=('harvested', 'id'))
     template_name = 'harvest/queue.html'
     # for ajax requests, only display the inner content
     if request.is_ajax():
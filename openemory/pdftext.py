@@ -0,0 +1,119 @@
+# file openemory/pdftext.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''
+Text extraction from PDF documents with :mod:`pdfminer`, one page at
+a time, with optional limits on the number of pages and characters.
+
+This module intentionally does not depend on django, so that it can be
+run as a script in a separate process (see
+:meth:`openemory.util.pdf_to_text`)::
+
+    python -m openemory.pdftext [--max-pages N] [--max-chars N] [--no-layout] file.pdf
+
+Extracted text is written to standard output, UTF-8 encoded.
+
+'''
+
+from cStringIO import StringIO
+from optparse import OptionParser
+import re
+import sys
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfparser import PDFParser, PDFDocument
+
+
+_illegal_xml_re = re.compile(u'[\x00-\x08\x0b-\x1f\x7f-\x84\x86-\x9f\ud800-\udfff\ufdd0-\ufddf\ufffe-\uffff]')
+
+def strip_xml_invalids(text):
+    '''Remove characters that are not allowed in XML (e.g., for
+    indexing in Solr).'''
+    return _illegal_xml_re.sub('', text)
+
+
+def pdf_pages_text(pdfstream, layout=True, max_pages=None):
+    '''Generator that extracts text from a PDF, one page at a time.
+
+    :param pdfstream: file-like object with PDF content
+    :param layout: run pdfminer layout analysis (slower, but results
+        in better ordering and spacing of text)
+    :param max_pages: optional maximum number of pages to process
+    :returns: generator of unicode text per page
+    '''
+    rsrcmgr = PDFResourceManager()
+    retstr = StringIO()
+    laparams = LAParams() if layout else None
+    device = TextConverter(rsrcmgr, retstr, codec='utf-8', laparams=laparams)
+    try:
+        parser = PDFParser(pdfstream)
+        doc = PDFDocument()
+        parser.set_document(doc)
+        doc.set_parser(parser)
+        doc.initialize('')
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for pageno, page in enumerate(doc.get_pages()):
+            if max_pages and pageno >= max_pages:
+                break
+            interpreter.process_page(page)
+            # only keep the text for the current page in memory
+            text = retstr.getvalue()
+            retstr.seek(0)
+            retstr.truncate()
+            yield text.decode('utf-8', 'ignore')
+    finally:
+        device.close()
+        retstr.close()
+
+
+def pdf_text(pdfstream, layout=True, max_pages=None, max_chars=None):
+    '''Generator of text extracted from a PDF, stopping after a
+    maximum number of pages or characters; see :meth:`pdf_pages_text`.
+
+    :param max_chars: optional maximum number of characters of text
+    '''
+    length = 0
+    for text in pdf_pages_text(pdfstream, layout=layout, max_pages=max_pages):
+        text = strip_xml_invalids(text)
+        if max_chars and length + len(text) >= max_chars:
+            yield text[:max_chars - length]
+            break
+        length += len(text)
+        yield text
+
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options] file.pdf')
+    parser.add_option('--max-pages', type='int', default=None)
+    parser.add_option('--max-chars', type='int', default=None)
+    parser.add_option('--no-layout', dest='layout', action='store_false',
+                      default=True)
+    opts, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('a single PDF file is required')
+
+    with open(args[0], 'rb') as pdf:
+        for text in pdf_text(pdf, layout=opts.layout,
+                             max_pages=opts.max_pages,
+                             max_chars=opts.max_chars):
+            sys.stdout.write(text.encode('utf-8'))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,8 @@
 
 from django.contrib import admin
 from django import forms
-from openemory.publication.models import ArticleStatistics, FeaturedArticle, License, LastRun
+from openemory.publication.models import ArticleStatistics, ArticleTotalStatistics, \
+     SiteStatistics, FeaturedArticle, License, LastRun, IngestJob
 
 class ArticleStatisticsAdmin(admin.ModelAdmin):
     list_display = ('pid', 'year', 'quarter', 'num_views', 'num_downloads')
@@ -24,6 +25,18 @@ class ArticleStatisticsAdmin(admin.ModelAdmin):
     search_fields = ('pid', 'year')
     # NOTE: may want to make these fields read-only in admin site...
 
+class ArticleTotalStatisticsAdmin(admin.ModelAdmin):
+    list_display = ('pid', 'num_views', 'num_downloads')
+    search_fields = ('pid',)
+
+class SiteStatisticsAdmin(admin.ModelAdmin):
+    list_display = ('year', 'num_views', 'num_downloads')
+
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'status', 'pid', 'created', 'updated')
+    list_filter = ('status',)
+    search_fields = ('filename', 'pid', 'user__username')
+
 class LicenseAdminForm(forms.ModelForm):
   class Meta:
     model = License
@@ -50,6 +63,9 @@ class LastRunAdmin(admin.ModelAdmin):
 
 
 admin.site.register(ArticleStatistics, ArticleStatisticsAdmin)
+admin.site.register(ArticleTotalStatistics, ArticleTotalStatisticsAdmin)
+admin.site.register(SiteStatistics, SiteStatisticsAdmin)
 admin.site.register(License, LicenseAdmin)
 admin.site.register(FeaturedArticle)
 admin.site.register(LastRun, LastRunAdmin)
+admin.site.register(IngestJob, IngestJobAdmin)
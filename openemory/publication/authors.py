@@ -0,0 +1,119 @@
+# file openemory/publication/authors.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''
+Caching for identifying article authors (see
+:meth:`openemory.publication.models.NlmArticle.identifiable_authors`).
+
+Harvested articles often share Emory authors, and identifying an author
+requires a database query and, if the author is not in the local
+database, an LDAP look-up.  An :class:`AuthorLookupCache` shared by
+everything identifying authors during a harvest keeps the result of each
+look-up, including authors who could not be found, for a limited time.
+
+'''
+
+from collections import defaultdict
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class AuthorLookupCache(object):
+    '''Thread-safe cache of author email addresses resolved to
+    :class:`~django.contrib.auth.models.User` objects.  Emails that could
+    not be resolved are cached too (negative caching), so they are not
+    looked up again for every article they appear in.
+
+    :param timeout: number of seconds to cache each look-up; defaults to
+        **AUTHOR_LOOKUP_CACHE_TIMEOUT** if configured in django settings,
+        or one hour
+    '''
+
+    def __init__(self, timeout=None):
+        if timeout is None:
+            timeout = getattr(settings, 'AUTHOR_LOOKUP_CACHE_TIMEOUT', 3600)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # email -> (expiration time, user or None, derive)
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email, derive=False):
+        '''Find a cached look-up for an email address.  A cached failure
+        to find a user only counts if the original look-up tried at least
+        as hard (see **derive** in
+        :meth:`~openemory.publication.models.NlmArticle.identifiable_authors`).
+
+        :returns: tuple of a boolean indicating whether the email was
+            found in the cache, and the cached user (or None)
+        '''
+        with self._lock:
+            entry = self._cache.get(email)
+            if entry is not None:
+                expires, user, cached_derive = entry
+                if expires < time.time():
+                    del self._cache[email]
+                elif user is not None or cached_derive or not derive:
+                    self.hits += 1
+                    return True, user
+            self.misses += 1
+            return False, None
+
+    def set(self, email, user, derive=False):
+        '''Cache the user found for an email address (or None, if no
+        user was found).'''
+        with self._lock:
+            self._cache[email] = (time.time() + self.timeout, user, derive)
+
+    def prefetch(self, emails):
+        '''Look up all of the specified email addresses that are not
+        already cached in the local database, with a single query, and
+        cache the ones that belong to exactly one user.  Any others are
+        left to be looked up individually.'''
+        now = time.time()
+        with self._lock:
+            missing = [email for email in set(emails)
+                       if email not in self._cache or self._cache[email][0] < now]
+        if not missing:
+            return
+
+        users = defaultdict(list)
+        for user in User.objects.filter(email__in=missing):
+            users[user.email].append(user)
+        for email, matches in users.iteritems():
+            if len(matches) == 1:
+                self.set(email, matches[0])
+        logger.debug('Prefetched %d of %d author emails from the database' \
+                     % (len(users), len(missing)))
+
+    def clear(self):
+        '''Remove all cached look-ups and reset counters.'''
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    def report(self):
+        '''Summary of cache hits and misses, as a string.'''
+        total = self.hits + self.misses
+        return '%d hits, %d misses (%.0f%% hit rate)' % \
+               (self.hits, self.misses, 100.0 * self.hits / max(total, 1))
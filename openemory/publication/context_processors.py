@@ -17,8 +17,8 @@
 from datetime import date
 from django.db.models import Sum
 from openemory.publication.forms import BasicSearchForm
-from openemory.publication.models import Article, ArticleStatistics
-from openemory.util import solr_interface
+from openemory.publication.models import Article, SiteStatistics
+from openemory.util import solr_interface, CachedStatistics
 
 def search_form(request):
     '''`Template context processor
@@ -34,8 +34,11 @@ def statistics(request):
     to add publication statistics to page context under the name
     ARTICLE_STATISTICS. The object has five properties: ``total_articles``,
     ``year_views``, ``year_downloads``, ``total_views``, and
-    ``total_downloads``.'''
+    ``total_downloads``.  Statistics are only calculated when used, and are
+    cached (see :class:`~openemory.util.CachedStatistics`).'''
+    return { 'ARTICLE_STATISTICS': CachedStatistics('articles', _article_statistics) }
 
+def _article_statistics():
     solr_query = solr_interface().query() \
                                  .filter(content_model=Article.ARTICLE_CONTENT_MODEL,
                                          state='A') \
@@ -43,14 +46,15 @@ def statistics(request):
     article_count = solr_query.execute().result.numFound
     stats = dict(total_articles=article_count)
 
-    total_qs = ArticleStatistics.objects.all()
+    # site statistics are a rollup with one row per year
+    total_qs = SiteStatistics.objects.all()
     total_stats = total_qs.aggregate(total_views=Sum('num_views'),
                                      total_downloads=Sum('num_downloads'))
     stats.update(total_stats)
-    
-    year_qs = ArticleStatistics.objects.filter(year=date.today().year)
+
+    year_qs = SiteStatistics.objects.filter(year=date.today().year)
     year_stats = year_qs.aggregate(year_views=Sum('num_views'),
                                    year_downloads=Sum('num_downloads'))
     stats.update(year_stats)
 
-    return { 'ARTICLE_STATISTICS': stats }
+    return stats
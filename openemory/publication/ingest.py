@@ -0,0 +1,366 @@
+# file openemory/publication/ingest.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''
+Ingest of uploaded article PDFs and harvested records into the repository.
+
+Uploads can be ingested directly in the web request, or (when
+**ASYNC_INGEST** is enabled in django settings) queued as
+:class:`~openemory.publication.models.IngestJob` records and processed
+in the background by the ``process_ingest_jobs`` management command,
+so that checksum calculation, the Fedora ingest, premis events, page
+count and indexing happen outside the request.
+
+Harvested records (:class:`~openemory.harvest.models.HarvestRecord`)
+are ingested with all of their datastreams in a single Fedora save,
+either one at a time from the harvest queue or in batches with
+:meth:`ingest_harvested_records` (see the ``ingest_harvested_records``
+management command).
+
+'''
+
+import logging
+import Queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from eulfedora.server import Repository
+from eulfedora.util import RequestFailed
+from pyPdf import PdfFileReader
+from sunburnt import SolrError
+
+from openemory.harvest.models import HarvestRecord
+from openemory.publication.models import Article, AuthorName, IngestJob
+from openemory.util import md5sum, solr_interface
+
+logger = logging.getLogger(__name__)
+
+
+def init_uploaded_article(obj, user, filename, mimetype, statement='AUTHOR'):
+    '''Initialize the metadata of a new, unsaved
+    :class:`~openemory.publication.models.Article` for an uploaded PDF.
+
+    :param obj: new :class:`~openemory.publication.models.Article`
+    :param user: :class:`~django.contrib.auth.models.User` who
+        uploaded the file, who will be the object owner
+    :param filename: name of the uploaded file, used as preliminary title
+    :param mimetype: mimetype of the uploaded file
+    :param statement: legal statement the user agreed to; if
+        ``AUTHOR``, the user is added as first author
+    '''
+    # use filename as preliminary title
+    obj.label = filename
+    # copy object label into dc:title
+    obj.dc.content.title = obj.label
+    # set the username of the user as object owner
+    obj.owner = user.username
+    # ingest as inactive (not publicly visible until author edits & publishes)
+    obj.state = 'I'
+    # for now, use the content type passed by the browser (even though we know it is unreliable)
+    # eventually, we'll want to use mime magic to inspect files before ingest
+    obj.pdf.mimetype = mimetype
+    obj.dc.content.format = obj.pdf.mimetype
+
+    # set static MODS values that will be the same for all uploaded articles
+    obj.descMetadata.content.resource_type = 'text'
+    obj.descMetadata.content.genre = 'Article'
+    obj.descMetadata.content.create_physical_description()
+    obj.descMetadata.content.physical_description.media_type = 'application/pdf'
+
+    # set current user as first author
+    if statement == 'AUTHOR':
+        obj.descMetadata.content.authors.append(AuthorName(id=user.username,
+                                                           family_name=user.last_name,
+                                                           given_name=user.first_name,
+                                                           affiliation='Emory University'))
+    return obj
+
+
+def ingest_uploaded_article(obj, user, pdf_path, collection, statement=None):
+    '''Ingest an :class:`~openemory.publication.models.Article`
+    initialized by :meth:`init_uploaded_article`, with the uploaded PDF
+    in the local file ``pdf_path``, and add the upload premis event.
+    Errors saving to Fedora (:class:`eulfedora.util.RequestFailed`) are
+    not caught here.
+
+    :param collection: collection object to which all articles belong
+        (for use with OAI)
+    :param statement: legal statement the user agreed to, or None if
+        the user did not assent to deposit
+    :returns: True if the object was saved
+    '''
+    # calculate MD5 checksum for the uploaded file before ingest
+    obj.pdf.checksum = md5sum(pdf_path)
+    obj.pdf.checksum_type = 'MD5'
+
+    # Add to OpenEmory Collection
+    obj.collection = collection
+
+    saved = obj.save('upload via OpenEmory')
+    # Modify DC namespaces for OAI
+    obj._prep_dc_for_oai()
+    saved = obj.save('Modified Namespaces for DC')
+
+    if saved:
+        #add uploaded premis event
+        obj.provenance.content.init_object(obj.pid, 'pid')
+        if not obj.provenance.content.upload_event:
+            obj.provenance.content.uploaded(user, legal_statement=statement)
+            obj.save('added upload event')
+    return saved
+
+
+def process_ingest_job(job, repo=None):
+    '''Process a queued :class:`~openemory.publication.models.IngestJob`:
+    ingest the uploaded PDF into Fedora, record the page count, and
+    index the new article in Solr.  The job is updated with the
+    resulting pid, or marked as failed with an error message; the
+    uploaded file is removed either way.
+
+    :param job: :class:`~openemory.publication.models.IngestJob`, which
+        should already be marked as processing (see
+        :meth:`~openemory.publication.models.IngestJob.claim`)
+    :param repo: :class:`eulfedora.server.Repository`; a new repository
+        connection with the default credentials is used if not specified
+    :returns: True if the article was ingested
+    '''
+    if repo is None:
+        repo = Repository()
+    start = time.time()
+    try:
+        pdf_path = job.upload.path
+    except ValueError as e:
+        # no file associated with the job
+        logger.error('No uploaded file for ingest job %d : %s' % (job.pk, e))
+        job.mark_failed('Uploaded file not found')
+        return False
+
+    # page count is read from the local copy of the PDF
+    try:
+        with open(pdf_path, 'rb') as pdf:
+            job.num_pages = PdfFileReader(pdf).getNumPages()
+    except Exception as e:
+        # pyPdf raises a variety of errors on malformed PDFs
+        logger.warn('Failed to determine number of pages for ingest job %d : %s' \
+                    % (job.pk, e))
+
+    try:
+        collection = repo.get_object(pid=settings.PID_ALIASES['oe-collection'])
+        obj = init_uploaded_article(repo.get_object(type=Article), job.user,
+                                    job.filename, job.content_type,
+                                    job.legal_statement)
+        statement = job.legal_statement if job.assent else None
+        with open(pdf_path, 'rb') as pdf:
+            obj.pdf.content = pdf
+            saved = ingest_uploaded_article(obj, job.user, pdf_path,
+                                            collection, statement)
+    except RequestFailed as rf:
+        logger.error('Error ingesting upload for ingest job %d : %s' % (job.pk, rf))
+        job.mark_failed('%s' % rf)
+        return False
+    except Exception as e:
+        # any other error (reading the upload, minting a pid, etc.) also
+        # fails the job, so it is not left processing
+        logger.exception('Unexpected error ingesting upload for ingest job %d : %s' \
+                         % (job.pk, e))
+        job.mark_failed('Error ingesting article: %s' % e)
+        return False
+
+    if not saved:
+        job.mark_failed('Article was not saved')
+        return False
+
+    job.mark_complete(obj.pid)
+    logger.info('Ingested %s for ingest job %d in %f sec' % \
+                (obj.pid, job.pk, time.time() - start))
+
+    # index the new article, so it is immediately available to the
+    # owner; indexing errors do not fail an ingested job
+    try:
+        obj = repo.get_object(obj.pid, type=Article)
+        solr = solr_interface(indexing=True)
+        solr.add(obj.index_data())
+        solr.commit()
+    except (SolrError, RequestFailed) as e:
+        logger.error('Error indexing %s for ingest job %d : %s' % \
+                     (obj.pid, job.pk, e))
+    return True
+
+
+def process_queued_jobs(repo=None, limit=None):
+    '''Claim and process queued
+    :class:`~openemory.publication.models.IngestJob` records in the
+    order they were created.  Jobs claimed by another worker process
+    are skipped.
+
+    :param limit: optional maximum number of jobs to process
+    :returns: tuple of number of jobs processed, number failed
+    '''
+    if repo is None:
+        repo = Repository()
+    processed = failed = 0
+    queued = IngestJob.objects.filter(status='queued').order_by('created') \
+                              .values_list('pk', flat=True)
+    for pk in list(queued[:limit] if limit else queued):
+        job = IngestJob.claim(pk)
+        if job is None:
+            continue
+        processed += 1
+        try:
+            ingested = process_ingest_job(job, repo)
+        except Exception as e:
+            # don't let one job stop the worker from processing the rest
+            logger.exception('Error processing ingest job %d : %s' % (job.pk, e))
+            if job.status == 'processing':
+                job.mark_failed('Error processing ingest job: %s' % e)
+            ingested = False
+        if not ingested:
+            failed += 1
+    return processed, failed
+
+
+def init_harvested_article(record, user, collection, repo=None):
+    '''Initialize (but do not save) a new
+    :class:`~openemory.publication.models.Article` from a
+    :class:`~openemory.harvest.models.HarvestRecord`, with all of its
+    datastreams (contentMetadata, descMetadata, DC prepared for OAI,
+    RELS-EXT collection membership, and the harvest premis event), so
+    that it can be ingested with a single save.
+
+    :param record: :class:`~openemory.harvest.models.HarvestRecord`
+    :param user: :class:`~django.contrib.auth.models.User` responsible
+        for the ingest, recorded in the harvest premis event
+    :param collection: collection object to which all articles belong
+        (for use with OAI)
+    '''
+    obj = record.as_publication_article(repo=repo)
+    # Add to OpenEmory Collection
+    obj.collection = collection
+    # reserve a pid now (after descMetadata is populated, where the ARK
+    # is stored), so the premis object can reference it before ingest
+    if callable(obj.pid):
+        obj.pid = obj.pid()
+    # map MODS to DC (also done on save) so DC can be modified for OAI
+    obj._mods_to_dc()
+    obj._prep_dc_for_oai()
+    #add harvested premis event
+    obj.provenance.content.init_object(obj.pid, 'pid')
+    obj.provenance.content.harvested(user, record.pmcid)
+    return obj
+
+
+def ingest_harvested_record(record, user, collection, repo=None):
+    '''Ingest a :class:`~openemory.harvest.models.HarvestRecord`
+    (which should already be marked as in process) as a new
+    :class:`~openemory.publication.models.Article`, in a single save.
+    Errors saving to Fedora (:class:`eulfedora.util.RequestFailed`) are
+    not caught here, and the record status is not updated.
+
+    :returns: the ingested :class:`~openemory.publication.models.Article`,
+        or None if it was not saved
+    '''
+    obj = init_harvested_article(record, user, collection, repo)
+    if obj.save('Ingest from harvested record PubMed Central %d' % record.pmcid):
+        return obj
+
+
+def ingest_harvested_records(ids, user, threads=4, repo=None):
+    '''Ingest a batch of :class:`~openemory.harvest.models.HarvestRecord`
+    objects.  Records that can be ingested are claimed with a single
+    update, then ingested by parallel worker threads (each with its own
+    repository connection), and the results are recorded with a single
+    update for each outcome: ingested records are marked ingested, and
+    records that failed are returned to harvested status.
+
+    :param ids: list of :class:`~openemory.harvest.models.HarvestRecord`
+        ids; records that are not in harvested status are skipped
+    :param user: :class:`~django.contrib.auth.models.User` responsible
+        for the ingest
+    :param threads: number of worker threads; if 0, records are ingested
+        in the current thread
+    :param repo: :class:`eulfedora.server.Repository`, used to find the
+        collection object and (if there are no worker threads) for
+        ingest; a new repository connection with the default credentials
+        is used if not specified
+    :returns: tuple of a dictionary of ingested record id to new pid and
+        a dictionary of failed record id to error
+    '''
+    if repo is None:
+        repo = Repository()
+    collection = repo.get_object(pid=settings.PID_ALIASES['oe-collection'])
+    records = HarvestRecord.claim_for_ingest(ids)
+
+    queue = Queue.Queue()
+    for record in records:
+        queue.put(record)
+    results = Queue.Queue()
+
+    def ingest(record, repo):
+        start = time.time()
+        try:
+            obj = ingest_harvested_record(record, user, collection, repo)
+            if obj is None:
+                results.put((record, None, 'Article was not saved'))
+            else:
+                logger.info('Ingested PMC%d as %s in %f sec' % \
+                            (record.pmcid, obj.pid, time.time() - start))
+                results.put((record, obj.pid, None))
+        except Exception as e:
+            logger.error('Error ingesting PMC%d : %s' % (record.pmcid, e))
+            results.put((record, None, e))
+
+    def worker():
+        # repository connections are not shared between threads
+        worker_repo = Repository()
+        try:
+            while True:
+                try:
+                    record = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                ingest(record, worker_repo)
+        finally:
+            # database connections are per-thread; don't leave them open
+            connection.close()
+
+    if threads:
+        workers = [threading.Thread(target=worker, name='ingest-%d' % i)
+                   for i in range(min(threads, len(records)))]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    else:
+        for record in records:
+            ingest(record, repo)
+
+    ingested, failed = {}, {}
+    ingested_records, failed_records = [], []
+    while not results.empty():
+        record, pid, error = results.get()
+        if pid is not None:
+            ingested[record.id] = pid
+            ingested_records.append(record)
+        else:
+            failed[record.id] = error
+            failed_records.append(record)
+    if ingested_records:
+        HarvestRecord.mark_all_ingested(ingested_records)
+    if failed_records:
+        HarvestRecord.mark_all_harvested(failed_records)
+    return ingested, failed
@@ -25,7 +25,7 @@ from django.core.paginator import Paginator
 
 from eulfedora.server import Repository
 
-from openemory.publication.models import Article
+from openemory.publication.models import Article, AuthorEsdResolver
 from openemory.accounts.models import EsdPerson, UserProfile
 from django.contrib.auth.models import User
 import csv
@@ -101,8 +101,11 @@ class Command(BaseCommand):
                 self.output(0,"Error getting page: %s : %s " % (p, e.message))
                 self.counts['errors'] +=1
                 continue
+            # share author ESD lookups across all articles on the page
+            esd_resolver = AuthorEsdResolver()
             for article in objs:
                 try:
+                    article.esd_resolver = esd_resolver
                     if not article.exists:
                         self.output(0, "Skipping %s because pid does not exist" % article.pid)
                         self.counts['skipped'] +=1
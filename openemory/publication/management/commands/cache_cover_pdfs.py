@@ -0,0 +1,117 @@
+# file openemory/publication/management/commands/cache_cover_pdfs.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import defaultdict
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+
+from eulfedora.server import Repository
+
+from openemory.publication.models import Article
+from openemory.publication.pdfcache import cover_pdf_cache
+from openemory.util import solr_interface
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    '''Generate and cache PDFs with cover pages for published
+    `~openemory.publication.models.Article` objects, so that downloads do not
+    have to generate them on demand.  Articles that already have an up-to-date
+    cached PDF are skipped.  If PIDs are provided in the arguments, that list
+    of pids will be used instead of searching solr.
+    '''
+    args = "[pid pid ...]"
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('--noact', '-n',
+                    action='store_true',
+                    default=False,
+                    help='Reports the pid and total number of Articles that would be processed but does not generate PDFs.'),
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])    # 1 = normal, 0 = minimal, 2 = all
+        self.v_normal = 1
+
+        #counters
+        counts = defaultdict(int)
+
+        #connection to repository
+        #uses default user / pass configured in localsettings.py
+        repo = Repository()
+
+        #if pids specified, use that list
+        if len(args) != 0:
+            #convert list into dict so both solr and pid list formats are the same
+            pid_set = [{'pid' : pid} for pid in args]
+
+        else:
+            #search for active Articles; only return the pid for each record
+            solr = solr_interface()
+            pid_set = solr.query().filter(content_model=Article.ARTICLE_CONTENT_MODEL,
+                                          state='A').field_limit('pid')
+
+        try:
+            articles = Paginator(pid_set, 20)
+            counts['total'] = articles.count
+        except Exception as e:
+            raise CommandError("Error paginating items: %s" % e)
+
+        for p in articles.page_range:
+            try:
+                objs = articles.page(p).object_list
+            except Exception as e:
+                #print error and go to next iteration of loop
+                self.output(0, "Error getting page: %s : %s " % (p, e))
+                counts['errors'] +=1
+                continue
+            for obj in objs:
+                try:
+                    article = repo.get_object(type=Article, pid=obj['pid'])
+                    if not article.exists or not article.pdf.exists:
+                        self.output(1, "Skipping %s because pid or pdf does not exist" % obj['pid'])
+                        counts['skipped'] +=1
+                        continue
+
+                    if cover_pdf_cache.is_cached(article):
+                        self.output(2, "Skipping %s because cached PDF is current" % article.pid)
+                        counts['current'] +=1
+                        continue
+
+                    self.output(1, "Processing %s" % article.pid)
+                    if not options['noact']:
+                        cover_pdf_cache.get(article)
+                    counts['cached'] +=1
+                except Exception as e:
+                    self.output(0, "Error processing pid: %s : %s " % (obj['pid'], e))
+                    counts['errors'] +=1
+
+        # summarize what was done
+        self.stdout.write("Total number selected: %s\n" % counts['total'])
+        self.stdout.write("Generated: %s\n" % counts['cached'])
+        self.stdout.write("Already current: %s\n" % counts['current'])
+        self.stdout.write("Skipped: %s\n" % counts['skipped'])
+        self.stdout.write("Errors: %s\n" % counts['errors'])
+
+
+    def output(self, v, msg):
+        '''simple function to handle logging output based on verbosity'''
+        if self.verbosity >= v:
+            self.stdout.write("%s\n" % msg)
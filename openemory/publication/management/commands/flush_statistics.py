@@ -0,0 +1,82 @@
+# file openemory/publication/management/commands/flush_statistics.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import defaultdict
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from openemory.publication.stats import stats_buffer, rebuild_totals
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    '''Drain buffered `~openemory.publication.models.ArticleStatistics`
+    view and download counts that could not be written to the database by
+    the web application (see :mod:`openemory.publication.stats`) from the
+    spool directory into the database.  Optionally regenerates the
+    all-time article and yearly site statistics rollups.
+    '''
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('--noact', '-n',
+                    action='store_true',
+                    default=False,
+                    help='Reports the spool files that would be processed but does not load them.'),
+        make_option('--rebuild-totals',
+                    action='store_true',
+                    default=False,
+                    help='Regenerate all-time article and yearly site statistics from quarterly statistics.'),
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])    # 1 = normal, 0 = minimal, 2 = all
+
+        #counters
+        counts = defaultdict(int)
+
+        for path in stats_buffer.spooled_files():
+            self.output(1, "Processing %s" % path)
+            counts['files'] += 1
+            if options['noact']:
+                continue
+            try:
+                counts['loaded'] += stats_buffer.load_spooled(path)
+            except Exception as e:
+                self.output(0, "Error loading %s : %s " % (path, e))
+                counts['errors'] += 1
+
+        if not options['noact']:
+            # anything that fails to save is spooled again for the next run
+            counts['saved'] = stats_buffer.flush()
+
+        if options['rebuild_totals'] and not options['noact']:
+            self.output(1, "Regenerating statistics totals")
+            rebuild_totals()
+
+        # summarize what was done
+        self.stdout.write("Spool files: %s\n" % counts['files'])
+        self.stdout.write("Statistics loaded: %s\n" % counts['loaded'])
+        self.stdout.write("Statistics saved: %s\n" % counts['saved'])
+        self.stdout.write("Errors: %s\n" % counts['errors'])
+
+
+    def output(self, v, msg):
+        '''simple function to handle logging output based on verbosity'''
+        if self.verbosity >= v:
+            self.stdout.write("%s\n" % msg)
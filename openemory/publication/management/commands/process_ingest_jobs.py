@@ -0,0 +1,85 @@
+# file openemory/publication/management/commands/process_ingest_jobs.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import defaultdict
+import logging
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from eulfedora.server import Repository
+
+from openemory.publication.ingest import process_queued_jobs
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    '''Ingest uploaded articles queued as
+    `~openemory.publication.models.IngestJob` records (when **ASYNC_INGEST**
+    is enabled).  By default, runs as a worker that polls for new jobs until
+    it is stopped; use ``--once`` to process the current queue and exit
+    (e.g., from cron).  More than one worker may be run at once.
+    '''
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('--once',
+                    action='store_true',
+                    default=False,
+                    help='Process currently queued jobs and exit'),
+        make_option('--sleep',
+                    type='int',
+                    default=5,
+                    help='Seconds to wait between checks for new jobs (default: %default)'),
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])    # 1 = normal, 0 = minimal, 2 = all
+        if options['sleep'] < 1:
+            raise CommandError('sleep must be at least 1 second')
+
+        #counters
+        counts = defaultdict(int)
+
+        #connection to repository
+        #uses default user / pass configured in localsettings.py
+        repo = Repository()
+
+        try:
+            while True:
+                processed, failed = process_queued_jobs(repo)
+                if processed:
+                    self.output(1, 'Processed %d jobs (%d failed)' % (processed, failed))
+                counts['processed'] += processed
+                counts['failed'] += failed
+                if options['once']:
+                    break
+                # end the current transaction so new jobs will be visible
+                transaction.commit_unless_managed()
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        # summarize what was done
+        self.stdout.write("Jobs processed: %s\n" % counts['processed'])
+        self.stdout.write("Failed: %s\n" % counts['failed'])
+
+    def output(self, v, msg):
+        '''simple function to handle logging output based on verbosity'''
+        if self.verbosity >= v:
+            self.stdout.write("%s\n" % msg)
@@ -0,0 +1,264 @@
+# file openemory/publication/management/commands/reindex_articles.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import defaultdict
+import logging
+import multiprocessing
+from optparse import make_option
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connections
+
+from eulfedora.server import Repository
+from sunburnt import SolrError
+
+from openemory.publication.models import Article, AuthorEsdResolver
+from openemory.util import solr_interface, invalidate_statistics
+
+logger = logging.getLogger(__name__)
+
+
+# per-process state for generating index data
+_repo = None
+_esd_resolver = None
+
+def _close_db_connections():
+    # database connections must not be shared across processes
+    for conn in connections.all():
+        conn.close()
+
+def _init_worker():
+    '''Initialize a worker process with its own repository connection
+    and author ESD resolver (shared by all articles indexed in the process).'''
+    global _repo, _esd_resolver
+    _close_db_connections()
+    _repo = Repository()
+    _esd_resolver = AuthorEsdResolver()
+
+def _index_data(pid):
+    '''Generate index data for a single article.
+
+    :returns: tuple of pid, index data (None if the article does not
+        exist or could not be indexed), and an error message (if any)
+    '''
+    try:
+        article = _repo.get_object(pid, type=Article)
+        if not article.exists:
+            return (pid, None, None)
+        article.esd_resolver = _esd_resolver
+        return (pid, article.index_data(), None)
+    except Exception as e:
+        return (pid, None, '%s' % e)
+
+
+class Command(BaseCommand):
+    '''Reindex `~openemory.publication.models.Article` objects in Solr.
+    Index data is generated in parallel worker processes and sent to Solr
+    in batches, with a single commit at the end.  Articles are found in
+    Fedora by content model (or in Solr, with ``--source solr``); if PIDs
+    are provided in the arguments, only those articles will be reindexed.
+
+    When a checkpoint file is specified, changes are committed every
+    ``--commit-every`` batches, and pids are recorded once their batch
+    has been committed; ``--resume`` skips any pids already recorded, so
+    an interrupted reindex can be restarted where it left off.
+    '''
+    args = "[pid pid ...]"
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('-i', '--index_url',
+                    help='Override the site default solr index URL.'),
+        make_option('--source',
+                    choices=['fedora', 'solr'],
+                    default='fedora',
+                    help='Find articles to index in fedora or solr (default: %default)'),
+        make_option('--processes', '-p',
+                    type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='Number of processes for generating index data (default: %default)'),
+        make_option('--batch-size', '-b',
+                    type='int',
+                    dest='batch_size',
+                    default=100,
+                    help='Number of articles to send to Solr at once (default: %default)'),
+        make_option('--checkpoint',
+                    help='File to record indexed pids in, for use with --resume'),
+        make_option('--resume',
+                    action='store_true',
+                    default=False,
+                    help='Skip pids already recorded in the checkpoint file'),
+        make_option('--commit-every',
+                    type='int',
+                    dest='commit_every',
+                    default=10,
+                    help='With a checkpoint file, commit and record indexed pids ' +
+                    'every this many batches (default: %default)'),
+        make_option('--noact', '-n',
+                    action='store_true',
+                    default=False,
+                    help='Reports the total number of Articles that would be indexed but does not index them.'),
+        )
+
+    v_normal = 1  # 1 = normal, 0 = minimal, 2 = all
+    v_all = 2
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])
+
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume requires a --checkpoint file')
+        if options['batch_size'] < 1 or options['processes'] < 1:
+            raise CommandError('batch size and number of processes must be at least 1')
+        if options['commit_every'] < 1:
+            raise CommandError('commit-every must be at least 1')
+        self.commit_every = options['commit_every']
+
+        try:
+            self.solr = solr_interface(options.get('index_url', None), indexing=True)
+        except socket.error as se:
+            raise CommandError('Failed to connect to Solr (%s)' % se)
+
+        #counters
+        self.counts = defaultdict(int)
+
+        if args:
+            pids = list(args)
+        elif options['source'] == 'solr':
+            pids = self.solr_pids()
+        else:
+            pids = self.fedora_pids()
+        self.counts['total'] = len(pids)
+
+        # skip anything already indexed according to the checkpoint
+        done = set()
+        if options['resume'] and os.path.exists(options['checkpoint']):
+            with open(options['checkpoint']) as checkpoint:
+                done = set(line.strip() for line in checkpoint)
+            pids = [pid for pid in pids if pid not in done]
+            self.counts['resumed'] = self.counts['total'] - len(pids)
+
+        self.output(self.v_normal, 'Found %(total)d articles; %(resumed)d already indexed' \
+                    % self.counts)
+        if options['noact'] or not pids:
+            return
+
+        self.checkpoint = None
+        # pids added to solr but not yet committed
+        self.uncommitted = []
+        self.batches = 0
+        if options['checkpoint']:
+            self.checkpoint = open(options['checkpoint'], 'a' if options['resume'] else 'w')
+
+        self.start = time.time()
+        try:
+            self.reindex(pids, options['processes'], options['batch_size'])
+            # commit all changes in Solr so they will be available
+            self.commit()
+            invalidate_statistics()
+        except SolrError as se:
+            if 'unknown field' in str(se):
+                raise CommandError('Solr unknown field error ' +
+                                   '(check that local schema matches running instance)')
+            raise CommandError('Solr error (%s)' % se)
+        finally:
+            if self.checkpoint:
+                self.checkpoint.close()
+
+        # summarize what was done
+        elapsed = time.time() - self.start
+        self.stdout.write("Total number selected: %s\n" % self.counts['total'])
+        self.stdout.write("Indexed: %s\n" % self.counts['indexed'])
+        self.stdout.write("Skipped: %s\n" % self.counts['skipped'])
+        self.stdout.write("Errors: %s\n" % self.counts['errors'])
+        self.stdout.write("Elapsed: %.1f sec (%.1f docs/sec)\n" % \
+                          (elapsed, self.counts['indexed'] / max(elapsed, 0.001)))
+
+    def fedora_pids(self):
+        repo = Repository()
+        return [obj.pid for obj in
+                repo.get_objects_with_cmodel(Article.ARTICLE_CONTENT_MODEL)]
+
+    def solr_pids(self):
+        q = self.solr.query().filter(content_model=Article.ARTICLE_CONTENT_MODEL) \
+                             .field_limit('pid')
+        pids = []
+        results = Paginator(q, 1000)
+        for p in results.page_range:
+            pids.extend(r['pid'] for r in results.page(p).object_list)
+        return pids
+
+    def reindex(self, pids, processes, batch_size):
+        if processes == 1:
+            _init_worker()
+            results = (_index_data(pid) for pid in pids)
+        else:
+            # worker processes must not inherit open database connections
+            _close_db_connections()
+            pool = multiprocessing.Pool(processes, initializer=_init_worker)
+            results = pool.imap_unordered(_index_data, pids,
+                                          chunksize=max(1, batch_size / processes))
+
+        try:
+            batch = []
+            for pid, data, error in results:
+                if error is not None:
+                    self.output(0, "Error processing pid: %s : %s " % (pid, error))
+                    self.counts['errors'] += 1
+                elif data is None:
+                    self.output(self.v_all, "Skipping %s because pid does not exist" % pid)
+                    self.counts['skipped'] += 1
+                else:
+                    self.output(self.v_all, "Processing %s" % pid)
+                    batch.append(data)
+                    if len(batch) >= batch_size:
+                        self.add_batch(batch)
+                        batch = []
+            if batch:
+                self.add_batch(batch)
+        finally:
+            if processes != 1:
+                pool.terminate()
+                pool.join()
+
+    def add_batch(self, batch):
+        self.solr.add(batch)
+        self.counts['indexed'] += len(batch)
+        self.uncommitted.extend(data['pid'] for data in batch)
+        self.batches += 1
+        # pids are only checkpointed once committed, so a resumed reindex
+        # does not skip documents lost before a commit
+        if self.checkpoint and self.batches % self.commit_every == 0:
+            self.commit()
+        elapsed = time.time() - self.start
+        self.output(self.v_normal, 'Indexed %d articles (%.1f docs/sec)' % \
+                    (self.counts['indexed'], self.counts['indexed'] / max(elapsed, 0.001)))
+
+    def commit(self):
+        self.solr.commit()
+        if self.checkpoint and self.uncommitted:
+            self.checkpoint.write(''.join('%s\n' % pid for pid in self.uncommitted))
+            self.checkpoint.flush()
+        self.uncommitted = []
+
+    def output(self, v, msg):
+        '''simple function to handle logging output based on verbosity'''
+        if self.verbosity >= v:
+            self.stdout.write("%s\n" % msg)
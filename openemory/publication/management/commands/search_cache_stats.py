@@ -0,0 +1,77 @@
+# file openemory/publication/management/commands/search_cache_stats.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import logging
+from optparse import make_option
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from openemory.util import search_cache_stats, invalidate_search_cache
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    '''Report search result cache statistics (hits, misses, and expired,
+    invalidated and evicted results) totalled across all site processes,
+    for tuning **SEARCH_CACHE_TIMEOUT** and **SEARCH_CACHE_MAX_ENTRIES**.
+    Optionally resets the statistics or invalidates all cached results.
+    '''
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('--reset', '-r',
+                    action='store_true',
+                    default=False,
+                    help='Reset the statistics after reporting them'),
+        make_option('--invalidate',
+                    action='store_true',
+                    default=False,
+                    help='Invalidate all cached search results'),
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])    # 1 = normal, 0 = minimal, 2 = all
+
+        if isinstance(cache, LocMemCache):
+            # statistics and invalidation are per-process with a memory cache
+            self.stderr.write('Warning: the django cache is not shared between processes; ' +
+                              'configure CACHES to report statistics or invalidate ' +
+                              'results for the site\n')
+
+        stats = search_cache_stats(reset=options['reset'])
+        self.output(1, 'Timeout: %s sec; maximum entries per process: %s' % \
+                    (getattr(settings, 'SEARCH_CACHE_TIMEOUT', 60),
+                     getattr(settings, 'SEARCH_CACHE_MAX_ENTRIES', 500)))
+        self.stdout.write("Hits: %s\n" % stats['hits'])
+        self.stdout.write("Misses: %s\n" % stats['misses'])
+        self.stdout.write("Hit rate: %.1f%%\n" % (100 * stats['hit_rate']))
+        self.stdout.write("Expired: %s\n" % stats['expired'])
+        self.stdout.write("Invalidated: %s\n" % stats['invalidated'])
+        self.stdout.write("Evicted: %s\n" % stats['evicted'])
+        if options['reset']:
+            self.output(1, 'Statistics reset')
+
+        if options['invalidate']:
+            invalidate_search_cache()
+            self.output(1, 'Cached search results invalidated')
+
+    def output(self, v, msg):
+        '''simple function to handle logging output based on verbosity'''
+        if self.verbosity >= v:
+            self.stdout.write("%s\n" % msg)
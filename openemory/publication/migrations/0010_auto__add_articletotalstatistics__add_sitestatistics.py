@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'ArticleTotalStatistics'
+        db.create_table('publication_articletotalstatistics', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('pid', self.gf('django.db.models.fields.CharField')(unique=True, max_length=50)),
+            ('num_views', self.gf('django.db.models.fields.IntegerField')(default=0, db_index=True)),
+            ('num_downloads', self.gf('django.db.models.fields.IntegerField')(default=0, db_index=True)),
+        ))
+        db.send_create_signal('publication', ['ArticleTotalStatistics'])
+
+        # Adding model 'SiteStatistics'
+        db.create_table('publication_sitestatistics', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('year', self.gf('django.db.models.fields.IntegerField')(unique=True)),
+            ('num_views', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('num_downloads', self.gf('django.db.models.fields.IntegerField')(default=0)),
+        ))
+        db.send_create_signal('publication', ['SiteStatistics'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'ArticleTotalStatistics'
+        db.delete_table('publication_articletotalstatistics')
+
+        # Deleting model 'SiteStatistics'
+        db.delete_table('publication_sitestatistics')
+
+
+    models = {
+        'publication.articlerecord': {
+            'Meta': {'object_name': 'ArticleRecord'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'publication.articletotalstatistics': {
+            'Meta': {'object_name': 'ArticleTotalStatistics'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'num_downloads': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'num_views': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'pid': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'})
+        },
+        'publication.articlestatistics': {
+            'Meta': {'unique_together': "(('pid', 'year', 'quarter'),)", 'object_name': 'ArticleStatistics'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'num_downloads': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'num_views': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'pid': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'quarter': ('django.db.models.fields.IntegerField', [], {}),
+            'year': ('django.db.models.fields.IntegerField', [], {})
+        },
+        'publication.featuredarticle': {
+            'Meta': {'object_name': 'FeaturedArticle'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'pid': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '60'})
+        },
+        'publication.lastrun': {
+            'Meta': {'object_name': 'LastRun'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'start_time': ('django.db.models.fields.DateTimeField', [], {})
+        },
+        'publication.license': {
+            'Meta': {'object_name': 'License'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'short_name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'}),
+            'title': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '100'}),
+            'url': ('django.db.models.fields.URLField', [], {'unique': 'True', 'max_length': '200'}),
+            'version': ('django.db.models.fields.CharField', [], {'max_length': '5'})
+        },
+        'publication.sitestatistics': {
+            'Meta': {'object_name': 'SiteStatistics'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'num_downloads': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'num_views': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'year': ('django.db.models.fields.IntegerField', [], {'unique': 'True'})
+        }
+    }
+
+    complete_apps = ['publication']
\ No newline at end of file
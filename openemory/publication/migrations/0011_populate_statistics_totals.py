@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        "Populate all-time article and yearly site statistics from quarterly statistics."
+        for st in orm.ArticleStatistics.objects.values('pid') \
+                     .annotate(views=models.Sum('num_views'),
+                               downloads=models.Sum('num_downloads')):
+            orm.ArticleTotalStatistics.objects.create(pid=st['pid'],
+                num_views=st['views'], num_downloads=st['downloads'])
+
+        for st in orm.ArticleStatistics.objects.values('year') \
+                     .annotate(views=models.Sum('num_views'),
+                               downloads=models.Sum('num_downloads')):
+            orm.SiteStatistics.objects.create(year=st['year'],
+                num_views=st['views'], num_downloads=st['downloads'])
+
+    def backwards(self, orm):
+        "Remove all-time article and yearly site statistics."
+        orm.ArticleTotalStatistics.objects.all().delete()
+        orm.SiteStatistics.objects.all().delete()
+
+    models = {
+        'publication.articlerecord': {
+            'Meta': {'object_name': 'ArticleRecord'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'publication.articletotalstatistics': {
+            'Meta': {'object_name': 'ArticleTotalStatistics'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'num_downloads': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'num_views': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'pid': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'})
+        },
+        'publication.articlestatistics': {
+            'Meta': {'unique_together': "(('pid', 'year', 'quarter'),)", 'object_name': 'ArticleStatistics'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'num_downloads': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'num_views': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'pid': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'quarter': ('django.db.models.fields.IntegerField', [], {}),
+            'year': ('django.db.models.fields.IntegerField', [], {})
+        },
+        'publication.featuredarticle': {
+            'Meta': {'object_name': 'FeaturedArticle'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'pid': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '60'})
+        },
+        'publication.lastrun': {
+            'Meta': {'object_name': 'LastRun'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'start_time': ('django.db.models.fields.DateTimeField', [], {})
+        },
+        'publication.license': {
+            'Meta': {'object_name': 'License'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'short_name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'}),
+            'title': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '100'}),
+            'url': ('django.db.models.fields.URLField', [], {'unique': 'True', 'max_length': '200'}),
+            'version': ('django.db.models.fields.CharField', [], {'max_length': '5'})
+        },
+        'publication.sitestatistics': {
+            'Meta': {'object_name': 'SiteStatistics'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'num_downloads': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'num_views': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'year': ('django.db.models.fields.IntegerField', [], {'unique': 'True'})
+        }
+    }
+
+    complete_apps = ['publication']
+    symmetrical = True
\ No newline at end of file
@@ -23,7 +23,6 @@ from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.template import Context
@@ -33,8 +32,6 @@ from django.utils.safestring import mark_safe
 from eulfedora.models import FileDatastream, \
      XmlDatastream, Relation
 from eulfedora.util import RequestFailed, parse_rdf
-#from eulfedora.indexdata.util import pdf_to_text
-from openemory.util import pdf_to_text
 from eulfedora.rdfns import relsext, oai
 from eulfedora.rdfns import model as relsextns
 from eullocal.django.emory_ldap.backends import EmoryLDAPBackend
@@ -57,6 +54,7 @@ from openemory.common.fedora import DigitalObject
 from openemory.rdfns import DC, BIBO, FRBR, ns_prefixes
 from openemory.util import pmc_access_url
 from openemory.util import solr_interface
+from openemory.publication.pdfcache import cover_pdf_cache, fulltext_cache
 from openemory.publication.symp import SympAtom
 
 logger = logging.getLogger(__name__)
@@ -666,8 +664,19 @@ class NlmArticle(xmlmap.XmlObject):
         article is included in the fetched article.'''
         return self.body != None
 
+    @property
+    def emory_emails(self):
+        '''Emory email addresses for the article authors, either in
+        author information or as corresponding author.'''
+        # find all author emails, either in author information or corresponding author
+        emails = set(auth.email for auth in self.authors if auth.email)
+        emails.update(self.corresponding_author_emails)
+        # filter to just include the emory email addresses
+        # TODO: other acceptable variant emory emails ? emoryhealthcare.org ? 
+        return [e for e in emails if 'emory.edu' in e ]
+
     _identified_authors = None
-    def identifiable_authors(self, refresh=False, derive=False):
+    def identifiable_authors(self, refresh=False, derive=False, cache=None):
         '''Identify any Emory authors for the article and, if
         possible, return a list of corresponding
         :class:`~django.contrib.auth.models.User` objects.
@@ -687,37 +696,43 @@ class NlmArticle(xmlmap.XmlObject):
 
         By default, caches the identified authors on the first
         look-up, in order to avoid unecessarily repeating LDAP
-        queries.  
+        queries.  To share look-ups across articles (e.g., when
+        harvesting), pass in an
+        :class:`~openemory.publication.authors.AuthorLookupCache`;
+        previously cached look-ups are not used when refresh is True.
         '''
 
         if self._identified_authors is None or refresh:
-            # find all author emails, either in author information or corresponding author
-            emails = set(auth.email for auth in self.authors if auth.email)
-            emails.update(self.corresponding_author_emails)
-            # filter to just include the emory email addresses
-            # TODO: other acceptable variant emory emails ? emoryhealthcare.org ? 
-            emory_emails = [e for e in emails if 'emory.edu' in e ]
-
             # generate a list of User objects based on the list of emory email addresses
             self._identified_authors = []
-            for em in emory_emails:
-                # if the user is already in the local database, use that
-                db_user = User.objects.filter(email=em)
-                if db_user.count() == 1:
-                    self._identified_authors.append(db_user.get())
-
-                # otherwise, try to look them up in ldap 
-                else:
-                    ldap = EmoryLDAPBackend()
-                    # log ldap requests; using repr so it is evident when ldap is a Mock
-                    logger.debug('Looking up user in LDAP by email \'%s\' (using %r)' \
-                                 % (em, ldap))
-                    user_dn, user = ldap.find_user_by_email(em, derive)
-                    if user:
-                        self._identified_authors.append(user)
+            for em in self.emory_emails:
+                found, user = False, None
+                if cache is not None and not refresh:
+                    found, user = cache.get(em, derive)
+                if not found:
+                    user = self._find_author(em, derive)
+                    if cache is not None:
+                        cache.set(em, user, derive)
+                if user:
+                    self._identified_authors.append(user)
 
         return self._identified_authors
 
+    def _find_author(self, email, derive=False):
+        # look up a single author by email address; returns a User or None
+        # if the user is already in the local database, use that
+        db_user = User.objects.filter(email=email)
+        if db_user.count() == 1:
+            return db_user.get()
+
+        # otherwise, try to look them up in ldap 
+        ldap = EmoryLDAPBackend()
+        # log ldap requests; using repr so it is evident when ldap is a Mock
+        logger.debug('Looking up user in LDAP by email \'%s\' (using %r)' \
+                     % (email, ldap))
+        user_dn, user = ldap.find_user_by_email(email, derive)
+        return user or None
+
     def as_article_mods(self):
         amods = ArticleMods()
         # title & subtitle
@@ -1019,6 +1034,68 @@ def year_quarter(month):
     return (month-1)/3+1
 
 
+class AuthorEsdResolver(object):
+    '''Memoized lookup of ESD information for article authors by netid.
+    Local user profiles, their positions, and the corresponding
+    ``EsdPerson`` records for any netids not already resolved are
+    fetched with a small number of bulk queries; results (including
+    netids with no ESD information) are reused for all subsequent
+    lookups.  A single resolver can be shared by a batch of
+    :class:`Article` objects (see :attr:`Article.esd_resolver`), e.g.
+    when reindexing, with :meth:`load` called once for all of their
+    authors.
+    '''
+
+    def __init__(self):
+        self._esd = {}           # netid -> EsdPerson or None
+        self._affiliations = {}  # netid -> list of position names
+
+    def load(self, netids):
+        '''Bulk load ESD information for any of the specified netids
+        that have not already been resolved.'''
+        missing = set(netid for netid in netids if netid not in self._esd)
+        if not missing:
+            return
+        for netid in missing:
+            self._esd[netid] = None
+            self._affiliations[netid] = []
+
+        # NOTE: accessing profile & esd models indirectly to avoid a
+        # circular dependency on accounts; see Article.split_department
+        app_label, model_name = settings.AUTH_PROFILE_MODULE.split('.')
+        profile_model = models.get_model(app_label, model_name)
+        esd_model = profile_model.esd_model()
+
+        profiles = profile_model.objects.filter(user__username__in=missing) \
+                                .select_related('user') \
+                                .prefetch_related('position_set')
+        profiles = dict((p.user.username, p) for p in profiles)
+        if not profiles:
+            return
+        # ESD netids are always all-caps
+        usernames = dict((username.upper(), username) for username in profiles)
+        for esd in esd_model.objects.filter(netid__in=usernames.keys()):
+            username = usernames.get(esd.netid)
+            if username is None:
+                continue
+            self._esd[username] = esd
+            self._affiliations[username] = [str(pos) for pos
+                                            in profiles[username].position_set.all()]
+
+    def author_esd(self, netids):
+        '''List of ``EsdPerson`` records for the specified netids, in
+        order, skipping any netids without a local profile or ESD record.'''
+        self.load(netids)
+        return [self._esd[netid] for netid in netids
+                if self._esd[netid] is not None]
+
+    def affiliations(self, netids):
+        '''List of position names for the specified netids, in order.'''
+        self.load(netids)
+        return [aff for netid in netids if self._esd[netid] is not None
+                for aff in self._affiliations[netid]]
+
+
 class Article(DigitalObject):
     '''Subclass of :class:`~openemory.common.fedora.DigitalObject` to
     represent Scholarly Articles.
@@ -1204,7 +1281,11 @@ class Article(DigitalObject):
         # map MODS values into DC
         self._mods_to_dc()
 
-        return super(Article, self).save(*args, **kwargs)
+        saved = super(Article, self).save(*args, **kwargs)
+        # any cached cover page PDFs are now out of date
+        if isinstance(self.pid, basestring):
+            cover_pdf_cache.invalidate(self.pid)
+        return saved
 
     def as_rdf(self, node=None):
         '''Information about this Article in RDF format.  Currently,
@@ -1260,7 +1341,8 @@ class Article(DigitalObject):
         # add full document text from pdf if available and not embargoed
         if self.pdf.exists and not self.is_embargoed:
             try:
-                data['fulltext'] = pdf_to_text(self.pdf.content)
+                # text is only extracted again if the pdf has changed
+                data['fulltext'] = fulltext_cache.get(self)
             except Exception as e:
                 # errors if datastream cannot be read as a pdf
                 # (should be less of an issue after we add format validation)
@@ -1355,24 +1437,28 @@ class Article(DigitalObject):
         mods = self.descMetadata.content
         return [a.id for a in mods.authors if a.id]
 
+    _esd_resolver = None
+
+    @property
+    def esd_resolver(self):
+        ''':class:`AuthorEsdResolver` used to look up author ESD
+        information; created on first use unless one shared by a batch
+        of articles has been set.'''
+        if self._esd_resolver is None:
+            self._esd_resolver = AuthorEsdResolver()
+        return self._esd_resolver
+
+    @esd_resolver.setter
+    def esd_resolver(self, resolver):
+        self._esd_resolver = resolver
+
     @property
     def author_esd(self):
-        result = []
-        for netid in self.author_netids:
-            try:
-                user = User.objects.get(username=netid)
-                profile = user.get_profile()
-                esd = profile.esd_data()
-                result.append(esd)
-            except ObjectDoesNotExist:
-                pass
-        return result
+        return self.esd_resolver.author_esd(self.author_netids)
 
     @property
     def affiliations(self):
-        return [str(aff)
-                for esd in self.author_esd
-                for aff in esd.affiliations]
+        return self.esd_resolver.affiliations(self.author_netids)
 
     @property
     def department_name(self):
@@ -1520,6 +1606,10 @@ class Article(DigitalObject):
 
     ### PDF generation methods for Article cover page ###
 
+    PDF_SPOOL_MAX_SIZE = 5 * 1024 * 1024
+    '''Size in bytes above which PDF datastream content is spooled to a
+    temporary file instead of memory when adding a cover page.'''
+
                 
     def pdf_cover(self):
         '''Generate a PDF cover page based on the MODS descriptive
@@ -1551,7 +1641,7 @@ class Article(DigitalObject):
         if not pdf.err:
             return result
 
-    def pdf_with_cover(self):
+    def pdf_with_cover(self, outfile=None):
         '''Return the PDF associated with this article (the contents
         of the :attr:`pdf` datastream) with a custom cover page
         (generated by :meth:`pdf_cover`).
@@ -1564,8 +1654,11 @@ class Article(DigitalObject):
           datastream exists but the PDF is unreadable with \
           :mod:`pyPdf`). 
 
+        :param outfile: optional file-like object to write the merged
+          pdf to; if not specified, the merged pdf is written to and
+          returned in a new buffer
         :returns: :class:`cStringIO.StringIO` instance with the \
-        merged pdf content
+          merged pdf content, or the ``outfile`` if one was specified
         '''
         # NOTE: pyPdf PdfFileWrite currently does not supply a
         # mechanism to set document info / metadata (title, author, etc.)
@@ -1575,7 +1668,9 @@ class Article(DigitalObject):
         
         coverdoc = self.pdf_cover() 
         start = time.time()
-        pdfstream = StringIO()  # io buffer for pdf datastream content
+        # temporary file for pdf datastream content; large PDFs are
+        # spooled to disk instead of being held in memory
+        pdfstream = tempfile.SpooledTemporaryFile(max_size=self.PDF_SPOOL_MAX_SIZE)
         try:
             # create a new pdf file writer to merge cover & pdf into
             doc = PdfFileWriter()
@@ -1590,17 +1685,18 @@ class Article(DigitalObject):
             for p in range(content.numPages):
                 doc.addPage(content.pages[p])
 
-            # write the resulting pdf to a buffer and return it
-            result = StringIO()
+            # write the resulting pdf to the output file or a new buffer
+            result = outfile if outfile is not None else StringIO()
             doc.write(result)
-            # seek to beginning for re-use (e.g., django httpresponse content)
-            result.seek(0)
+            if outfile is None:
+                # seek to beginning for re-use (e.g., django httpresponse content)
+                result.seek(0)
             logger.debug('Added cover page to PDF for %s in %f sec ' % \
                          (self.pid, time.time() - start))
             return result
         finally:
             coverdoc.close()  # delete xsl-fo
-            pdfstream.close() # close iostream for pdf content
+            pdfstream.close() # close temporary file for pdf content
 
 
 
@@ -1778,6 +1874,99 @@ class ArticleStatistics(models.Model):
         verbose_name_plural = 'Article Statistics'
 
 
+class ArticleTotalStatistics(models.Model):
+    '''All-time access statistics for a single :class:`Article`; a
+    rollup of all :class:`ArticleStatistics` for the pid, maintained
+    when statistics are saved (see :mod:`openemory.publication.stats`)
+    so that most viewed and downloaded articles can be found without
+    aggregating all statistics.
+    '''
+    pid = models.CharField(max_length=50, unique=True)
+    num_views = models.IntegerField(default=0, db_index=True,
+            help_text='metadata view page loads')
+    num_downloads = models.IntegerField(default=0, db_index=True,
+            help_text='article PDF downloads')
+
+    class Meta:
+        verbose_name_plural = 'Article Total Statistics'
+
+
+class SiteStatistics(models.Model):
+    '''Access statistics for all articles in a single year; a rollup
+    of all :class:`ArticleStatistics` for the year, maintained when
+    statistics are saved.
+    '''
+    year = models.IntegerField(unique=True)
+    num_views = models.IntegerField(default=0,
+            help_text='metadata view page loads')
+    num_downloads = models.IntegerField(default=0,
+            help_text='article PDF downloads')
+
+    class Meta:
+        verbose_name_plural = 'Site Statistics'
+
+
+class IngestJob(models.Model):
+    '''An uploaded article PDF queued for ingest into the repository
+    in the background (see :mod:`openemory.publication.ingest`).  The
+    uploaded file is kept until the job has been processed.
+    '''
+    STATUSES = ('queued', 'processing', 'complete', 'failed')
+    DEFAULT_STATUS = STATUSES[0]
+    STATUS_CHOICES = [(val, val) for val in STATUSES]
+    user = models.ForeignKey(User)
+    status = models.CharField(choices=STATUS_CHOICES, max_length=25,
+                              default=DEFAULT_STATUS, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    upload = models.FileField(upload_to='ingest/%Y/%m/%d', blank=True)
+    filename = models.CharField(max_length=255,
+            help_text='name of the uploaded file')
+    content_type = models.CharField(max_length=100)
+    legal_statement = models.CharField(max_length=25, blank=True)
+    assent = models.BooleanField(default=False)
+    pid = models.CharField(max_length=60, blank=True,
+            help_text='pid of the ingested article')
+    num_pages = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __unicode__(self):
+        return '%s (%s)' % (self.filename, self.status)
+
+    @classmethod
+    def claim(cls, pk):
+        '''Mark a queued job as processing, if no other process has
+        already done so.
+
+        :returns: the :class:`IngestJob`, or None if it was not claimed
+        '''
+        if cls.objects.filter(pk=pk, status='queued').update(status='processing'):
+            return cls.objects.get(pk=pk)
+
+    @property
+    def done(self):
+        'Boolean indicating processing is finished (complete or failed)'
+        return self.status in ('complete', 'failed')
+
+    def mark_complete(self, pid):
+        '''Mark this job as complete, with the pid of the ingested
+        article.  Removes the uploaded file.'''
+        self.status = 'complete'
+        self.pid = pid
+        if self.upload:
+            self.upload.delete(save=False)
+        self.save()
+
+    def mark_failed(self, error):
+        '''Mark this job as failed, with an error message.  Removes the
+        uploaded file.'''
+        self.status = 'failed'
+        self.error = error
+        if self.upload:
+            self.upload.delete(save=False)
+        self.save()
+
+
 ### simple XmlObject mapping to access LOC codelist document for MARC
 ### language names & codes
 
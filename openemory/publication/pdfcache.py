@@ -0,0 +1,271 @@
+# file openemory/publication/pdfcache.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''
+On-disk caching for generated PDF artifacts, so that expensive
+derivatives of the Fedora ``content`` datastream do not have to be
+regenerated on every request.
+
+Cached cover page PDFs are stored under a per-article directory, which
+allows everything cached for a single article to be invalidated at
+once when the article is saved.  Extracted text is content-addressed
+by PDF checksum and never needs to be invalidated.
+
+'''
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+
+from openemory.util import pdf_to_text
+
+logger = logging.getLogger(__name__)
+
+
+COVERPAGE_VERSION = '1'
+'''Version of the cover page logic and ``publication/coverpage.html``
+template.  This is part of every cached cover page PDF key;
+**increment it** whenever the cover page changes, so previously cached
+PDFs will no longer be used.'''
+
+
+def _safe_pid(pid):
+    # colons are legal in file names on most systems, but not all
+    return pid.replace(':', '_')
+
+
+class CoverPdfCache(object):
+    '''Persistent on-disk cache of Article PDFs merged with a generated
+    cover page (see :meth:`openemory.publication.models.Article.pdf_with_cover`).
+
+    Cached files are keyed on article pid, the checksums and
+    modification dates of the ``content`` and ``descMetadata``
+    datastreams, and :data:`COVERPAGE_VERSION`, so any change to the
+    PDF, the descriptive metadata, or the cover page logic results in
+    a new cache key.
+
+    :param cache_dir: base directory for cached files; defaults to
+        **PDF_COVER_CACHE_DIR** if configured in django settings, or a
+        directory under the system temp directory if not
+    '''
+
+    suffix = '.pdf'
+
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        if self._cache_dir is not None:
+            return self._cache_dir
+        return getattr(settings, 'PDF_COVER_CACHE_DIR', None) or \
+               os.path.join(tempfile.gettempdir(), 'oe_cache', 'pdf')
+
+    def key(self, article):
+        '''Cache key for the current version of the specified article.
+
+        :param article: :class:`~openemory.publication.models.Article`
+        :returns: hex digest string
+        '''
+        parts = [article.pid, COVERPAGE_VERSION]
+        for ds in (article.pdf, article.descMetadata):
+            parts.extend([ds.checksum or '', unicode(ds.created or '')])
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def article_dir(self, pid):
+        'Directory where all cached files for the specified pid are stored.'
+        return os.path.join(self.cache_dir, _safe_pid(pid))
+
+    def path(self, article, key=None):
+        '''Full path to the cached file for the current version of the
+        specified article (whether or not it exists).'''
+        if key is None:
+            key = self.key(article)
+        return os.path.join(self.article_dir(article.pid), key + self.suffix)
+
+    def is_cached(self, article):
+        '''Check if a PDF for the current version of the specified
+        article is already cached.'''
+        return os.path.exists(self.path(article))
+
+    def get(self, article):
+        '''Return the path to the cached cover page PDF for the
+        specified article, generating it first if it is not already
+        cached.  Any stale cached versions for the same article are
+        removed when a new version is generated.
+
+        Errors generating the PDF (e.g., :class:`pyPdf.utils.PdfReadError`
+        or :class:`eulfedora.util.RequestFailed`) are not caught here.
+
+        :param article: :class:`~openemory.publication.models.Article`
+        :returns: full path to the cached PDF file
+        '''
+        key = self.key(article)
+        path = self.path(article, key)
+        if os.path.exists(path):
+            return path
+
+        start = time.time()
+        article_dir = self.article_dir(article.pid)
+        if not os.path.isdir(article_dir):
+            try:
+                os.makedirs(article_dir)
+            except OSError:
+                # another process may have created it in the meantime
+                if not os.path.isdir(article_dir):
+                    raise
+
+        # generate into a temporary file in the same directory and
+        # rename into place, so a partial file is never served
+        fd, tmppath = tempfile.mkstemp(suffix='.tmp', dir=article_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmpfile:
+                article.pdf_with_cover(outfile=tmpfile)
+            os.rename(tmppath, path)
+        except:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+        self._remove_stale(article_dir, key)
+        logger.debug('Cached cover page PDF for %s in %f sec' % \
+                     (article.pid, time.time() - start))
+        return path
+
+    def _remove_stale(self, article_dir, key):
+        # remove any other cached versions for this article
+        current = key + self.suffix
+        for filename in os.listdir(article_dir):
+            if filename != current and filename.endswith(self.suffix):
+                try:
+                    os.remove(os.path.join(article_dir, filename))
+                except OSError:
+                    pass
+
+    def invalidate(self, pid):
+        '''Remove all cached files for the specified pid.'''
+        article_dir = self.article_dir(pid)
+        if os.path.isdir(article_dir):
+            shutil.rmtree(article_dir, ignore_errors=True)
+
+
+cover_pdf_cache = CoverPdfCache()
+'''Default :class:`CoverPdfCache` instance, configured from django
+settings.'''
+
+
+TEXT_EXTRACTION_VERSION = '1'
+'''Version of the PDF text extraction logic (see
+:meth:`openemory.util.pdf_to_text`).  This is part of every cached
+text file name; **increment it** whenever text extraction changes, so
+text will be extracted again.'''
+
+
+class FulltextCache(object):
+    '''Persistent, content-addressed on-disk cache of text extracted
+    from Article PDFs.  Text is keyed on the checksum of the ``content``
+    datastream, :data:`TEXT_EXTRACTION_VERSION`, and the text extraction
+    settings (**PDF_TEXT_MAX_PAGES**, **PDF_TEXT_MAX_CHARS** and
+    **PDF_TEXT_LAYOUT**), so it is reused by every reindex until the PDF
+    itself or the way text is extracted changes, and identical PDFs
+    share a single cached copy.
+
+    :param cache_dir: base directory for cached files; defaults to
+        **PDF_TEXT_CACHE_DIR** if configured in django settings, or a
+        directory under the system temp directory if not
+    '''
+
+    suffix = '.txt'
+
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        if self._cache_dir is not None:
+            return self._cache_dir
+        return getattr(settings, 'PDF_TEXT_CACHE_DIR', None) or \
+               os.path.join(tempfile.gettempdir(), 'oe_cache', 'text')
+
+    def extraction_options(self):
+        '''Text extraction settings that affect the extracted text, as
+        a string for use in cached file names.'''
+        max_pages = getattr(settings, 'PDF_TEXT_MAX_PAGES', None)
+        max_chars = getattr(settings, 'PDF_TEXT_MAX_CHARS', None)
+        layout = getattr(settings, 'PDF_TEXT_LAYOUT', True)
+        return 'p%s-c%s-%s' % (max_pages or 'all', max_chars or 'all',
+                               'layout' if layout else 'nolayout')
+
+    def path(self, pdf):
+        '''Full path to the cached text for the specified pdf datastream
+        (whether or not it exists), or None if the datastream does not
+        have a usable checksum.'''
+        checksum = (pdf.checksum or '').lower()
+        if not checksum or checksum == 'none' or \
+               not checksum.isalnum():
+            return None
+        checksum_type = (pdf.checksum_type or 'checksum').lower().replace('-', '')
+        filename = '%s-%s-v%s-%s%s' % (checksum_type, checksum,
+                                       TEXT_EXTRACTION_VERSION,
+                                       self.extraction_options(), self.suffix)
+        # distribute files across subdirectories
+        return os.path.join(self.cache_dir, checksum[:2], filename)
+
+    def get(self, article):
+        '''Return the text content of an article PDF, using the cached
+        copy if available and extracting and caching it if not.  Errors
+        reading or extracting text from the PDF are not caught here.
+
+        :param article: :class:`~openemory.publication.models.Article`
+        :returns: unicode
+        '''
+        path = self.path(article.pdf)
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as textfile:
+                return textfile.read().decode('utf-8')
+
+        start = time.time()
+        text = pdf_to_text(article.pdf.content)
+        logger.debug('Extracted text from PDF for %s in %f sec' % \
+                     (article.pid, time.time() - start))
+        if path is not None:
+            self._store(path, text)
+        return text
+
+    def _store(self, path, text):
+        text_dir = os.path.dirname(path)
+        try:
+            if not os.path.isdir(text_dir):
+                os.makedirs(text_dir)
+            # write to a temporary file and rename into place, so a
+            # partial file is never read
+            fd, tmppath = tempfile.mkstemp(suffix='.tmp', dir=text_dir)
+            with os.fdopen(fd, 'wb') as tmpfile:
+                tmpfile.write(text.encode('utf-8'))
+            os.rename(tmppath, path)
+        except (IOError, OSError) as e:
+            # caching is an optimization; don't fail indexing
+            logger.warn('Failed to cache PDF text at %s: %s' % (path, e))
+
+
+fulltext_cache = FulltextCache()
+'''Default :class:`FulltextCache` instance, configured from django
+settings.'''
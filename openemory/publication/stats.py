@@ -0,0 +1,255 @@
+# file openemory/publication/stats.py
+#
+#   Copyright 2010 Emory University General Library
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''
+Write-behind buffering for :class:`~openemory.publication.models.ArticleStatistics`
+view and download counts.
+
+Rather than updating the database on every article view or download,
+increments are aggregated in memory per (pid, year, quarter) and
+periodically written to the database with a single relative update
+per row, along with the all-time per-article and per-year site
+rollups.  Pending counts are also flushed when the process exits.  If
+the database cannot be updated, pending counts are written to a spool
+directory, to be loaded by the ``flush_statistics`` management
+command.
+
+Buffering is configured in django settings:
+
+ * **ARTICLE_STATS_BUFFERED** - buffer counts (default True); when
+   False, every increment is written to the database immediately
+ * **ARTICLE_STATS_FLUSH_INTERVAL** - seconds between background
+   flushes (default 60)
+ * **ARTICLE_STATS_SPOOL_DIR** - directory for counts that could not
+   be written to the database
+
+'''
+
+import atexit
+from collections import defaultdict
+from datetime import date
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from openemory.publication.models import ArticleStatistics, \
+     ArticleTotalStatistics, SiteStatistics, year_quarter
+
+logger = logging.getLogger(__name__)
+
+
+class StatisticsBuffer(object):
+    '''In-process buffer of pending article view and download counts.
+    Thread-safe; a single instance (:data:`stats_buffer`) is shared
+    by all requests handled by a process.'''
+
+    spool_suffix = '.json'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._flush_thread = None
+
+    @property
+    def buffered(self):
+        return getattr(settings, 'ARTICLE_STATS_BUFFERED', True)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'ARTICLE_STATS_FLUSH_INTERVAL', 60)
+
+    @property
+    def spool_dir(self):
+        return getattr(settings, 'ARTICLE_STATS_SPOOL_DIR', None) or \
+               os.path.join(tempfile.gettempdir(), 'oe_cache', 'stats')
+
+    def increment(self, pid, views=0, downloads=0):
+        '''Add views and/or downloads for the specified article pid to
+        the current year and quarter.'''
+        today = date.today()
+        key = (pid, today.year, year_quarter(today.month))
+        with self._lock:
+            self._add(key, views, downloads)
+        if self.buffered:
+            self._start_flush_thread()
+        else:
+            self.flush()
+
+    def _add(self, key, views, downloads):
+        # NOTE: caller must hold the lock
+        counts = self._counts.setdefault(key, [0, 0])
+        counts[0] += views
+        counts[1] += downloads
+
+    @property
+    def pending(self):
+        '''Number of (pid, year, quarter) rows with pending counts.'''
+        return len(self._counts)
+
+    def flush(self):
+        '''Write all pending counts to the database.  If the database
+        update fails, the pending counts are written to the spool
+        directory instead, so they are not lost.
+
+        :returns: number of statistics rows updated
+        '''
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        if not counts:
+            return 0
+        try:
+            save_counts(counts)
+        except Exception as e:
+            logger.error('Error saving article statistics: %s' % e)
+            self.spool(counts)
+            return 0
+        return len(counts)
+
+    def spool(self, counts):
+        '''Write counts to a new file in the spool directory.'''
+        spool_dir = self.spool_dir
+        try:
+            if not os.path.isdir(spool_dir):
+                os.makedirs(spool_dir)
+            fd, path = tempfile.mkstemp(suffix=self.spool_suffix, dir=spool_dir)
+            with os.fdopen(fd, 'w') as spoolfile:
+                json.dump([list(key) + val for key, val in counts.iteritems()],
+                          spoolfile)
+            logger.info('Spooled statistics for %d articles to %s' % \
+                        (len(counts), path))
+        except Exception as e:
+            # nothing else we can do; put the counts back in the buffer
+            logger.error('Error spooling article statistics: %s' % e)
+            with self._lock:
+                for key, (views, downloads) in counts.iteritems():
+                    self._add(key, views, downloads)
+
+    def spooled_files(self):
+        '''List of spool files waiting to be loaded.'''
+        spool_dir = self.spool_dir
+        if not os.path.isdir(spool_dir):
+            return []
+        return sorted(os.path.join(spool_dir, f) for f in os.listdir(spool_dir)
+                      if f.endswith(self.spool_suffix))
+
+    def load_spooled(self, path):
+        '''Add the counts from a spool file to the buffer and remove the
+        file.
+
+        :returns: number of statistics rows loaded
+        '''
+        with open(path) as spoolfile:
+            rows = json.load(spoolfile)
+        with self._lock:
+            for pid, year, quarter, views, downloads in rows:
+                self._add((pid, year, quarter), views, downloads)
+        os.remove(path)
+        return len(rows)
+
+    def _start_flush_thread(self):
+        if self._flush_thread is None or not self._flush_thread.is_alive():
+            with self._lock:
+                if self._flush_thread is None or not self._flush_thread.is_alive():
+                    self._flush_thread = threading.Thread(target=self._flush_loop,
+                                                          name='article-stats-flush')
+                    self._flush_thread.daemon = True
+                    self._flush_thread.start()
+
+    def _flush_loop(self):
+        wait = threading.Event()
+        while True:
+            wait.wait(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                # don't hold on to a database connection between flushes
+                connection.close()
+
+
+def _add_counts(model, views, downloads, **kwargs):
+    # relative update of the counts for a single row, creating it if needed
+    qs = model.objects.filter(**kwargs)
+    updated = qs.update(num_views=F('num_views') + views,
+                        num_downloads=F('num_downloads') + downloads)
+    if not updated:
+        # first access for this row
+        model.objects.get_or_create(**kwargs)
+        qs.update(num_views=F('num_views') + views,
+                  num_downloads=F('num_downloads') + downloads)
+
+
+def save_counts(counts):
+    '''Add counts to the database in a single transaction, updating
+    the per-quarter :class:`~openemory.publication.models.ArticleStatistics`
+    as well as the all-time
+    :class:`~openemory.publication.models.ArticleTotalStatistics` and
+    per-year :class:`~openemory.publication.models.SiteStatistics`
+    rollups.
+
+    :param counts: dictionary of (pid, year, quarter) tuples to
+        [views, downloads]
+    '''
+    pid_totals = defaultdict(lambda: [0, 0])
+    year_totals = defaultdict(lambda: [0, 0])
+    for (pid, year, quarter), (views, downloads) in counts.iteritems():
+        for totals in (pid_totals[pid], year_totals[year]):
+            totals[0] += views
+            totals[1] += downloads
+
+    with transaction.commit_on_success():
+        for (pid, year, quarter), (views, downloads) in counts.iteritems():
+            _add_counts(ArticleStatistics, views, downloads,
+                        pid=pid, year=year, quarter=quarter)
+        for pid, (views, downloads) in pid_totals.iteritems():
+            _add_counts(ArticleTotalStatistics, views, downloads, pid=pid)
+        for year, (views, downloads) in year_totals.iteritems():
+            _add_counts(SiteStatistics, views, downloads, year=year)
+
+
+def rebuild_totals():
+    '''Regenerate the :class:`~openemory.publication.models.ArticleTotalStatistics`
+    and :class:`~openemory.publication.models.SiteStatistics` rollups
+    from all :class:`~openemory.publication.models.ArticleStatistics`.'''
+    with transaction.commit_on_success():
+        ArticleTotalStatistics.objects.all().delete()
+        ArticleTotalStatistics.objects.bulk_create([
+            ArticleTotalStatistics(pid=st['pid'], num_views=st['views'],
+                                   num_downloads=st['downloads'])
+            for st in ArticleStatistics.objects.values('pid') \
+                          .annotate(views=Sum('num_views'),
+                                    downloads=Sum('num_downloads'))
+        ])
+        SiteStatistics.objects.all().delete()
+        SiteStatistics.objects.bulk_create([
+            SiteStatistics(year=st['year'], num_views=st['views'],
+                           num_downloads=st['downloads'])
+            for st in ArticleStatistics.objects.values('year') \
+                          .annotate(views=Sum('num_views'),
+                                    downloads=Sum('num_downloads'))
+        ])
+
+
+stats_buffer = StatisticsBuffer()
+'''Default :class:`StatisticsBuffer` instance for this process.'''
+
+# write any pending counts when the process exits
+atexit.register(stats_buffer.flush)
@@ -20,6 +20,11 @@ import datetime
 import json
 import logging
 import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
 from cStringIO import StringIO
 from datetime import date
 from dateutil.relativedelta import relativedelta
@@ -29,9 +34,11 @@ from django.core.exceptions import ValidationError
 from django.core import paginator, mail
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.urlresolvers import reverse, resolve
 from django.http import HttpResponse, StreamingHttpResponse
 from django.test import TestCase, Client
+from django.test.utils import override_settings
 from django.template import context
 from django.template.defaultfilters import filesizeformat
 from django.utils.datastructures import SortedDict
@@ -44,6 +51,7 @@ from eulxml import xmlmap
 from eulxml.xmlmap import mods, premis
 from eullocal.django.emory_ldap.backends import EmoryLDAPBackend
 from mock import patch, Mock, MagicMock
+from sunburnt import SolrError
 from pyPdf import PdfFileReader
 from pyPdf.utils import PdfReadError
 # from pdfminer.pdfparser import PDFParser, PDFDocument
@@ -57,7 +65,7 @@ from urllib import urlencode, quote as urlquote
 
 import openemory
 from openemory.common.fedora import DigitalObject
-from openemory.accounts.models import EsdPerson
+from openemory.accounts.models import EsdPerson, UserProfile
 from openemory.harvest.models import HarvestRecord
 from openemory.publication.forms import UploadForm, ArticleModsEditForm, \
      validate_netid, AuthorNameForm, language_codes, language_choices, license_choices, FileTypeValidator, \
@@ -65,21 +73,29 @@ from openemory.publication.forms import UploadForm, ArticleModsEditForm, \
 from openemory.publication.models import NlmArticle, Article, ArticleMods,  \
      FundingGroup, AuthorName, AuthorNote, Keyword, FinalVersion, CodeList, \
      ResearchField, ResearchFields, NlmPubDate, NlmLicense, ArticlePremis, \
-     ArticleStatistics, year_quarter, FeaturedArticle, SupplementalMaterial
+     ArticleStatistics, ArticleTotalStatistics, SiteStatistics, year_quarter, \
+     FeaturedArticle, SupplementalMaterial, AuthorEsdResolver, IngestJob
 from openemory.publication.forms import ArticleModsEditForm as amods
 from openemory.publication import views as pubviews
+from openemory.publication.pdfcache import CoverPdfCache, cover_pdf_cache, \
+     FulltextCache
+from openemory.publication.ingest import process_queued_jobs
+from openemory.publication.stats import StatisticsBuffer, rebuild_totals
+from openemory.publication.authors import AuthorLookupCache
 from openemory.publication.management.commands.quarterly_stats_by_author import Command
 from openemory.rdfns import DC, BIBO, FRBR
 
 from openemory.publication.symp import SympAtom
 
-from openemory.util import pmc_access_url, percent_match
+from openemory.util import pmc_access_url, percent_match, CachedStatistics, \
+     invalidate_statistics, SolrClientPool, SolrPaginator, BackgroundCall, \
+     SolrResultCache, invalidate_search_cache, search_cache_stats, solr_fetch_pids
 
 # credentials for shared fixture accounts
 from openemory.accounts.tests import USER_CREDENTIALS
 
 
-from util import pdf_to_text
+from util import pdf_to_text, PdfTextError
 
 
 TESTUSER_CREDENTIALS = {'username': 'testuser', 'password': 't3st1ng'}
@@ -215,6 +231,61 @@ class NlmArticleTest(TestCase):
              'non-emory email should not be looked up in ldap')
 
 
+    @patch('openemory.publication.models.EmoryLDAPBackend')
+    def test_identifiable_authors_cache(self, mockldap):
+        mockldapinst = mockldap.return_value
+        mockldapinst.find_user_by_email.return_value = (None, None)
+        User.objects.filter(username='jjkohle').delete()
+        User.objects.filter(username='swolf').delete()
+        cache = AuthorLookupCache()
+
+        self.assertEqual([], self.article.identifiable_authors(cache=cache))
+        author_email = self.article.corresponding_author_emails[0]
+        self.assertEqual((True, None), cache.get(author_email))
+        # negative look-up is shared by other articles
+        mockldapinst.reset_mock()
+        article = xmlmap.load_xmlobject_from_string(self.article.serialize(),
+                                                     NlmArticle)
+        self.assertEqual([], article.identifiable_authors(cache=cache))
+        self.assertFalse(mockldapinst.find_user_by_email.called,
+            'ldap should not be queried for a cached email')
+        # ... unless trying harder to find the user
+        self.assertEqual([], article.identifiable_authors(refresh=True,
+                                                          derive=True, cache=cache))
+        mockldapinst.find_user_by_email.assert_called_with(author_email, True)
+
+        # found users are cached
+        user = User.objects.create(username='testauthor', email=author_email)
+        mockldapinst.reset_mock()
+        self.assertEqual([user], article.identifiable_authors(refresh=True,
+                                                              cache=cache))
+        self.assertEqual([user], self.article.identifiable_authors(refresh=True))
+        self.assertEqual([user], self.article.identifiable_authors(refresh=False,
+                                                                   cache=cache))
+        self.assertFalse(mockldapinst.find_user_by_email.called)
+        self.assert_(cache.hits)
+        self.assert_(cache.misses)
+
+    def test_author_lookup_cache(self):
+        user = User.objects.create(username='testauthor', email='testauthor@emory.edu')
+        User.objects.create(username='dupe1', email='dupe@emory.edu')
+        User.objects.create(username='dupe2', email='dupe@emory.edu')
+        cache = AuthorLookupCache(timeout=60)
+        cache.prefetch(['testauthor@emory.edu', 'dupe@emory.edu', 'none@emory.edu'])
+        self.assertEqual((True, user), cache.get('testauthor@emory.edu'))
+        # emails matching more or less than one user are not cached
+        self.assertEqual((False, None), cache.get('dupe@emory.edu'))
+        self.assertEqual((False, None), cache.get('none@emory.edu'))
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+        self.assertEqual('1 hits, 2 misses (33% hit rate)', cache.report())
+
+        # expired entries are not used
+        cache = AuthorLookupCache(timeout=-1)
+        cache.set('none@emory.edu', None)
+        self.assertEqual((False, None), cache.get('none@emory.edu'))
+        cache.clear()
+        self.assertEqual((0, 0), (cache.hits, cache.misses))
+
     @staticmethod
     def mock_find_by_email(email, derive=False):
         '''A mock implementation of
@@ -912,6 +983,44 @@ class ArticleTest(TestCase):
         self.assertEqual(mods.authors[0].id, 'ewaller')
         self.assertEqual(mods.authors[0].family_name, 'Waller')
         self.assertEqual(mods.authors[0].given_name, 'Edmund')
+class AuthorEsdResolverTest(TestCase):
+    fixtures = ['users', 'esdpeople']
+
+    def setUp(self):
+        self.user = User.objects.get(username='mmouse')
+        self.profile, created = UserProfile.objects.get_or_create(user=self.user)
+        self.esd = EsdPerson.objects.get(netid='MMOUSE')
+
+    def test_author_esd(self):
+        resolver = AuthorEsdResolver()
+        esd = resolver.author_esd(['mmouse', 'not-a-user', 'mmouse'])
+        # netids without a profile or esd record are skipped
+        self.assertEqual([self.esd, self.esd], esd)
+        self.assertEqual([], resolver.affiliations(['mmouse']))
+
+        # resolved & unresolved netids are memoized
+        with self.assertNumQueries(0):
+            resolver.author_esd(['mmouse', 'not-a-user'])
+
+    def test_article_resolver(self):
+        article = Article(Mock())  # mock api
+        article.descMetadata.content.authors.extend([
+            AuthorName(id='mmouse', family_name='Mouse', given_name='Minnie'),
+            AuthorName(family_name='Science', given_name='Joe')])
+        self.assertEqual([self.esd.division_dept_id], article.division_dept_id)
+        # esd lookups reused across properties
+        with self.assertNumQueries(0):
+            self.assertEqual([self.esd.department_shortname],
+                             article.department_shortname)
+            self.assertEqual([], article.affiliations)
+
+        # shared resolver
+        resolver = AuthorEsdResolver()
+        article.esd_resolver = resolver
+        self.assertEqual(resolver, article.esd_resolver)
+        self.assertEqual([self.esd], article.author_esd)
+
+
 class ValidateNetidTest(TestCase):
     fixtures =  ['testusers']
 
@@ -1161,6 +1270,82 @@ class PublicationViewsTest(TestCase):
 
         self.assertTrue((obj.uriref, relsext.isMemberOfCollection, self.coll)  in obj.rels_ext.content)
 
+    @override_settings(ASYNC_INGEST=True)
+    @patch('openemory.publication.ingest.solr_interface')
+    def test_ingest_upload_async(self, mocksolr_interface):
+        upload_url = reverse('publication:ingest')
+        self.client.post(reverse('accounts:login'), TESTUSER_CREDENTIALS)
+        # POST a test pdf; should be queued and redirect to status page
+        with open(pdf_filename) as pdf:
+            response = self.client.post(upload_url, {'pdf': pdf, 'assent': True})
+        expected, got = 303, response.status_code
+        self.assertEqual(expected, got,
+            'Should redirect on successful upload; expected %s but returned %s for %s' \
+                         % (expected, got, upload_url))
+        redirect_path = response['Location'][len('https://testserver')-1:]
+        resolve_match = resolve(redirect_path)
+        self.assertEqual(pubviews.ingest_status, resolve_match.func,
+             'async ingest should redirect to ingest status view')
+        job = IngestJob.objects.get(pk=resolve_match.kwargs['id'])
+        self.assertEqual('queued', job.status)
+        self.assertEqual('test.pdf', job.filename)
+        self.assertEqual(TESTUSER_CREDENTIALS['username'], job.user.username)
+        self.assertTrue(job.assent)
+
+        # status while queued
+        status_url = reverse('publication:ingest-status', kwargs={'id': job.pk})
+        response = self.client.get(status_url)
+        self.assertContains(response, 'is being')
+        response = self.client.get(status_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        data = json.loads(response.content)
+        self.assertEqual('queued', data['status'])
+        self.assertEqual(None, data['edit_url'])
+
+        # process the queue
+        self.assertEqual((1, 0), process_queued_jobs(repo=self.repo))
+        job = IngestJob.objects.get(pk=job.pk)
+        self.assertEqual('complete', job.status)
+        self.assert_(job.pid)
+        self.pids.append(job.pid)	# add to list for clean-up in tearDown
+        self.assertFalse(job.upload, 'uploaded file should be removed')
+        self.assert_(mocksolr_interface.return_value.add.called)
+        mocksolr_interface.assert_called_with(indexing=True)
+
+        obj = self.repo.get_object(job.pid, type=Article)
+        self.assertEqual('test.pdf', obj.label)
+        self.assertEqual(TESTUSER_CREDENTIALS['username'], obj.owner)
+        self.assertEqual(pdf_md5sum, obj.pdf.checksum)
+        self.assertEqual(obj.number_of_pages, job.num_pages)
+        self.assertEqual('upload', obj.provenance.content.upload_event.type)
+        self.assertTrue((obj.uriref, relsext.isMemberOfCollection, self.coll)  in obj.rels_ext.content)
+
+        # complete job redirects to edit the article
+        response = self.client.get(status_url)
+        expected, got = 303, response.status_code
+        self.assertEqual(expected, got)
+        self.assert_(response['Location'].endswith(reverse('publication:edit',
+                                                           kwargs={'pid': job.pid})))
+
+        # already-processed jobs are not processed again
+        self.assertEqual((0, 0), process_queued_jobs(repo=self.repo))
+
+    @override_settings(ASYNC_INGEST=True)
+    @patch('openemory.publication.ingest.ingest_uploaded_article')
+    def test_ingest_upload_async_error(self, mockingest):
+        # unexpected errors fail the job without stopping the queue
+        mockingest.side_effect = Exception('unexpected error')
+        upload_url = reverse('publication:ingest')
+        self.client.post(reverse('accounts:login'), TESTUSER_CREDENTIALS)
+        for i in range(2):
+            with open(pdf_filename) as pdf:
+                self.client.post(upload_url, {'pdf': pdf, 'assent': True})
+        self.assertEqual((2, 2), process_queued_jobs(repo=self.repo))
+        self.assertEqual(2, mockingest.call_count)
+        for job in IngestJob.objects.all():
+            self.assertEqual('failed', job.status)
+            self.assert_('unexpected error' in job.error)
+            self.assertFalse(job.upload, 'uploaded file should be removed')
+
     def test_ingest_from_harvestrecord(self):
         # test ajax post to ingest from havest queue
 
@@ -1380,7 +1565,81 @@ class PublicationViewsTest(TestCase):
         # #                  str(a.descMetadata.created),
         # #                  'last-modified should be newer of mods or pdf datastream modification time')
         #
+        # cached cover page pdf is served as a file with size and etag
+        self.assertEqual(str(os.path.getsize(cover_pdf_cache.path(self.article))),
+                         response['Content-Length'])
+        self.assertEqual('"%s"' % cover_pdf_cache.key(self.article),
+                         response['ETag'])
+
+        # conditional request for the current version - not modified,
+        # and not counted as a download
+        etag = response['ETag']
+        baseline_downloads = self.article.statistics().num_downloads
+        response = self.client.get(pdf_url, HTTP_IF_NONE_MATCH=etag)
+        expected, got = 304, response.status_code
+        self.assertEqual(expected, got,
+            'Expected %s but returned %s for %s (If-None-Match current etag)' \
+                % (expected, got, pdf_url))
+        self.assertEqual(baseline_downloads,
+                         self.article.statistics().num_downloads)
+        # no last-modified, since datastream dates do not reflect cover
+        # page changes; if-modified-since alone gets the current pdf
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(pdf_url,
+            HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2035 00:00:00 GMT')
+        expected, got = 200, response.status_code
+        self.assertEqual(expected, got,
+            'Expected %s but returned %s for %s (If-Modified-Since only)' \
+                % (expected, got, pdf_url))
+        self.assertFalse(response.has_header('Last-Modified'))
+        baseline_downloads = self.article.statistics().num_downloads
+        response = self.client.get(pdf_url, HTTP_IF_NONE_MATCH='"outdated"')
+        expected, got = 200, response.status_code
+        self.assertEqual(expected, got,
+            'Expected %s but returned %s for %s (If-None-Match outdated etag)' \
+                % (expected, got, pdf_url))
+        full_pdf = ''.join(response.streaming_content)
+
+        # range requests
+        response = self.client.get(pdf_url, HTTP_RANGE='bytes=0-99')
+        expected, got = 206, response.status_code
+        self.assertEqual(expected, got,
+            'Expected %s but returned %s for %s (range request)' \
+                % (expected, got, pdf_url))
+        self.assertEqual('bytes 0-99/%d' % len(full_pdf), response['Content-Range'])
+        self.assertEqual(full_pdf[:100], ''.join(response.streaming_content))
+        response = self.client.get(pdf_url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(full_pdf[100:], ''.join(response.streaming_content))
+        response = self.client.get(pdf_url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(full_pdf[-10:], ''.join(response.streaming_content))
+        # only the request for the beginning of the file is a download
+        self.assertEqual(baseline_downloads + 2,
+                         self.article.statistics().num_downloads)
+        response = self.client.get(pdf_url, HTTP_RANGE='bytes=%d-' % len(full_pdf))
+        expected, got = 416, response.status_code
+        self.assertEqual(expected, got,
+            'Expected %s but returned %s for %s (range past end of file)' \
+                % (expected, got, pdf_url))
+        # range ignored if the file has changed
+        response = self.client.get(pdf_url, HTTP_RANGE='bytes=100-',
+                                   HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(200, response.status_code)
+
+        # cached file removed by another process before it is opened -
+        # fall back to the pdf without cover page
+        with patch.object(cover_pdf_cache, 'get') as mockget:
+            mockget.return_value = os.path.join(tempfile.gettempdir(), 'removed-cover.pdf')
+            response = self.client.get(pdf_url)
+            expected, got = 200, response.status_code
+            self.assertEqual(expected, got,
+                'Expected %s but returned %s for %s (cached pdf removed)' \
+                    % (expected, got, pdf_url))
+
         # # pdf error
+        # clear the cached pdf so the cover page will be regenerated
+        cover_pdf_cache.invalidate(self.article.pid)
         with patch.object(Article, 'pdf_with_cover') as mockpdfcover:
             # pyPdf error reading the pdf
             mockpdfcover.side_effect = PdfReadError
@@ -1489,6 +1748,22 @@ class PublicationViewsTest(TestCase):
             'Expected %s but returned %s for %s' \
                 % (expected, got, ds_url))
 
+        # conditional and range requests
+        response = self.client.get(ds_url,
+            HTTP_IF_NONE_MATCH='"%s"' % self.article.authorAgreement.checksum)
+        expected, got = 304, response.status_code
+        self.assertEqual(expected, got,
+            'Expected %s but returned %s for %s (If-None-Match checksum)' \
+                % (expected, got, ds_url))
+        response = self.client.get(ds_url, HTTP_RANGE='bytes=0-9')
+        expected, got = 206, response.status_code
+        self.assertEqual(expected, got,
+            'Expected %s but returned %s for %s (range request)' \
+                % (expected, got, ds_url))
+        with open(pdf_filename_2) as author_agreement:
+            self.assertEqual(author_agreement.read(10),
+                             ''.join(response.streaming_content))
+
         # user logged in but does not own the article
         self.article.owner = ""  #remove user from owner list
         self.article.save()
@@ -2024,11 +2299,12 @@ class PublicationViewsTest(TestCase):
         mocksolr.highlight.return_value = mocksolr
         mocksolr.sort_by.return_value = mocksolr
         mocksolr.facet_by.return_value = mocksolr
-        mocksolr.count.return_value = 0	   # count required for pagination
+        mocksolr.paginate.return_value = mocksolr
 
         articles = MagicMock()
+        # total number of results is read from the page response
+        articles.result.numFound = 0
         mocksolr.execute.return_value = articles
-        mocksolr.__getitem__.return_value = articles
 
         search_url = reverse('publication:search')
         response = self.client.get(search_url, {'keyword': 'cheese'})
@@ -2044,6 +2320,11 @@ class PublicationViewsTest(TestCase):
                      'paginated solr result should be set in response context')
         self.assertEqual(articles, response.context['results'].object_list)
         self.assertEqual(['cheese'], response.context['search_terms'])
+        # page, total and facets are retrieved with a single request
+        # (and one request for people)
+        mocksolr.paginate.assert_any_call(start=0, rows=10)
+        mocksolr.paginate.assert_any_call(rows=3)
+        self.assertEqual(2, mocksolr.paginate.call_count)
 
         # no results found - should be indicated
         # (empty result because execute return value magicmock is currently empty)
@@ -2060,7 +2341,8 @@ class PublicationViewsTest(TestCase):
         mocksolr.highlight.return_value = mocksolr
         mocksolr.sort_by.return_value = mocksolr
         mocksolr.facet_by.return_value = mocksolr
-        mocksolr.count.return_value = 0	   # count required for pagination
+        mocksolr.paginate.return_value = mocksolr
+        mocksolr.execute.return_value.result.numFound = 0
 
         search_url = reverse('publication:search')
         response = self.client.get(search_url, {'keyword': '"Firstname Lastname"'})
@@ -2074,6 +2356,16 @@ class PublicationViewsTest(TestCase):
         self.assertEqual(mocksolr.query.call_args_list[2][1], expected)
         expected = {'first_name': 'Firstname', 'last_name': 'Lastname'}
         self.assertEqual(mocksolr.query.call_args_list[3][1], expected)
+        # directory name not found: one request for each people query
+        paginate_kwargs = lambda: [kwargs for args, kwargs in mocksolr.paginate.call_args_list]
+        self.assertEqual(2, paginate_kwargs().count({'rows': 3}))
+
+        # directory name found - first and last name are not queried
+        mocksolr.execute.return_value.__len__.return_value = 1
+        response = self.client.get(search_url, {'keyword': '"Firstname Lastname"'})
+        self.assertEqual(1, [kwargs for args, kwargs in mocksolr.query.call_args_list]
+                            .count(expected))
+        self.assertEqual(3, paginate_kwargs().count({'rows': 3}))
 
     @patch('openemory.publication.views.solr_interface')
     def test_search_phrase(self, mock_solr_interface):
@@ -2085,15 +2377,17 @@ class PublicationViewsTest(TestCase):
         mocksolr.highlight.return_value = mocksolr
         mocksolr.sort_by.return_value = mocksolr
         mocksolr.facet_by.return_value = mocksolr
-        # count required for pagination; > 10 to test pagination
-        mocksolr.count.return_value = 11
+        mocksolr.paginate.return_value = mocksolr
 
-        articles = [
+        docs = [
             {'pid': 'test:1',  'title': 'An Article', 'score': 0.3,
              'abstract': 'summary description of content' }
         ]
+        articles = MagicMock()
+        articles.__iter__.side_effect = lambda: iter(docs)
+        # total from the page response; > 10 to test pagination
+        articles.result.numFound = 11
         mocksolr.execute.return_value = articles
-        mocksolr.__getitem__.return_value = articles
 
         search_url = reverse('publication:search')
         response = self.client.get(search_url, {'keyword': 'cheese "sharp cheddar"'})
@@ -2114,14 +2408,14 @@ class PublicationViewsTest(TestCase):
             msg_prefix='pagination links should be present on search results page')
 
         # minimal testing for article content display
-        self.assertContains(response, articles[0]['title'],
+        self.assertContains(response, docs[0]['title'],
             msg_prefix='article title should be displayed')
-        self.assertContains(response, reverse('publication:view', args=[articles[0]['pid']]),
+        self.assertContains(response, reverse('publication:view', args=[docs[0]['pid']]),
             msg_prefix='article view url should be included in search page')
         # NOTE: relevance score not currently displayed in new 352media designls -
         #self.assertContains(response, articles[0]['score'],
         #    msg_prefix='article relevance score should be displayed when present')
-        self.assertContains(response, articles[0]['abstract'],
+        self.assertContains(response, docs[0]['abstract'],
             msg_prefix='article abstract should be displayed when present')
 
 
@@ -2135,12 +2429,12 @@ class PublicationViewsTest(TestCase):
         mocksolr.highlight.return_value = mocksolr
         mocksolr.sort_by.return_value = mocksolr
         mocksolr.facet_by.return_value = mocksolr
-        # count required for pagination; > 10 to test pagination links show up
-        mocksolr.count.return_value = 11
+        mocksolr.paginate.return_value = mocksolr
 
         articles = MagicMock()
+        # total from the page response; > 10 to test pagination links show up
+        articles.result.numFound = 11
         mocksolr.execute.return_value = articles
-        mocksolr.__getitem__.return_value = articles
 
         search_url = reverse('publication:search')
         response = self.client.get(search_url, {'keyword': 'cheese "sharp cheddar"',
@@ -2355,9 +2649,9 @@ class PublicationViewsTest(TestCase):
         mocksolr.sort_by.return_value = mocksolr
         mocksolr.facet_by.return_value = mocksolr
         mocksolr.paginate.return_value = mocksolr
-        mocksolr.count.return_value = 1	   # count required for pagination
 
         articles = MagicMock()
+        articles.result.numFound = 1
         articles.facet_counts.facet_fields = {
             'researchfield_facet': [],
             'pubyear': [('2003', 1), ('2010', 25)],
@@ -2759,9 +3053,13 @@ class PublicationViewsTest(TestCase):
         mocksolr.sort_by.return_value = mocksolr
         mocksolr.exclude.return_value = mocksolr
         mocksolr.field_limit.return_value = mocksolr
-        mocksolr.count.return_value = 1	   # count required for pagination
-        rval = [{'pid': 'test:1'}]
-        mocksolr.__getitem__.return_value = rval
+        mocksolr.paginate.return_value = mocksolr
+        # page of results and total from a single solr response
+        rval = MagicMock()
+        docs = [{'pid': 'test:1'}]
+        rval.__iter__.side_effect = lambda: iter(docs)
+        rval.__len__.return_value = len(docs)
+        rval.result.numFound = 1
         mocksolr.execute.return_value = rval
 
         # not logged in
@@ -2807,10 +3105,14 @@ class PublicationViewsTest(TestCase):
         # should filter on content model & active (published) records
         mocksolr.filter.assert_called_with(content_model=Article.ARTICLE_CONTENT_MODEL,
                                            state='A')
-        qargs, kwargs = mocksolr.sort_by.call_args
+        qargs, kwargs = mocksolr.sort_by.call_args_list[0]
         self.assertEqual('created', qargs[0],
                          'solr results should be sort by record creation date')
+        qargs, kwargs = mocksolr.sort_by.call_args_list[1]
+        self.assertEqual('pid', qargs[0],
+                         'solr results should be sorted by pid within creation date')
         mocksolr.field_limit.assert_called()
+        mocksolr.paginate.assert_called_with(start=0, rows=10)
 
     @patch('openemory.publication.views.solr_interface')
     def test_review_list_ajax(self, mock_solr_interface):
@@ -2822,7 +3124,8 @@ class PublicationViewsTest(TestCase):
         mocksolr.sort_by.return_value = mocksolr
         mocksolr.exclude.return_value = mocksolr
         mocksolr.field_limit.return_value = mocksolr
-        mocksolr.count.return_value = 0
+        mocksolr.paginate.return_value = mocksolr
+        mocksolr.execute.return_value.result.numFound = 0
 
         # log in as an admin
         self.assertTrue(self.client.login(**USER_CREDENTIALS['admin']))
@@ -2846,7 +3149,7 @@ class PublicationViewsTest(TestCase):
         mocksolr.sort_by.return_value = mocksolr
         mocksolr.exclude.return_value = mocksolr
         mocksolr.field_limit.return_value = mocksolr
-        mocksolr.count.return_value = 3	   # count required for pagination
+        mocksolr.paginate.return_value = mocksolr
         # results matching article stats fixture, but not most-downloaded sort order
         rval = [{'pid': 'test:3'}, {'pid': 'test:1'}, {'pid': 'test:2'}]
         mocksolr.__getitem__.return_value = rval
@@ -3028,11 +3331,14 @@ class PublicationViewsTest(TestCase):
         '''
         settings.TEMPLATE_CONTEXT_PROCESSORS.append('openemory.publication.context_processors.statistics')
         context._standard_context_processors = None
+        # don't use statistics cached by the live site or other tests
+        invalidate_statistics()
         try:
             yield
         finally:
             settings.TEMPLATE_CONTEXT_PROCESSORS.remove('openemory.publication.context_processors.statistics')
             context._standard_context_processors = None
+            invalidate_statistics()
 
     def test__parse_name(self):
         #several cases that are not names
@@ -3803,6 +4109,251 @@ class TestExpireEmbargoCommand(TestCase):
         self.assertTrue('Skipped: 3'in output)
         self.assertTrue('Errors: 0'in output)
 
+class TestReindexArticlesCommand(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='oe-reindex-')
+        self.checkpoint = os.path.join(self.tmpdir, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    @patch('openemory.publication.management.commands.reindex_articles.invalidate_statistics')
+    @patch('openemory.publication.management.commands.reindex_articles.Repository')
+    @patch('openemory.publication.management.commands.reindex_articles.solr_interface')
+    def test_reindex(self, mock_solr_interface, mockrepo, mockinvalidate):
+        mocksolr = mock_solr_interface.return_value
+        def get_object(pid, type=None):
+            article = Mock()
+            article.exists = pid != 'test:missing'
+            article.index_data.return_value = {'pid': pid}
+            return article
+        mockrepo.return_value.get_object.side_effect = get_object
+
+        pids = ['test:1', 'test:2', 'test:missing', 'test:3']
+        io = StringIO()
+        call_command('reindex_articles', *pids, processes=1, batch_size=2,
+                     checkpoint=self.checkpoint, verbosity=0, stdout=io)
+        output = io.getvalue()
+        self.assert_('Indexed: 3' in output)
+        self.assert_('Skipped: 1' in output)
+        self.assert_('docs/sec' in output)
+        # batched adds, single commit
+        self.assertEqual(2, mocksolr.add.call_count)
+        mocksolr.add.assert_any_call([{'pid': 'test:1'}, {'pid': 'test:2'}])
+        self.assertEqual(1, mocksolr.commit.call_count)
+        mockinvalidate.assert_called_once_with()
+        with open(self.checkpoint) as checkpoint:
+            self.assertEqual(['test:1', 'test:2', 'test:3'], checkpoint.read().split())
+
+        # resume skips pids in the checkpoint
+        mocksolr.reset_mock()
+        io = StringIO()
+        call_command('reindex_articles', *(pids + ['test:4']), processes=1,
+                     batch_size=2, checkpoint=self.checkpoint, resume=True,
+                     verbosity=0, stdout=io)
+        mocksolr.add.assert_called_once_with([{'pid': 'test:4'}])
+        self.assert_('Indexed: 1' in io.getvalue())
+
+        # pids are only checkpointed after they are committed
+        os.remove(self.checkpoint)
+        mocksolr.reset_mock()
+        def commit():
+            if mocksolr.commit.call_count == 2:
+                raise SolrError('solr unavailable')
+        mocksolr.commit.side_effect = commit
+        self.assertRaises(CommandError, call_command, 'reindex_articles',
+                          *pids, processes=1, batch_size=1, commit_every=2,
+                          checkpoint=self.checkpoint, verbosity=0, stdout=StringIO())
+        with open(self.checkpoint) as checkpoint:
+            self.assertEqual(['test:1', 'test:2'], checkpoint.read().split())
+
+
+class CoverPdfCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='oe-pdfcache-')
+        self.cache = CoverPdfCache(self.tmpdir)
+        self.article = Mock(spec=Article)
+        self.article.pid = 'test:1'
+        self.article.pdf.checksum = 'abc'
+        self.article.pdf.created = datetime.datetime(2013, 1, 1)
+        self.article.descMetadata.checksum = 'def'
+        self.article.descMetadata.created = datetime.datetime(2013, 1, 2)
+        def write_pdf(outfile):
+            outfile.write('%PDF cover + content')
+        self.article.pdf_with_cover.side_effect = write_pdf
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_get(self):
+        self.assertFalse(self.cache.is_cached(self.article))
+        path = self.cache.get(self.article)
+        self.assertEqual(self.cache.path(self.article), path)
+        self.assertTrue(self.cache.is_cached(self.article))
+        with open(path) as pdf:
+            self.assertEqual('%PDF cover + content', pdf.read())
+        self.assertEqual(1, self.article.pdf_with_cover.call_count)
+
+        # second request should use the cached file
+        self.cache.get(self.article)
+        self.assertEqual(1, self.article.pdf_with_cover.call_count)
+
+        # modified metadata should result in a new key & remove stale file
+        self.article.descMetadata.checksum = 'ghi'
+        newpath = self.cache.get(self.article)
+        self.assertNotEqual(path, newpath)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(2, self.article.pdf_with_cover.call_count)
+
+    def test_get_error(self):
+        self.article.pdf_with_cover.side_effect = PdfReadError
+        self.assertRaises(PdfReadError, self.cache.get, self.article)
+        # no partial files left behind
+        self.assertEqual([], os.listdir(self.cache.article_dir(self.article.pid)))
+
+    def test_invalidate(self):
+        self.cache.get(self.article)
+        self.cache.invalidate(self.article.pid)
+        self.assertFalse(self.cache.is_cached(self.article))
+        self.assertFalse(os.path.exists(self.cache.article_dir(self.article.pid)))
+        # invalidating a pid with nothing cached is not an error
+        self.cache.invalidate('test:2')
+
+
+class FulltextCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='oe-textcache-')
+        self.cache = FulltextCache(self.tmpdir)
+        self.article = Mock(spec=Article)
+        self.article.pid = 'test:1'
+        self.article.pdf.checksum = 'ABC123'
+        self.article.pdf.checksum_type = 'MD5'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    @patch('openemory.publication.pdfcache.pdf_to_text')
+    def test_get(self, mockpdftotext):
+        mockpdftotext.return_value = u'extracted text \u2603'
+        self.assertEqual(u'extracted text \u2603', self.cache.get(self.article))
+        self.assertTrue(os.path.exists(self.cache.path(self.article.pdf)))
+        # cached text is reused
+        self.assertEqual(u'extracted text \u2603', self.cache.get(self.article))
+        self.assertEqual(1, mockpdftotext.call_count)
+        # shared by another article with the same pdf
+        other = Mock(spec=Article)
+        other.pdf.checksum = 'abc123'
+        other.pdf.checksum_type = 'MD5'
+        self.cache.get(other)
+        self.assertEqual(1, mockpdftotext.call_count)
+
+        # extracted again when the pdf changes
+        self.article.pdf.checksum = 'def456'
+        self.cache.get(self.article)
+        self.assertEqual(2, mockpdftotext.call_count)
+
+        # extracted again when text extraction settings change
+        with override_settings(PDF_TEXT_MAX_PAGES=5):
+            self.cache.get(self.article)
+            self.assertEqual(3, mockpdftotext.call_count)
+            self.cache.get(self.article)
+            self.assertEqual(3, mockpdftotext.call_count)
+        self.cache.get(self.article)
+        self.assertEqual(3, mockpdftotext.call_count)
+
+        # no checksum - not cached
+        self.article.pdf.checksum = 'none'
+        self.assertEqual(None, self.cache.path(self.article.pdf))
+        self.cache.get(self.article)
+        self.cache.get(self.article)
+        self.assertEqual(5, mockpdftotext.call_count)
+
+
+class StatisticsBufferTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='oe-stats-')
+        self.buffer = StatisticsBuffer()
+        self.year = date.today().year
+        self.quarter = year_quarter(date.today().month)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    @override_settings(ARTICLE_STATS_BUFFERED=True)
+    @patch.object(StatisticsBuffer, '_start_flush_thread')
+    def test_increment_flush(self, mockthread):
+        ArticleStatistics.objects.create(pid='test:1', year=self.year,
+                                         quarter=self.quarter, num_views=3)
+        self.buffer.increment('test:1', views=1)
+        self.buffer.increment('test:1', views=1)
+        self.buffer.increment('test:1', downloads=1)
+        self.buffer.increment('test:2', downloads=1)
+        self.assertEqual(2, self.buffer.pending)
+        # nothing written until flushed
+        self.assertEqual(0, ArticleStatistics.objects.filter(pid='test:2').count())
+
+        self.assertEqual(2, self.buffer.flush())
+        self.assertEqual(0, self.buffer.pending)
+        stats = ArticleStatistics.objects.get(pid='test:1', year=self.year,
+                                              quarter=self.quarter)
+        self.assertEqual(5, stats.num_views)
+        self.assertEqual(1, stats.num_downloads)
+        stats = ArticleStatistics.objects.get(pid='test:2', year=self.year,
+                                              quarter=self.quarter)
+        self.assertEqual(0, stats.num_views)
+        self.assertEqual(1, stats.num_downloads)
+        # all-time and yearly rollups updated with the new counts
+        totals = ArticleTotalStatistics.objects.get(pid='test:1')
+        self.assertEqual(2, totals.num_views)
+        self.assertEqual(1, totals.num_downloads)
+        site = SiteStatistics.objects.get(year=self.year)
+        self.assertEqual(2, site.num_views)
+        self.assertEqual(2, site.num_downloads)
+        # nothing pending
+        self.assertEqual(0, self.buffer.flush())
+
+        # rebuilding rollups includes counts saved some other way
+        rebuild_totals()
+        totals = ArticleTotalStatistics.objects.get(pid='test:1')
+        self.assertEqual(5, totals.num_views)
+        self.assertEqual(1, totals.num_downloads)
+        site = SiteStatistics.objects.get(year=self.year)
+        self.assertEqual(5, site.num_views)
+
+    @override_settings(ARTICLE_STATS_BUFFERED=False)
+    def test_unbuffered(self):
+        self.buffer.increment('test:1', views=1)
+        self.assertEqual(0, self.buffer.pending)
+        self.assertEqual(1, ArticleStatistics.objects.get(pid='test:1').num_views)
+
+    @patch.object(StatisticsBuffer, '_start_flush_thread')
+    def test_spool(self, mockthread):
+        with override_settings(ARTICLE_STATS_BUFFERED=True,
+                               ARTICLE_STATS_SPOOL_DIR=self.tmpdir):
+            self.buffer.increment('test:1', views=2, downloads=1)
+            with patch('openemory.publication.stats.save_counts') as mocksave:
+                mocksave.side_effect = Exception('database unavailable')
+                self.assertEqual(0, self.buffer.flush())
+            spooled = self.buffer.spooled_files()
+            self.assertEqual(1, len(spooled))
+            self.assertEqual(0, self.buffer.pending)
+
+            # drain the spool with the management command
+            io = StringIO()
+            call_command('flush_statistics', verbosity=0, stdout=io)
+            output = io.getvalue()
+            self.assert_('Spool files: 1' in output)
+            self.assert_('Statistics saved: 1' in output)
+            self.assertEqual([], self.buffer.spooled_files())
+            stats = ArticleStatistics.objects.get(pid='test:1')
+            self.assertEqual(2, stats.num_views)
+            self.assertEqual(1, stats.num_downloads)
+
+
 class ArticleModsForm(TestCase):
     fixtures = ['test-license']
 
@@ -3866,6 +4417,40 @@ class PdfToTextTest(TestCase):
         except:
             self.fail("pdf_to_text result not utf-8")
 
+    def test_limits(self):
+        text = pdf_to_text(open(self.pdf_filepath, 'rb'), max_chars=10)
+        self.assertEqual(self.pdf_text[:10], text)
+        text = pdf_to_text(open(self.pdf_filepath, 'rb'), max_pages=1)
+        self.assertEqual(self.pdf_text, text)
+        # text is still extracted without layout analysis
+        text = pdf_to_text(open(self.pdf_filepath, 'rb'), layout=False)
+        self.assert_('This is a test PDF document.' in text)
+
+    def test_subprocess(self):
+        # with a timeout, text is extracted in a separate process
+        text = pdf_to_text(open(self.pdf_filepath, 'rb'), timeout=60)
+        self.assertEqual(self.pdf_text, text)
+
+        # the child gets the import path of this process, not the
+        # environment's (e.g. site-packages added by mod_wsgi python-path)
+        with patch.dict(os.environ, {'PYTHONPATH': tempfile.gettempdir()}):
+            with override_settings(PDF_TEXT_PYTHON=sys.executable):
+                with patch('openemory.util.subprocess.Popen',
+                           wraps=subprocess.Popen) as mockpopen:
+                    text = pdf_to_text(open(self.pdf_filepath, 'rb'), timeout=60)
+        self.assertEqual(self.pdf_text, text)
+        args, kwargs = mockpopen.call_args
+        self.assertEqual(sys.executable, args[0][0])
+        child_path = kwargs['env']['PYTHONPATH'].split(os.pathsep)
+        self.assert_(all(p in child_path for p in sys.path if p))
+        self.assertFalse(tempfile.gettempdir() in child_path)
+
+        with patch('openemory.util.subprocess.Popen') as mockpopen:
+            mockpopen.return_value.communicate.return_value = ('', 'Error: bad pdf')
+            mockpopen.return_value.returncode = 1
+            self.assertRaises(PdfTextError, pdf_to_text,
+                              open(self.pdf_filepath, 'rb'), timeout=60)
+
 
 class TestUtil(TestCase):
 
@@ -3889,6 +4474,227 @@ class TestUtil(TestCase):
         success, percent = percent_match(str1, str2, 50)
         self.assertFalse(success)
 
+    def test_cached_statistics(self):
+        invalidate_statistics()
+        calculate = Mock(return_value={'total': 3})
+        stats = CachedStatistics('test', calculate)
+        # not calculated until used
+        self.assertEqual(0, calculate.call_count)
+        self.assertEqual(3, stats['total'])
+        self.assert_('total' in stats)
+        self.assertEqual(1, calculate.call_count)
+
+        # cached value used by new instances
+        stats = CachedStatistics('test', calculate)
+        self.assertEqual(3, stats['total'])
+        self.assertEqual(1, calculate.call_count)
+
+        # recalculated after invalidation
+        invalidate_statistics()
+        calculate.return_value = {'total': 4}
+        stats = CachedStatistics('test', calculate)
+        self.assertEqual(4, stats['total'])
+        self.assertEqual(2, calculate.call_count)
+
+    def test_solr_paginator(self):
+        query = MagicMock()
+        query.paginate.return_value = query
+        query.execute.return_value.result.numFound = 25
+        pages = SolrPaginator(query, 10)
+        page = pages.page(2)
+        query.paginate.assert_called_with(start=10, rows=10)
+        self.assertEqual(1, query.execute.call_count)
+        # total and number of pages come from the page response
+        self.assertEqual(25, pages.count)
+        self.assertEqual(3, pages.num_pages)
+        self.assertEqual(query.execute.return_value, page.object_list)
+        self.assertEqual(query.execute.return_value.facet_counts, page.facet_counts)
+        self.assertRaises(paginator.EmptyPage, pages.page, 4)
+        self.assertRaises(paginator.EmptyPage, pages.page, 0)
+
+    def test_solr_paginator_cursor(self):
+        query = MagicMock()
+        query.sort_by.return_value = query
+        query.filter.return_value = query
+        query.paginate.return_value = query
+        response = query.execute.return_value
+        docs = [{'created': datetime.datetime(2012, 3, 4, 5, 6, 7, 890000), 'pid': 'test:%d' % i}
+                for i in range(10)]
+        response.__iter__.side_effect = lambda: iter(docs)
+        response.result.numFound = 25
+        pages = SolrPaginator(query, 10, ordering=('-created', 'pid'))
+        self.assertEqual(['-created', 'pid'],
+                         [args[0] for args, kwargs in query.sort_by.call_args_list])
+
+        page = pages.page(1)
+        self.assertEqual('2012-03-04T05:06:07.890Z|test:9', page.next_cursor)
+
+        # deep page requested with a cursor: filtered on the sort
+        # fields instead of skipping over the preceding results
+        response.result.numFound = 5
+        page = pages.page(3, after=page.next_cursor)
+        query.paginate.assert_called_with(start=0, rows=10)
+        query.Q.assert_any_call(created__lt='2012-03-04T05:06:07.890Z')
+        query.Q.assert_any_call(pid__gt='test:9')
+        query.Q.assert_any_call(created='2012-03-04T05:06:07.890Z')
+        self.assertEqual(1, query.filter.call_count)
+        # total includes the pages before the cursor
+        self.assertEqual(25, pages.count)
+        self.assertEqual(3, pages.num_pages)
+        self.assertEqual(None, page.next_cursor)
+
+        # invalid cursor is ignored
+        response.result.numFound = 25
+        pages.page(2, after='bogus')
+        query.paginate.assert_called_with(start=10, rows=10)
+        self.assertEqual(1, query.filter.call_count)
+
+        # no cursors without an ordering
+        self.assertEqual(None, SolrPaginator(query, 10).page(1).next_cursor)
+
+    def test_solr_result_cache(self):
+        search_cache_stats(reset=True)
+        results = SolrResultCache(max_entries=2, timeout=60)
+        def query(q, fq=()):
+            mockq = Mock()
+            mockq.options.return_value = {'q': q, 'fq': list(fq), 'rows': 10}
+            mockq.interface.conn.url = 'http://solr/'
+            return mockq
+
+        q1 = query('cancer  research', ['state:A', 'pubyear:2012'])
+        self.assertEqual(q1.execute.return_value, results.execute(q1))
+        # same query after normalizing whitespace and filter order
+        q2 = query(' cancer research', ['pubyear:2012', 'state:A'])
+        self.assertEqual(q1.execute.return_value, results.execute(q2))
+        self.assertEqual(0, q2.execute.call_count)
+
+        # least recently used results are evicted
+        results.execute(query('a'))
+        results.execute(q2)
+        results.execute(query('b'))
+        qa = query('a')
+        results.execute(qa)
+        qa.execute.assert_called_once_with()
+        stats = results.stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(4, stats['misses'])
+        self.assertEqual(2, stats['evicted'])
+        self.assertEqual(2, stats['entries'])
+        self.assertAlmostEqual(1 / 3.0, stats['hit_rate'])
+
+        # expired results
+        with patch('openemory.util.time') as mocktime:
+            mocktime.time.return_value = 10 ** 10
+            qa = query('a')
+            results.execute(qa)
+            qa.execute.assert_called_once_with()
+        self.assertEqual(1, results.stats()['expired'])
+
+        # invalidated (e.g., by a commit in another process)
+        invalidate_search_cache()
+        qb = query('b')
+        results.execute(qb)
+        qb.execute.assert_called_once_with()
+        self.assertEqual(1, results.stats()['invalidated'])
+
+        # totals in the django cache
+        results.flush_stats()
+        totals = search_cache_stats()
+        self.assertEqual(2, totals['hits'])
+        self.assertEqual(6, totals['misses'])
+
+        # disabled with a timeout of 0
+        q = query('c')
+        SolrResultCache(timeout=0).execute(q)
+        self.assertEqual(0, q.options.call_count)
+        q.execute.assert_called_once_with()
+
+    def test_solr_fetch_pids(self):
+        solr = MagicMock()
+        solr.query.return_value = solr
+        solr.filter.return_value = solr
+        solr.paginate.return_value = solr
+        # results in a different order than requested, one pid not found
+        solr.execute.side_effect = [[{'pid': 'test:2'}, {'pid': 'test:1'}],
+                                    [{'pid': 'test:4'}]]
+        pids = ['test:1', 'test:2', 'test:3', 'test:4']
+        results = solr_fetch_pids(solr, pids, chunk_size=2)
+        self.assertEqual(['test:1', 'test:2', 'test:4'], [r['pid'] for r in results])
+        # looked up in chunks, one filter per chunk
+        self.assertEqual(2, solr.filter.call_count)
+        solr.paginate.assert_called_with(rows=2)
+        self.assertEqual(pids, [kwargs['pid'] for args, kwargs in solr.Q.call_args_list])
+
+        self.assertEqual([], solr_fetch_pids(solr, []))
+
+    def test_background_call(self):
+        self.assertEqual(3, BackgroundCall(lambda a, b: a + b, 1, b=2).result())
+        call = BackgroundCall(int, 'not a number')
+        self.assertRaises(ValueError, call.result)
+
+    @patch('openemory.util.invalidate_search_cache')
+    @patch('openemory.util.httplib2.Http')
+    @patch('openemory.util.sunburnt.SolrInterface')
+    def test_solr_client_pool(self, mocksolr, mockhttp, mockinvalidate):
+        mockhttp.side_effect = lambda **kwargs: Mock()
+        pool = SolrClientPool()
+        solr = pool.get('http://solr/')
+        # client (and schema) is reused
+        self.assertEqual(solr, pool.get('http://solr/'))
+        self.assertEqual(1, mocksolr.call_count)
+        args, kwargs = mocksolr.call_args
+        http = kwargs['http_connection']
+
+        # commits invalidate cached search results
+        commit = mocksolr.return_value.commit
+        solr.commit()
+        commit.assert_called_once_with()
+        mockinvalidate.assert_called_once_with()
+
+        # client is shared between threads, but each thread has its own http
+        other = []
+        thread = threading.Thread(target=lambda: other.extend([pool.get('http://solr/'),
+                                                               http.http]))
+        thread.start()
+        thread.join()
+        self.assertEqual(solr, other[0])
+        self.assertEqual(1, mocksolr.call_count)
+        self.assertNotEqual(http.http, other[1])
+
+        # failed health check discards the client
+        http.http.request.return_value = (Mock(status=200), 'OK')
+        self.assertTrue(pool.health_check('http://solr/'))
+        http.http.request.assert_called_with('http://solr/admin/ping')
+        http.http.request.return_value = (Mock(status=503), '')
+        self.assertFalse(pool.health_check('http://solr/'))
+        pool.get('http://solr/')
+        self.assertEqual(2, mocksolr.call_count)
+
+        # solr errors on a request start a health check
+        http = mocksolr.call_args[1]['http_connection']
+        with patch.object(pool, 'health_check') as mockcheck:
+            http.http.request.return_value = (Mock(status=500), '')
+            http.request('http://solr/select/')
+            mockcheck.assert_called_once_with('http://solr/')
+            http.http.request.side_effect = socket.error
+            self.assertRaises(socket.error, http.request, 'http://solr/select/')
+            self.assertEqual(2, mockcheck.call_count)
+
+        # indexing clients are separate, with the indexing timeout
+        with override_settings(SOLR_TIMEOUT=30, SOLR_INDEX_TIMEOUT=None):
+            pool.get('http://solr/', indexing=True)
+            self.assertEqual(3, mocksolr.call_count)
+            self.assertNotEqual(http, mocksolr.call_args[1]['http_connection'])
+            pool.get('http://solr/')
+            self.assertEqual(3, mocksolr.call_count)
+            self.assertEqual(None, pool.http_options(indexing=True)['timeout'])
+            self.assertEqual(30, pool.http_options()['timeout'])
+
+        # discarded clients are created again
+        pool.discard()
+        pool.get('http://solr/')
+        self.assertEqual(4, mocksolr.call_count)
+
 
 class TestSympDS(TestCase):
 
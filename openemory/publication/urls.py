@@ -21,6 +21,7 @@ urlpatterns = patterns('',
     url(r'^summary/$', views.summary, name='summary'),
     url(r'^(?P<field>(authors|subjects|journals))/$', views.browse_field, name='browse'),
     url(r'^new/$', views.ingest, name='ingest'),
+    url(r'^new/(?P<id>\d+)/$', views.ingest_status, name='ingest-status'),
     url(r'^search/$', views.search, name='search'),
     url(r'^unreviewed/$', views.review_queue, name='review-list'),
     url(r'^departments/$', views.departments, name='list-departments'),
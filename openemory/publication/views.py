@@ -14,9 +14,12 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import calendar
 import datetime
 import json
 import logging
+import os
+import re
 from urllib import urlencode
 from rdflib import URIRef, Literal
 from rdflib.graph import Graph as RdfGraph, Namespace
@@ -26,12 +29,15 @@ from django.contrib import messages
 from django.core.urlresolvers import reverse
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.mail import mail_managers
-from django.db.models import Sum
+from django.core.servers.basehttp import FileWrapper
 from django.http import Http404, HttpResponse, HttpResponseForbidden, \
-    HttpResponseBadRequest, HttpResponsePermanentRedirect
+    HttpResponseBadRequest, HttpResponsePermanentRedirect, StreamingHttpResponse, \
+    HttpResponseNotModified
 from django.shortcuts import render, get_object_or_404, redirect
 from django.template.context import RequestContext
 from django.template.loader import get_template, render_to_string
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, \
+    quote_etag
 from django.utils.safestring import mark_safe
 from django.views.decorators.http import require_http_methods, last_modified
 from django.views.decorators.csrf import csrf_exempt
@@ -50,9 +56,14 @@ from openemory.common import romeo
 from openemory.harvest.models import HarvestRecord
 from openemory.publication.forms import UploadForm, AdminUploadForm, \
         BasicSearchForm, SearchWithinForm, ArticleModsEditForm, OpenAccessProposalForm
-from openemory.publication.models import Article, AuthorName, ArticleStatistics, \
-        ResearchFields, FeaturedArticle
-from openemory.util import md5sum, solr_interface, paginate
+from openemory.publication.ingest import init_uploaded_article, \
+        ingest_uploaded_article, ingest_harvested_record
+from openemory.publication.models import Article, \
+        ArticleTotalStatistics, ResearchFields, FeaturedArticle, IngestJob
+from openemory.publication.pdfcache import cover_pdf_cache
+from openemory.publication.stats import stats_buffer
+from openemory.util import solr_interface, paginate, \
+     BackgroundCall, search_cache, solr_fetch_pids
 
 logger = logging.getLogger(__name__)
 
@@ -102,8 +113,6 @@ def ingest(request):
             # which system is being referenced.  Will likely have to
             # add to the Harvest record model.
 
-            # TODO: Update so premis events are included on object
-            # ingest, rather than requiring a secondary save?
             if 'pmcid' not in request.POST or not request.POST['pmcid']:
                 return HttpResponseBadRequest('No record specified for ingest',
                                               mimetype='text/plain')
@@ -122,30 +131,15 @@ def ingest(request):
             record.mark_in_process()
 
             try:
-                # initialize a new article object from the harvest record
-                obj = record.as_publication_article(repo=repo)
-
-                # Add to OpenEmory Collection
-                obj.collection = coll
-
-
-                saved = obj.save('Ingest from harvested record PubMed Central %d' % \
-                                 record.pmcid)
-                # Modify DC namespaces for OAI
-                obj._prep_dc_for_oai()
-                saved = obj.save('Modified Namespaces for DC')
-
-                if saved:
+                # initialize a new article object from the harvest record,
+                # with the harvest premis event, and ingest it
+                obj = ingest_harvested_record(record, request.user, coll,
+                                              repo=repo)
+                if obj is not None:
 
                     # mark the database record as ingested
                     record.mark_ingested()
 
-                    #add harvested premis event
-                    obj.provenance.content.init_object(obj.pid, 'pid')
-                    if not obj.provenance.content.harvest_event:
-                        obj.provenance.content.harvested(request.user, record.pmcid)
-                        obj.save('added harvested event')
-
                     # return a 201 Created with new location
                     response = HttpResponse('Ingested as %s' % obj.pid,
                                             mimetype='text/plain',
@@ -179,90 +173,54 @@ def ingest(request):
                 # assent before processing file upload.
                 assert form.cleaned_data.get('assent', False)
 
-                obj = repo.get_object(type=Article)
-
                 # a few metadata values depend on whether the user submitted
                 # as an author or mediated submission.
                 statement = form.cleaned_data.get('legal_statement', 'AUTHOR')
+                uploaded_file = request.FILES['pdf']
+
+                # queue for ingest in the background, if configured
+                if getattr(settings, 'ASYNC_INGEST', False):
+                    job = IngestJob(user=request.user, filename=uploaded_file.name,
+                                    content_type=uploaded_file.content_type,
+                                    legal_statement=statement,
+                                    assent=form.cleaned_data.get('assent', False))
+                    job.upload.save(uploaded_file.name, uploaded_file)
+                    return HttpResponseSeeOtherRedirect(reverse('publication:ingest-status',
+                                                                kwargs={'id': job.pk}))
 
                 # TODO: move init logic into an Article class method?
                 # TODO: remove initial dc field? set preliminary mods title from file?
-                uploaded_file = request.FILES['pdf']
-                # use filename as preliminary title
-                obj.label = uploaded_file.name
-                # copy object label into dc:title
-                obj.dc.content.title = obj.label
-                # set the username of the currently-logged in user as object owner
-                obj.owner = request.user.username
-                # ingest as inactive (not publicly visible until author edits & publishes)
-                obj.state = 'I'
+                obj = init_uploaded_article(repo.get_object(type=Article),
+                                            request.user, uploaded_file.name,
+                                            uploaded_file.content_type, statement)
                 # set uploaded file as pdf datastream content
                 obj.pdf.content = uploaded_file
-                # for now, use the content type passed by the browser (even though we know it is unreliable)
-                # eventually, we'll want to use mime magic to inspect files before ingest
-                obj.pdf.mimetype = uploaded_file.content_type
-                obj.dc.content.format = obj.pdf.mimetype
-
-                # set static MODS values that will be the same for all uploaded articles
-                obj.descMetadata.content.resource_type = 'text'
-                obj.descMetadata.content.genre = 'Article'
-                obj.descMetadata.content.create_physical_description()
-                obj.descMetadata.content.physical_description.media_type = 'application/pdf'
-
-                # set current user as first author
-                if statement == 'AUTHOR':
-                    obj.descMetadata.content.authors.append(AuthorName(id=request.user.username,
-                                                                    family_name=request.user.last_name,
-                                                                    given_name=request.user.first_name,
-                                                                    affiliation='Emory University'))
-
-                # calculate MD5 checksum for the uploaded file before ingest
-                obj.pdf.checksum = md5sum(uploaded_file.temporary_file_path())
-                obj.pdf.checksum_type = 'MD5'
-
-                # Add to OpenEmory Collection
-                obj.collection = coll
-
 
                 try:
-                    saved = obj.save('upload via OpenEmory')
-                    # Modify DC namespaces for OAI
-                    obj._prep_dc_for_oai()
-                    saved = obj.save('Modified Namespaces for DC')
+                    # LEGAL NOTE: Legal counsel recommends what we
+                    # require assent to deposit before processing
+                    # file upload. We do this by making the assent
+                    # field required in the form. Thus assent here
+                    # should always be True. We're leaving this
+                    # check in place in case current or future code
+                    # error accidentally changes that precondition.
+                    #
+                    # For the statement that the user agreed to, we
+                    # check the form. The admin form has a required
+                    # legal_statement that specifies this. The
+                    # regular admin form has no such field: It only
+                    # presents the author option.
+                    assent = form.cleaned_data.get('assent', False)
+                    saved = ingest_uploaded_article(obj, request.user,
+                                uploaded_file.temporary_file_path(), coll,
+                                statement if assent else None)
 
                     if saved:
                         messages.success(request,
                             'Success! Your article was uploaded. Please complete the required fields in Citation Information and submit.',
                             extra_tags='upload')
-                        next_url = reverse('publication:edit',
-                                           kwargs={'pid': obj.pid})
-
-                        #add uploaded premis event
-                        obj.provenance.content.init_object(obj.pid, 'pid')
-
-                        if not obj.provenance.content.upload_event:
-                            # LEGAL NOTE: Legal counsel recommends what we
-                            # require assent to deposit before processing
-                            # file upload. We do this by making the assent
-                            # field required in the form. Thus assent here
-                            # should always be True. We're leaving this
-                            # check in place in case current or future code
-                            # error accidentally changes that precondition.
-                            #
-                            # For the statement that the user agreed to, we
-                            # check the form. The admin form has a required
-                            # legal_statement that specifies this. The
-                            # regular admin form has no such field: It only
-                            # presents the author option.
-                            assent = form.cleaned_data.get('assent', False)
-                            statement = (form.cleaned_data.get('legal_statement', 'AUTHOR')
-                                         if assent else None)
-
-                            obj.provenance.content.uploaded(request.user,
-                                    legal_statement=statement)
-                            obj.save('added upload event')
-
-                        return HttpResponseSeeOtherRedirect(next_url)
+                        return HttpResponseSeeOtherRedirect(reverse('publication:edit',
+                                                                    kwargs={'pid': obj.pid}))
                 except RequestFailed as rf:
                     context['error'] = rf
 
@@ -278,6 +236,194 @@ def ingest(request):
     return render(request, 'publication/upload.html', context)
 
 
+
+@login_required
+def ingest_status(request, id):
+    '''Status of an uploaded article queued for ingest in the
+    background (see :class:`~openemory.publication.models.IngestJob`).
+    AJAX requests get the job status as JSON, for polling; otherwise,
+    displays a page that polls until processing is complete, or
+    redirects to edit the article once it has been ingested.
+    '''
+    job = get_object_or_404(IngestJob, pk=id, user=request.user)
+    edit_url = reverse('publication:edit', kwargs={'pid': job.pid}) \
+               if job.status == 'complete' else None
+
+    if request.is_ajax():
+        data = {'id': job.pk, 'status': job.status, 'pid': job.pid,
+                'num_pages': job.num_pages, 'error': job.error,
+                'edit_url': edit_url}
+        return HttpResponse(json_serializer.encode(data),
+                            content_type='application/json')
+
+    if edit_url:
+        messages.success(request,
+            'Success! Your article was uploaded. Please complete the required fields in Citation Information and submit.',
+            extra_tags='upload')
+        return HttpResponseSeeOtherRedirect(edit_url)
+
+    return render(request, 'publication/ingest_status.html', {'job': job})
+
+def _last_modified(*datastreams):
+    '''Most recent modification date of the specified datastreams, as
+    seconds since the epoch (e.g., for use with
+    :meth:`django.utils.http.http_date`).'''
+    return max(calendar.timegm(ds.created.utctimetuple())
+               for ds in datastreams)
+
+def _not_modified(request, etag=None, last_modified=None):
+    '''Check the conditional request headers (**If-None-Match** and
+    **If-Modified-Since**) against the current ETag and last
+    modification time (seconds since the epoch) of a resource.
+    Returns True if the copy the client already has is current, and a
+    304 Not Modified response should be returned.'''
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        etags = parse_etags(if_none_match)
+        return etag is not None and ('*' in etags or etag in etags)
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since and last_modified is not None:
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and \
+               int(last_modified) <= if_modified_since
+    return False
+
+def _not_modified_response(etag=None, last_modified=None):
+    '''Generate a 304 Not Modified response with validator headers.'''
+    response = HttpResponseNotModified()
+    if etag is not None:
+        response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+_byte_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def _byte_range(request, size, etag=None, last_modified=None):
+    '''Determine the byte range requested in the HTTP **Range** header
+    for content of the specified size.  Only single ranges are
+    supported; multiple ranges, malformed headers, and an
+    **If-Range** that does not match the current ETag or modification
+    time result in the full content being returned.
+
+    :returns: None if the full content should be returned, a tuple of
+        (start, end) byte positions (inclusive), or False if the
+        requested range cannot be satisfied
+    '''
+    if request.method != 'GET':
+        return None
+    match = _byte_range_re.match(request.META.get('HTTP_RANGE', '').strip())
+    if not match or not any(match.groups()):
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range:
+        if_range_date = parse_http_date_safe(if_range)
+        if if_range_date is not None:
+            if last_modified is None or int(last_modified) > if_range_date:
+                return None
+        elif etag is None or etag not in parse_etags(if_range):
+            return None
+
+    start, end = match.groups()
+    if not start:
+        # suffix range: last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return (start, end)
+
+def _is_new_download(byte_range):
+    '''Whether a response for the specified byte range (see
+    :meth:`_byte_range`) is the beginning of a download: the full
+    content or a range starting at the beginning, not a resumed or
+    partial request for the rest of the content.'''
+    return byte_range is None or bool(byte_range and byte_range[0] == 0)
+
+def _range_iter(chunks, start, length):
+    '''Generator to skip the first ``start`` bytes of an iterable of
+    content chunks and return the following ``length`` bytes.'''
+    for chunk in chunks:
+        if start >= len(chunk):
+            start -= len(chunk)
+            continue
+        chunk = chunk[start:start + length]
+        start = 0
+        length -= len(chunk)
+        yield chunk
+        if length <= 0:
+            break
+
+def _partial_response(chunks, size, byte_range, content_type, headers):
+    '''Generate a 206 Partial Content response (or a 416 Requested
+    Range Not Satisfiable response, if ``byte_range`` is False) for
+    content chunks beginning at the start of the byte range.'''
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_range_iter(chunks, 0, length),
+                                     content_type=content_type, status=206)
+    response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    response['Content-Length'] = length
+    for key, val in headers.iteritems():
+        response[key] = val
+    return response
+
+def _serve_datastream(request, obj, dsid, repo, headers=None,
+                      count_download=False):
+    '''Serve an object datastream with support for conditional and
+    range requests, using the datastream checksum as ETag and
+    its creation date as the last modification time.  Full content
+    responses are handled by :meth:`eulfedora.views.raw_datastream`.
+
+    If **count_download** is True, download statistics are updated for
+    the beginning of a download (see :meth:`_is_new_download`), but not
+    for not-modified responses or resumed requests.'''
+    headers = headers or {}
+    ds = obj.getDatastreamObject(dsid)
+    byte_range = None
+    if ds is not None and ds.exists:
+        etag = ds.checksum
+        if not etag or etag.lower() == 'none':
+            # checksums are not enabled for this datastream
+            etag = None
+        last_modified = _last_modified(ds)
+        if _not_modified(request, etag, last_modified):
+            return _not_modified_response(etag, last_modified)
+
+        byte_range = _byte_range(request, ds.size, etag, last_modified)
+        if count_download and _is_new_download(byte_range):
+            _count_download(request, obj)
+        if byte_range is not None:
+            # fedora does not support range requests for datastream
+            # content; skip over the beginning of the content here
+            chunks = []
+            if byte_range is not False:
+                start, end = byte_range
+                chunks = _range_iter(ds.get_chunked_content(),
+                                     start, end - start + 1)
+            range_headers = dict(headers)
+            range_headers['Last-Modified'] = http_date(last_modified)
+            if etag is not None:
+                range_headers['ETag'] = quote_etag(etag)
+            return _partial_response(chunks, ds.size, byte_range,
+                                     ds.mimetype, range_headers)
+    elif count_download:
+        _count_download(request, obj)
+
+    return raw_datastream(request, obj.pid, dsid, type=Article,
+                          repo=repo, headers=headers)
+
 def object_last_modified(request, pid):
     '''Return the last modification date for an object in Fedora, to
     allow for conditional processing with use with
@@ -385,9 +531,7 @@ def view_article(request, pid):
     # only increment stats on GET requests (i.e., not on HEAD)
     if request.method == 'GET':
         if not request.user.has_perm('publication.review_article') and not request.user.has_perm('harvest.view_harvestrecord'):
-            stats = obj.statistics()
-            stats.num_views += 1
-            stats.save()
+            stats_buffer.increment(obj.pid, views=1)
 
     return render(request, 'publication/view.html', {'article': obj})
 
@@ -601,7 +745,6 @@ def download_pdf(request, pid):
             # generate a default filename based on the object
             # FIXME: what do we actually want here? ARK noid?
             'Content-Disposition': "attachment; filename=%s.pdf" % obj.pid,
-            #'Last-Modified': obj.pdf.created,
         }
         # if the PDF is embargoed, check that user should have access (bail out if not)
         if obj.is_embargoed:
@@ -614,48 +757,80 @@ def download_pdf(request, pid):
                 tpl = get_template('403.html')
                 return HttpResponseForbidden(tpl.render(RequestContext(request)))
 
-        # at this point we know that we're authorized to view the pdf. bump
-        # stats before doing the deed (but only if this is a GET)
-        if request.method == 'GET':
-            if not request.user.has_perm('publication.review_article') and not request.user.has_perm('harvest.view_harvestrecord'):
-                stats = obj.statistics()
-                stats.num_downloads += 1
-                stats.save()
+        # at this point we know that we're authorized to view the pdf.
+        # merged pdf+cover depends on pdf, metadata and cover page version,
+        # all of which are part of the cache key, used as the etag; no
+        # last-modified is sent, since datastream dates do not reflect
+        # cover page changes and dates would match a stale cover page
+        etag = cover_pdf_cache.key(obj)
+        if _not_modified(request, etag):
+            # client already has the current version; not a new download
+            return _not_modified_response(etag)
 
         try:
-            content = obj.pdf_with_cover()
-            response = HttpResponse(content, mimetype='application/pdf')
-            # pdf+cover depends on metadata; if descMetadata changed more recently
-            # than pdf, use the metadata last-modified date.
-            #if obj.descMetadata.created > obj.pdf.created:
-            #    extra_headers['Last-Modified'] = obj.descMetadata.created
-            # NOTE: could also potentially change based on cover logic changes...
-
-            # FIXME: any way to calculate content-length? ETag based on pdf+mods ?
-            for key, val in extra_headers.iteritems():
-                response[key] = val
-            return response
-
+            # merged pdf+cover is generated once and served from the
+            # on-disk cache until the pdf, metadata or cover page changes;
+            # open it right away, since another process may remove the
+            # cached file (an open file can still be read)
+            pdf = open(cover_pdf_cache.get(obj), 'rb')
         except RequestFailed:
             # re-raise so we can handle it below. TODO: simplify this logic a bit
             raise
         except:
             logger.warn('Exception on %s; returning without cover page' % obj.pid)
             # cover page failed - fall back to pdf without
-            # use generic raw datastream view from eulfedora
-            return raw_datastream(request, pid, Article.pdf.id, type=Article,
-                                  repo=repo, headers=extra_headers)
+            return _serve_datastream(request, obj, Article.pdf.id, repo,
+                                     headers=extra_headers, count_download=True)
+
+        size = os.fstat(pdf.fileno()).st_size
+        byte_range = _byte_range(request, size, etag)
+        if byte_range is False:
+            pdf.close()
+            return _partial_response([], size, byte_range,
+                                     'application/pdf', extra_headers)
+        # only count the beginning of a download, not resumed or
+        # partial requests for the rest of the file
+        if _is_new_download(byte_range):
+            _count_download(request, obj)
+
+        extra_headers.update({
+            'ETag': quote_etag(etag),
+            'Accept-Ranges': 'bytes',
+        })
+        if byte_range is not None:
+            pdf.seek(byte_range[0])
+            return _partial_response(FileWrapper(pdf), size, byte_range,
+                                     'application/pdf', extra_headers)
+
+        response = StreamingHttpResponse(FileWrapper(pdf),
+                                         content_type='application/pdf')
+        response['Content-Length'] = size
+        for key, val in extra_headers.iteritems():
+            response[key] = val
+        return response
 
     except RequestFailed:
         raise Http404
 
+def _count_download(request, obj):
+    '''Bump download statistics for an article (only for GET requests,
+    and not for site admins or reviewers).'''
+    if request.method == 'GET':
+        if not request.user.has_perm('publication.review_article') and not request.user.has_perm('harvest.view_harvestrecord'):
+            stats_buffer.increment(obj.pid, downloads=1)
+
 
 # permission ?
 def view_datastream(request, pid, dsid):
     '''Access object datastreams on
     :class:`openemory.publication.model.Article` objects'''
-    # initialize local repo with logged-in user credentials & call generic view
-    return raw_datastream(request, pid, dsid, type=Article, repo=Repository(request=request))
+    # initialize local repo with logged-in user credentials
+    repo = Repository(request=request)
+    try:
+        obj = repo.get_object(pid, type=Article)
+        return _serve_datastream(request, obj, dsid, repo)
+    except RequestFailed:
+        raise Http404
 
 def view_private_datastream(request, pid, dsid):
     '''Access raw object datastreams accessible only to object owners and
@@ -676,8 +851,8 @@ def view_private_datastream(request, pid, dsid):
         if (request.user.is_authenticated()) and \
            (request.user.username in obj.owner
                or request.user.is_superuser):
-            return raw_datastream(request, pid, dsid, type=Article,
-                                  repo=repo, headers=extra_headers)
+            return _serve_datastream(request, obj, dsid, repo,
+                                     headers=extra_headers)
         elif request.user.is_authenticated():
             tpl = get_template('403.html')
             return HttpResponseForbidden(tpl.render(RequestContext(request)))
@@ -801,27 +976,15 @@ def site_index(request):
                             state='A') \
                             .field_limit(ARTICLE_VIEW_FIELDS)
 
-    # find most viewed content
-    # - get distinct list of pids (no matter what year), and aggregate views
-    # - make sure article has at least 1 download to be listed
-    stats = ArticleStatistics.objects.values('pid').distinct() \
-               .annotate(all_views=Sum('num_views'), all_downloads=Sum('num_downloads')) \
-               .filter(all_views__gt=0) \
-               .order_by('-all_views') \
-               .values('pid', 'all_views', 'all_downloads')[:10]
+    # find most viewed content, based on all-time statistics (no matter what year)
+    # - make sure article has at least 1 view to be listed
+    stats = ArticleTotalStatistics.objects.filter(num_views__gt=0) \
+               .order_by('-num_views') \
+               .values('pid', 'num_views', 'num_downloads')[:10]
     # list of pids in most-viewed order
     pids = [st['pid'] for st in stats]
-    if pids:
-        # build a Solr OR query to retrieve browse details on most viewed records
-        pid_filter = solr.Q()
-        for pid in pids:
-            pid_filter |= solr.Q(pid=pid)
-        most_viewed = q.filter(pid_filter).execute()
-        # re-sort the solr results according to stats order
-        most_viewed = sorted(most_viewed, cmp=lambda x,y: cmp(pids.index(x['pid']),
-                                                              pids.index(y['pid'])))
-    else:
-        most_viewed = []
+    # retrieve browse details on most viewed records, in stats order
+    most_viewed = solr_fetch_pids(solr, pids, q)
 
     # find ten most recently modified articles that are published on the site
     # FIXME: this logic is not quite right
@@ -829,21 +992,22 @@ def site_index(request):
     recent = q.sort_by('-last_modified').paginate(rows=10).execute()
 
     # patch download & view counts into solr results
+    recent_stats = dict((st.pid, st) for st in
+        ArticleTotalStatistics.objects.filter(pid__in=[item['pid'] for item in recent]))
     for item in recent:
-        pid = item['pid']
-        if pid in pids:
-            pidstats = stats[pids.index(pid)]
-            item['views'] = pidstats['all_views']
-            item['downloads'] = pidstats['all_downloads']
+        pidstats = recent_stats.get(item['pid'], None)
+        if pidstats is not None:
+            item['views'] = pidstats.num_views
+            item['downloads'] = pidstats.num_downloads
         else:
             item['views'] = item['downloads'] = 0
 
     # patch download & view counts into solr result
+    stats_by_pid = dict((st['pid'], st) for st in stats)
     for item in most_viewed:
-        pid = item['pid']
-        pidstats = stats[pids.index(pid)]
-        item['views'] = pidstats['all_views']
-        item['downloads'] = pidstats['all_downloads']
+        pidstats = stats_by_pid[item['pid']]
+        item['views'] = pidstats['num_views']
+        item['downloads'] = pidstats['num_downloads']
 
     #Featured Article
     featured_article_pids = FeaturedArticle.objects.order_by('?') # random sort
@@ -882,14 +1046,11 @@ def summary(request):
     # (does not account for review/edit after initial publication)
     recent = q.sort_by('-last_modified').paginate(rows=10).execute()
 
-    # find most downloaded content
-    # - get distinct list of pids (no matter what year), and aggregate downloads
+    # find most downloaded content, based on all-time statistics (no matter what year)
     # - make sure article has at least 1 download to be listed
-    stats = ArticleStatistics.objects.values('pid').distinct() \
-               .annotate(all_downloads=Sum('num_downloads')) \
-               .filter(all_downloads__gt=0) \
-               .order_by('-all_downloads') \
-               .values('pid', 'all_downloads')[:10]
+    stats = ArticleTotalStatistics.objects.filter(num_downloads__gt=0) \
+               .order_by('-num_downloads') \
+               .values('pid', 'num_downloads')[:10]
 
     # FIXME: we should probably explicitly exclude embargoed documents
     # from a "top downloads" list...
@@ -902,14 +1063,8 @@ def summary(request):
     else:
         # list of pids in most-viewed order
         pids = [st['pid'] for st in stats]
-        # build a Solr OR query to retrieve browse details on most viewed records
-        pid_filter = solr.Q()
-        for pid in pids:
-            pid_filter |= solr.Q(pid=pid)
-        most_dl = q.filter(pid_filter).execute()
-        # re-sort the solr results according to stats order
-        most_dl = sorted(most_dl, cmp=lambda x,y: cmp(pids.index(x['pid']),
-                                                              pids.index(y['pid'])))
+        # retrieve browse details on most downloaded records, in stats order
+        most_dl = solr_fetch_pids(solr, pids, q)
     return render(request, 'publication/summary.html',
                   {'most_downloaded': most_dl, 'newest': recent})
 
@@ -918,10 +1073,10 @@ def departments(request):
     '''List department names based on article information in solr,
     grouped by division name.'''
     solr = solr_interface()
-    r = solr.query(content_model=Article.ARTICLE_CONTENT_MODEL, state='A') \
-            .facet_by('division_dept_id', limit=-1, sort='index') \
-            .paginate(rows=0) \
-            .execute()
+    r = search_cache.execute(
+            solr.query(content_model=Article.ARTICLE_CONTENT_MODEL, state='A') \
+                .facet_by('division_dept_id', limit=-1, sort='index') \
+                .paginate(rows=0))
     div_depts = r.facet_counts.facet_fields['division_dept_id']
 
     depts = []
@@ -976,11 +1131,9 @@ def search(request):
         item_terms.extend(within_filter)
     if people_terms:
         # if it looks like a name search search only for that person in dir name
-        # fall back to searching first and last name fields
+        # (falls back to first and last name fields; see _search_people)
         if name_info:
             people_q = people_q.query(directory_name=name_info['full_name'])
-            if len(people_q) == 0:
-                people_q = people_q.query(first_name=name_info['first_name'], last_name=name_info['last_name'])
         else:
             people_q = people_q.query(name_text=people_terms)
 
@@ -1024,17 +1177,23 @@ def search(request):
         q = q.facet_by(field['solr'], mincount=1)
         # NOTE: may also want to specify a limit; possibly also higher mincount
 
-    # facets currently are not available through paginated result object;
-    #  - to get them, run the query without returning any rows
-    facet_result = q.paginate(rows=0).execute()
-    facet_fields = facet_result.facet_counts.facet_fields
+    # anonymous searches repeat often, so results are cached; logged in
+    # users (e.g., authors checking their own articles) always query solr
+    result_cache = None if request.user.is_authenticated() else search_cache
+
+    # search for people at the same time as articles
+    people = BackgroundCall(_search_people, people_q,
+                            name_info if people_terms else None, result_cache)
 
     # add highlighting & relevance ranking
     highlight_fields = [ 'abstract', 'fulltext', ]
     q = q.highlight(highlight_fields).sort_by('-score')
-    # for the paginated version, limit to display fields + score
+    # for the paginated version, limit to display fields + score;
+    # the page, total and facets are all returned by a single request
     results, show_pages = paginate(request,
-                                   q.field_limit(ARTICLE_VIEW_FIELDS, score=True))
+                                   q.field_limit(ARTICLE_VIEW_FIELDS, score=True),
+                                   result_cache=result_cache)
+    facet_fields = results.facet_counts.facet_fields
 
     facets = {}
     facets = []
@@ -1055,11 +1214,9 @@ def search(request):
                 }
                 facets.append(facet)
 
-    people = people_q.paginate(rows=3).execute()
-
     return render(request, 'publication/search-results.html', {
             'results': results,
-            'authors': people,
+            'authors': people.result(),
             'search_terms': item_terms,
             'show_pages': show_pages,
             #used to compare against the embargo_end date
@@ -1071,6 +1228,23 @@ def search(request):
         })
 
 
+def _search_people(people_q, name_info=None, result_cache=None):
+    # first few people matching a search; a name search falls back to
+    # first and last name fields only if the directory name is not found,
+    # so most searches take a single (cacheable) request
+    def _execute(query):
+        query = query.paginate(rows=3)
+        if result_cache is not None:
+            return result_cache.execute(query)
+        return query.execute()
+
+    people = _execute(people_q)
+    if name_info and len(people) == 0:
+        people = _execute(people_q.query(first_name=name_info['first_name'],
+                                         last_name=name_info['last_name']))
+    return people
+
+
 def browse_field(request, field):
     '''Browse a list of values for a specific field, e.g. authors,
     subjects, or journal titles.  Displays a list of values for the
@@ -1099,7 +1273,7 @@ def browse_field(request, field):
     q = solr.query().filter(content_model=Article.ARTICLE_CONTENT_MODEL,
                             state='A') \
                     .facet_by(facet, mincount=1, limit=-1, sort='index', prefix=filter.lower())
-    result = q.paginate(rows=0).execute()
+    result = search_cache.execute(q.paginate(rows=0))
     facets = result.facet_counts.facet_fields[facet]
 
     #removes name from field for proper presentation
@@ -1252,8 +1426,10 @@ def review_queue(request):
     q = solr.query().exclude(review_date__any=True)\
             .filter(content_model=Article.ARTICLE_CONTENT_MODEL,
                         state='A') # restrict to active (published) articles only
-    q = q.sort_by('created').field_limit(ARTICLE_VIEW_FIELDS)
-    results, show_pages = paginate(request, q)
+    q = q.field_limit(ARTICLE_VIEW_FIELDS)
+    # sorted by creation date, with pid for a unique order, so that deep
+    # pages can be found with a cursor from the previous page
+    results, show_pages = paginate(request, q, ordering=('created', 'pid'))
 
     template_name = 'publication/review-queue.html'
     # for ajax requests, only display the inner content
@@ -27,3 +27,10 @@ PIDMAN_DOMAIN = None
 # site, but we don't want to have to mock out solr for every view test.
 TEMPLATE_CONTEXT_PROCESSORS.remove('openemory.accounts.context_processors.statistics')
 TEMPLATE_CONTEXT_PROCESSORS.remove('openemory.publication.context_processors.statistics')
+
+# write article view & download statistics immediately instead of buffering,
+# so tests can check updated counts
+ARTICLE_STATS_BUFFERED = False
+
+# don't cache search results, so view tests get their own mock solr results
+SEARCH_CACHE_TIMEOUT = 0
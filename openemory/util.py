@@ -19,19 +19,32 @@ Common utility methods used elsewhere in the site.
 
 '''
 
+from collections import defaultdict, Mapping, OrderedDict
 import hashlib
 import httplib2
 from django.conf import settings
-from django.core.paginator import Paginator, InvalidPage, EmptyPage
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator, Page, InvalidPage, EmptyPage, \
+     PageNotAnInteger
+from django.db.models import Q
 import sunburnt
 from eulcommon.searchutil import pages_to_show
 #from pyPdf import PdfFileReader
-from pdfminer.pdfinterp import PDFResourceManager, process_pdf
-from pdfminer.converter import TextConverter
-from pdfminer.layout import LAParams
-from cStringIO import StringIO
+import os
 import re
 import difflib
+import operator
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urlparse
+
+from openemory import pdftext
 
 import logging
 
@@ -58,31 +71,469 @@ def pmc_access_url(pmcid):
     return 'http://www.ncbi.nlm.nih.gov/pmc/articles/PMC%s/' % (pmcid,)
 
 
-def solr_interface(solr_url=None):
+class _ThreadLocalHttp(object):
+    # httplib2.Http work-alike for sharing a Solr client between threads:
+    # httplib2 connections are not thread-safe, so each thread makes its
+    # requests (and keeps its connections alive) with its own Http.
+    # on_error is called when a request fails with a connection error or
+    # a Solr server error
+
+    def __init__(self, on_error=None, **options):
+        self.on_error = on_error
+        self.options = options
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = httplib2.Http(**self.options)
+        return http
+
+    def request(self, *args, **kwargs):
+        try:
+            response, content = self.http.request(*args, **kwargs)
+        except socket.error:
+            if self.on_error is not None:
+                self.on_error()
+            raise
+        if response.status >= 500 and self.on_error is not None:
+            self.on_error()
+        return response, content
+
+
+class SolrClientPool(object):
+    '''Process-wide, thread-safe pool of :class:`sunburnt.SolrInterface`
+    clients, one per Solr URL.  Creating a sunburnt client downloads and
+    parses the Solr schema, so clients are created once and reused; HTTP
+    connections are kept alive and reused by each thread.  Requests time
+    out after **SOLR_TIMEOUT** seconds if configured in django settings
+    (default 30); clients for indexing use **SOLR_INDEX_TIMEOUT** instead
+    (default None, no timeout), since commits and optimizes on a large
+    index can take much longer than a search.
+
+    When a request fails with a connection error or a Solr server error,
+    Solr is checked with :meth:`health_check`, which discards the clients
+    for that URL if Solr is not responding.
+
+    Use :meth:`solr_interface` to get a client from the default pool.
+    '''
+
+    PING_PATH = 'admin/ping'
+    'path of the Solr ping request handler, relative to the Solr URL'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._connections = {}
+
+    def http_options(self, indexing=False):
+        '''Options for :class:`httplib2.Http`, based on django settings.'''
+        if indexing:
+            opts = {'timeout': getattr(settings, 'SOLR_INDEX_TIMEOUT', None)}
+        else:
+            opts = {'timeout': getattr(settings, 'SOLR_TIMEOUT', 30)}
+        if hasattr(settings, 'SOLR_CA_CERT_PATH'):
+            opts['ca_certs'] = settings.SOLR_CA_CERT_PATH
+        if getattr(settings, 'SOLR_DISABLE_CERT_CHECK', False):
+            opts['disable_ssl_certificate_validation'] = True
+        return opts
+
+    def connection(self, solr_url, indexing=False):
+        '''Shared HTTP connection for a Solr URL, with a separate
+        :class:`httplib2.Http` for each thread.'''
+        key = (solr_url, indexing)
+        with self._lock:
+            if key not in self._connections:
+                self._connections[key] = _ThreadLocalHttp(
+                    on_error=lambda: self.health_check(solr_url),
+                    **self.http_options(indexing))
+            return self._connections[key]
+
+    def get(self, solr_url, indexing=False):
+        '''Get the client for a Solr URL, creating it if necessary.
+
+        :param indexing: get a client for adding and committing
+            documents, with the indexing timeout
+        '''
+        key = (solr_url, indexing)
+        client = self._clients.get(key)
+        if client is None:
+            http = self.connection(solr_url, indexing)
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    # sunburnt loads the schema when the client is created
+                    client = sunburnt.SolrInterface(solr_url, http_connection=http)
+                    client.commit = self._invalidating(client.commit)
+                    self._clients[key] = client
+        return client
+
+    def _invalidating(self, commit):
+        # wrap a client commit method so that cached search results are
+        # invalidated whenever changes are committed to the index
+        def _commit(*args, **kwargs):
+            result = commit(*args, **kwargs)
+            invalidate_search_cache()
+            return result
+        return _commit
+
+    def discard(self, solr_url=None):
+        '''Remove clients and connections for a Solr URL (or all of
+        them), so they are created again on next use, e.g. after the Solr
+        schema has changed, or in unit tests that replace
+        :class:`sunburnt.SolrInterface`.'''
+        with self._lock:
+            for key in self._clients.keys():
+                if solr_url is None or key[0] == solr_url:
+                    del self._clients[key]
+            for key in self._connections.keys():
+                if solr_url is None or key[0] == solr_url:
+                    del self._connections[key]
+
+    def health_check(self, solr_url):
+        '''Check that Solr is responding, with a request to the ping
+        handler.  If the check fails, the client for the URL is discarded,
+        so that the next request creates a new client and reloads the
+        schema (e.g., when Solr has been restarted).
+
+        :returns: True if Solr responded successfully
+        '''
+        try:
+            # request with the thread's http directly, so that a failed
+            # ping does not start another health check
+            response, content = self.connection(solr_url).http \
+                                    .request(urlparse.urljoin(solr_url, self.PING_PATH))
+            healthy = response.status == 200
+            if not healthy:
+                logger.warn('Solr ping at %s returned status %s' % (solr_url, response.status))
+        except Exception as err:
+            logger.warn('Solr ping at %s failed: %s' % (solr_url, err))
+            healthy = False
+        if not healthy:
+            self.discard(solr_url)
+        return healthy
+
+
+solr_pool = SolrClientPool()
+'default :class:`SolrClientPool`, used by :meth:`solr_interface`'
+
+def solr_interface(solr_url=None, indexing=False):
+    '''Get a :class:`sunburnt.SolrInterface` for the configured Solr
+    index (**SOLR_SERVER_URL**) or another Solr URL, from the shared
+    :class:`SolrClientPool`.  The client is shared by all threads, so it
+    should not be modified.
+
+    :param indexing: get a client for updating the index, which uses
+        **SOLR_INDEX_TIMEOUT** instead of **SOLR_TIMEOUT**
+    '''
     if not solr_url:
         solr_url = settings.SOLR_SERVER_URL
+    return solr_pool.get(solr_url, indexing=indexing)
+
+def solr_health_check(solr_url=None):
+    '''Check that the configured Solr index (or another Solr URL) is
+    responding; see :meth:`SolrClientPool.health_check`.'''
+    if not solr_url:
+        solr_url = settings.SOLR_SERVER_URL
+    return solr_pool.health_check(solr_url)
+
 
-    http_opts = {}
-    if hasattr(settings, 'SOLR_CA_CERT_PATH'):
-        http_opts['ca_certs'] = settings.SOLR_CA_CERT_PATH
-    if getattr(settings, 'SOLR_DISABLE_CERT_CHECK', False):
-        http_opts['disable_ssl_certificate_validation'] = True
-    http = httplib2.Http(**http_opts)
-    solr = sunburnt.SolrInterface(solr_url,
-                                  http_connection=http)
-    return solr
+PID_CHUNK_SIZE = 500
+'''maximum number of pids to look up in a single Solr request (the default
+Solr limit on boolean clauses in a query is 1024)'''
 
+def solr_pid_filter(solr, pids):
+    '''Filter for a :mod:`sunburnt` query matching any of a non-empty
+    list of pids, as a single filter query on the pid field.
+
+    :param solr: :class:`sunburnt.SolrInterface`, e.g. from
+        :meth:`solr_interface`
+    '''
+    return reduce(operator.or_, [solr.Q(pid=pid) for pid in pids])
+
+def solr_fetch_pids(solr, pids, query=None, chunk_size=PID_CHUNK_SIZE):
+    '''Get Solr results for a list of pids, in the same order as the
+    list.  Pids are looked up **chunk_size** at a time with
+    :meth:`solr_pid_filter`; pids not found in Solr are skipped.
+
+    :param solr: :class:`sunburnt.SolrInterface`, e.g. from
+        :meth:`solr_interface`
+    :param pids: list of pids
+    :param query: optional :mod:`sunburnt` query to restrict the results,
+        e.g. to active articles, or to limit the fields returned
+    :returns: list of Solr result documents
+    '''
+    if query is None:
+        query = solr.query()
+    found = {}
+    for i in range(0, len(pids), chunk_size):
+        chunk = pids[i:i + chunk_size]
+        results = query.filter(solr_pid_filter(solr, chunk)) \
+                       .paginate(rows=len(chunk)).execute()
+        for doc in results:
+            found[doc['pid']] = doc
+    return [found[pid] for pid in pids if pid in found]
 
 
-def paginate(request, query):
+STATISTICS_VERSION_KEY = 'openemory-statistics-version'
+
+def _statistics_cache_key(name):
+    # statistics cache keys include a version number, so all cached
+    # statistics can be invalidated at once by changing the version
+    version = cache.get(STATISTICS_VERSION_KEY, 1)
+    return 'openemory-statistics-%s-v%s' % (name, version)
+
+def invalidate_statistics():
+    '''Invalidate all cached site statistics (see :class:`CachedStatistics`),
+    e.g. after changes to the Solr index have been committed.'''
+    try:
+        cache.incr(STATISTICS_VERSION_KEY)
+    except ValueError:
+        # version key is not set or has expired; start from a new
+        # number not used by any previously cached statistics
+        cache.set(STATISTICS_VERSION_KEY, int(time.time()),
+                  60 * 60 * 24 * 30)
+
+
+class CachedStatistics(Mapping):
+    '''Lazily-evaluated, read-only dictionary of site-wide statistics,
+    intended for use in template context processors.  Statistics are
+    not calculated until a value is actually accessed (e.g., when a
+    template references them); calculated statistics are stored in
+    the django cache for **STATISTICS_CACHE_TIMEOUT** seconds (default
+    300), or until :meth:`invalidate_statistics` is called.
+
+    :param name: unique name for this set of statistics, used in the
+        cache key
+    :param calculate: method to calculate the statistics; should return
+        a dictionary
+    '''
+
+    def __init__(self, name, calculate):
+        self.name = name
+        self.calculate = calculate
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            key = _statistics_cache_key(self.name)
+            data = cache.get(key)
+            if data is None:
+                data = self.calculate()
+                cache.set(key, data,
+                          getattr(settings, 'STATISTICS_CACHE_TIMEOUT', 300))
+            self._data = data
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.name)
+
+
+SEARCH_CACHE_VERSION_KEY = 'openemory-search-cache-version'
+SEARCH_CACHE_STATS_KEY = 'openemory-search-cache-%s'
+
+def _normalize_param(value):
+    # collapse whitespace in query parameter values
+    if isinstance(value, basestring):
+        return u' '.join(value.split())
+    return value
+
+
+class SolrResultCache(object):
+    '''Process-wide, thread-safe cache of :mod:`sunburnt` query results,
+    for queries that are repeated often, such as anonymous searches and
+    browse listings.  Results are keyed on the normalized Solr request
+    parameters (query, filters, facets, sort, and page), kept for
+    **SEARCH_CACHE_TIMEOUT** seconds (default 60; 0 disables caching),
+    and the least recently used results are evicted when there are more
+    than **SEARCH_CACHE_MAX_ENTRIES** (default 500).
+
+    All cached results are invalidated when changes are committed to
+    the index through a client from :meth:`solr_interface` (see
+    :meth:`invalidate_search_cache`), in every process sharing the
+    django cache.
+
+    Hits, misses, expired, invalidated and evicted results are counted
+    per process, and periodically added to totals in the django cache;
+    see :meth:`search_cache_stats`.
+    '''
+
+    STATS = ('hits', 'misses', 'expired', 'invalidated', 'evicted')
+    'statistics counted for the cache'
+
+    STATS_FLUSH_COUNT = 100
+    'number of lookups between updates to the statistics in the django cache'
+
+    def __init__(self, max_entries=None, timeout=None):
+        self._max_entries = max_entries
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = defaultdict(int)
+        self._pending = defaultdict(int)
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'SEARCH_CACHE_MAX_ENTRIES', 500)
+
+    @property
+    def timeout(self):
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, 'SEARCH_CACHE_TIMEOUT', 60)
+
+    def key(self, query):
+        '''Cache key for a query, based on the Solr URL and the request
+        parameters.  Whitespace in parameter values is normalized, and
+        the order of filters and facets is ignored.'''
+        params = []
+        for name, value in sorted(query.options().iteritems()):
+            if isinstance(value, (list, tuple)):
+                value = sorted(_normalize_param(v) for v in value)
+            else:
+                value = _normalize_param(value)
+            params.append((name, value))
+        url = getattr(getattr(query.interface, 'conn', None), 'url', '')
+        return hashlib.sha1(repr((url, params))).hexdigest()
+
+    def execute(self, query):
+        '''Return the results for a :mod:`sunburnt` query from the cache,
+        or execute the query and cache the results.  Cached results are
+        shared, so they should not be modified.'''
+        if not self.timeout:
+            return query.execute()
+        key = self.key(query)
+        version = cache.get(SEARCH_CACHE_VERSION_KEY, 1)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                expires, entry_version, result = entry
+                if entry_version == version and expires > now:
+                    # re-add as the most recently used entry
+                    self._entries[key] = entry
+                    self._count('hits')
+                    return result
+                self._count('expired' if entry_version == version else 'invalidated')
+            self._count('misses')
+            flush = sum(self._pending[s] for s in ('hits', 'misses')) >= self.STATS_FLUSH_COUNT
+
+        result = query.execute()
+        with self._lock:
+            self._entries[key] = (now + self.timeout, version, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count('evicted')
+        if flush:
+            self.flush_stats()
+        return result
+
+    def _count(self, stat):
+        # called with the lock held
+        self._stats[stat] += 1
+        self._pending[stat] += 1
+
+    def clear(self):
+        '''Remove all results cached in this process.'''
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        '''Statistics for this process, as a dictionary; see
+        :meth:`search_cache_stats`.'''
+        with self._lock:
+            stats = dict((s, self._stats[s]) for s in self.STATS)
+            stats['entries'] = len(self._entries)
+        return _with_hit_rate(stats)
+
+    def flush_stats(self):
+        '''Add statistics counted since the last update to the totals in
+        the django cache.'''
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        for stat, count in pending.iteritems():
+            if not count:
+                continue
+            key = SEARCH_CACHE_STATS_KEY % stat
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, 60 * 60 * 24 * 30)
+
+
+def _with_hit_rate(stats):
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = float(stats['hits']) / lookups if lookups else 0.0
+    return stats
+
+search_cache = SolrResultCache()
+'default :class:`SolrResultCache` for search and browse results'
+
+def invalidate_search_cache():
+    '''Invalidate all cached search results (see
+    :class:`SolrResultCache`), in this and any other process sharing the
+    django cache.  Called automatically when changes are committed with
+    a client from :meth:`solr_interface`.'''
+    search_cache.clear()
+    try:
+        cache.incr(SEARCH_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(SEARCH_CACHE_VERSION_KEY, int(time.time()),
+                  60 * 60 * 24 * 30)
+
+def search_cache_stats(reset=False):
+    '''Search result cache statistics totalled across processes
+    sharing the django cache, as a dictionary with counts of **hits**,
+    **misses**, **expired**, **invalidated** and **evicted** results and
+    the **hit_rate**.  Totals are updated by each process every
+    :attr:`SolrResultCache.STATS_FLUSH_COUNT` lookups.
+
+    :param reset: reset the totals after reading them
+    '''
+    search_cache.flush_stats()
+    keys = dict((SEARCH_CACHE_STATS_KEY % s, s) for s in SolrResultCache.STATS)
+    values = cache.get_many(keys.keys())
+    if reset:
+        cache.delete_many(keys.keys())
+    return _with_hit_rate(dict((stat, values.get(key, 0))
+                               for key, stat in keys.iteritems()))
+
+
+def paginate(request, query, per_page=10, ordering=None, result_cache=None):
     '''Common pagination logic, straight out of django docs.  Takes a
     :class:`~django.http.HttpRequest` and a result set that can be
     paginated; returns a tuple of the current
     :class:`django.core.paginator.Page` (based on the request) and the
     page numbers that should be displayed (generated by
     :meth:`eulcommon.searchutil.pages_to_show`).
+
+    :mod:`sunburnt` queries are paginated with a :class:`SolrPaginator`,
+    so that the current page and the total number of results are
+    retrieved with a single Solr request.  If **ordering** is specified,
+    a Solr query is sorted by those fields, and a request with an
+    ``after`` cursor (from :attr:`SolrPage.next_cursor`) along with the
+    page number is found relative to the cursor.  Solr results are
+    retrieved through **result_cache** (a :class:`SolrResultCache`), if
+    specified.
     '''
-    paginator = Paginator(query, 10)
+    if hasattr(query, 'execute'):
+        paginator = SolrPaginator(query, per_page, ordering=ordering,
+                                  result_cache=result_cache)
+    else:
+        paginator = Paginator(query, per_page)
     # get current page number
     try:
         page = int(request.GET.get('page', '1'))
@@ -90,35 +541,382 @@ def paginate(request, query):
         page = 1
     # return last page if an invalid page is requested
     try:
-        results = paginator.page(page)
+        if isinstance(paginator, SolrPaginator):
+            results = paginator.page(page, after=request.GET.get('after'))
+        else:
+            results = paginator.page(page)
     except (EmptyPage, InvalidPage):
-        results = paginator.page(paginator.num_pages)
+        page = paginator.num_pages
+        results = paginator.page(page)
 
     # calculate page links to be shown
     show_pages = pages_to_show(paginator, page)
     return results, show_pages
 
-def pdf_to_text(pdfstream):
-
-    rsrcmgr = PDFResourceManager()
-    retstr = StringIO()
-    codec = 'utf-8'
-    laparams = LAParams()
-    device = TextConverter(rsrcmgr, retstr, codec=codec, laparams=laparams)
-    
-    fp = pdfstream
-    process_pdf(rsrcmgr, device, fp)
-    fp.close()
-    device.close()
-
-    pdftext = retstr.getvalue()
-    retstr.close()
-    
-    def _strip_xml_invalids(s):
-        illegal_xml_re = re.compile(u'[\x00-\x08\x0b-\x1f\x7f-\x84\x86-\x9f\ud800-\udfff\ufdd0-\ufddf\ufffe-\uffff]')
-        return illegal_xml_re.sub('', s)
-    
-    return _strip_xml_invalids(pdftext.decode('utf-8','ignore'))
+class KeysetPage(Page):
+    '''A :class:`~django.core.paginator.Page` from a
+    :class:`KeysetPaginator`, with cursors for the previous and next
+    pages.'''
+
+    @property
+    def next_cursor(self):
+        '''Cursor for the page after this one (see
+        :meth:`KeysetPaginator.page`), or None if this is the last
+        page.'''
+        if self.has_next() and self.object_list:
+            return self.paginator.cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        '''Cursor for the page before this one, or None if this is the
+        first page.'''
+        if self.has_previous() and self.object_list:
+            return self.paginator.cursor(self.object_list[0])
+
+
+class KeysetPaginator(Paginator):
+    '''Paginator for a :class:`~django.db.models.query.QuerySet` with a
+    unique ordering (e.g., a date and the primary key), for deep
+    pagination of large result sets.  Pages requested with a cursor from
+    an adjacent page are found by filtering on the ordering fields
+    (keyset pagination), which can use an index, instead of by skipping
+    over all of the preceding results with an offset.  Pages requested by
+    number only are retrieved from whichever end of the results is
+    closer.
+
+    :param ordering: list of field names the query is ordered by;
+        descending fields are prefixed with ``-``, as for
+        :meth:`~django.db.models.query.QuerySet.order_by`
+    '''
+
+    def __init__(self, object_list, per_page, ordering, **kwargs):
+        super(KeysetPaginator, self).__init__(object_list.order_by(*ordering),
+                                              per_page, **kwargs)
+        self.ordering = ordering
+
+    def cursor(self, obj):
+        '''Cursor identifying the position of an object in the ordered
+        results, as a string.'''
+        return '|'.join(unicode(getattr(obj, field.lstrip('-')))
+                        for field in self.ordering)
+
+    def _seek(self, cursor, forward):
+        # filter for results after (or before) the cursor position
+        values = cursor.split('|')
+        if len(values) != len(self.ordering):
+            raise ValueError('invalid cursor')
+        filter = None
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            ascending = (field == name) == forward
+            cond = Q(**{'%s__%s' % (name, 'gt' if ascending else 'lt'): values[i]})
+            for prev_field, value in zip(self.ordering[:i], values):
+                cond &= Q(**{prev_field.lstrip('-'): value})
+            filter = cond if filter is None else filter | cond
+        return self.object_list.filter(filter)
+
+    def page(self, number, after=None, before=None):
+        '''Return a :class:`KeysetPage` for the given page number.  If a
+        cursor is specified for the last item on the previous page
+        (**after**) or the first item on the next page (**before**), the
+        page is found relative to it.  Invalid cursors are ignored.'''
+        number = self.validate_number(number)
+        try:
+            if after:
+                return KeysetPage(list(self._seek(after, True)[:self.per_page]),
+                                  number, self)
+            if before:
+                items = list(self._seek(before, False).reverse()[:self.per_page])
+                items.reverse()
+                return KeysetPage(items, number, self)
+        except (ValueError, ValidationError):
+            pass
+
+        bottom = (number - 1) * self.per_page
+        top = min(bottom + self.per_page, self.count)
+        if bottom > self.count / 2:
+            # closer to the end; fetch in reverse order with a smaller offset
+            items = list(self.object_list.reverse()[self.count - top:self.count - bottom])
+            items.reverse()
+        else:
+            items = list(self.object_list[bottom:top])
+        return KeysetPage(items, number, self)
+
+
+def keyset_paginate(request, query, ordering, per_page=10):
+    '''Pagination logic as in :meth:`paginate`, but using a
+    :class:`KeysetPaginator`.  If the request includes an ``after`` or
+    ``before`` cursor (from :attr:`KeysetPage.next_cursor` or
+    :attr:`KeysetPage.previous_cursor`) along with the page number, the
+    page is found relative to the cursor.
+    '''
+    paginator = KeysetPaginator(query, per_page, ordering)
+    try:
+        page = int(request.GET.get('page', '1'))
+    except ValueError:
+        page = 1
+    try:
+        results = paginator.page(page, after=request.GET.get('after'),
+                                 before=request.GET.get('before'))
+    except (EmptyPage, InvalidPage):
+        page = paginator.num_pages
+        results = paginator.page(page)
+
+    show_pages = pages_to_show(paginator, page)
+    return results, show_pages
+
+
+class SolrPage(Page):
+    '''A :class:`~django.core.paginator.Page` from a
+    :class:`SolrPaginator`.  The object list is the :mod:`sunburnt`
+    response for the page, so facet counts and highlighting from the
+    same Solr request are available.'''
+
+    @property
+    def facet_counts(self):
+        '''Facet counts for the query, from the response for this page.'''
+        return self.object_list.facet_counts
+
+    @property
+    def next_cursor(self):
+        '''Cursor for the page after this one (see
+        :meth:`SolrPaginator.page`), or None if this is the last page or
+        the paginator has no ordering.'''
+        if self.paginator.ordering and self.has_next():
+            docs = list(self.object_list)
+            if docs:
+                return self.paginator.cursor(docs[-1])
+
+
+def _solr_value(value):
+    # format a field value from a solr result for use in a query
+    if hasattr(value, 'strftime'):
+        return '%s.%03dZ' % (value.strftime('%Y-%m-%dT%H:%M:%S'),
+                             value.microsecond // 1000)
+    return unicode(value)
+
+
+class SolrPaginator(Paginator):
+    '''Paginator for a :mod:`sunburnt` query that gets each page of
+    results with a single Solr request.  Django's
+    :class:`~django.core.paginator.Paginator` counts the results with
+    one query before getting the page with another; this paginator reads
+    the total number of results (**numFound**) from the response for the
+    requested page, along with any facets requested by the query (see
+    :attr:`SolrPage.facet_counts`).  The number of results and pages is
+    not known until a page has been requested.
+
+    If the query has a unique **ordering** (e.g., a date and the pid),
+    deep pages can be requested with a cursor from the previous page
+    (:attr:`SolrPage.next_cursor`), for crawlers and anyone else walking
+    through all of the results: the page is found by filtering on the
+    ordering fields, instead of making Solr collect and skip over all of
+    the preceding results.
+
+    :param ordering: list of field names to sort the query by;
+        descending fields are prefixed with ``-``, as for
+        :meth:`sunburnt.SolrSearch.sort_by`
+    :param result_cache: optional :class:`SolrResultCache` for the
+        results of each page
+    '''
+
+    def __init__(self, object_list, per_page, ordering=None,
+                 allow_empty_first_page=True, result_cache=None):
+        if ordering:
+            for field in ordering:
+                object_list = object_list.sort_by(field)
+        super(SolrPaginator, self).__init__(object_list, per_page,
+                                            allow_empty_first_page=allow_empty_first_page)
+        self.ordering = ordering
+        self.result_cache = result_cache
+
+    def _execute(self, query):
+        if self.result_cache is not None:
+            return self.result_cache.execute(query)
+        return query.execute()
+
+    def cursor(self, doc):
+        '''Cursor identifying the position of a result in the ordered
+        results, as a string.'''
+        return '|'.join(_solr_value(doc[field.lstrip('-')])
+                        for field in self.ordering)
+
+    def _seek(self, cursor):
+        # filter for results after the cursor position
+        values = cursor.split('|')
+        if len(values) != len(self.ordering):
+            raise ValueError('invalid cursor')
+        filter = None
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            op = 'gt' if field == name else 'lt'
+            cond = self.object_list.Q(**{'%s__%s' % (name, op): values[i]})
+            for prev_field, value in zip(self.ordering[:i], values):
+                cond &= self.object_list.Q(**{prev_field.lstrip('-'): value})
+            filter = cond if filter is None else filter | cond
+        return self.object_list.filter(filter)
+
+    def page(self, number, after=None):
+        '''Return a :class:`SolrPage` for the given page number.  If the
+        paginator has an ordering and a cursor is specified for the last
+        item on the previous page (**after**), the page is found
+        relative to it.  Invalid cursors are ignored.'''
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        bottom = (number - 1) * self.per_page
+        if after and self.ordering:
+            try:
+                response = self._execute(self._seek(after) \
+                                             .paginate(start=0, rows=self.per_page))
+            except (ValueError, sunburnt.SolrError):
+                response = None
+            if response is not None:
+                # numFound only includes results after the cursor
+                self._count = bottom + response.result.numFound
+                self._num_pages = None
+                return SolrPage(response, number, self)
+
+        response = self._execute(self.object_list.paginate(start=bottom,
+                                                           rows=self.per_page))
+        self._count = response.result.numFound
+        self._num_pages = None
+        if number > self.num_pages:
+            raise EmptyPage('That page contains no results')
+        return SolrPage(response, number, self)
+
+
+class BackgroundCall(object):
+    '''Call a function in a separate thread, e.g. to run independent
+    Solr queries concurrently.  :meth:`result` waits for the call to
+    finish and returns its result, or raises any exception it raised.
+    '''
+
+    def __init__(self, func, *args, **kwargs):
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(func, args, kwargs))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self._result = func(*args, **kwargs)
+        except Exception:
+            self._error = sys.exc_info()
+
+    def result(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+
+def pdf_to_text(pdfstream, max_pages=None, max_chars=None, layout=None,
+                timeout=None):
+    '''Extract text from a PDF, page by page (see
+    :mod:`openemory.pdftext`).  Limits default to the django settings
+    **PDF_TEXT_MAX_PAGES**, **PDF_TEXT_MAX_CHARS**, **PDF_TEXT_LAYOUT**,
+    and **PDF_TEXT_TIMEOUT** (default 120 seconds).
+
+    Text is extracted in a separate process (optionally with a memory
+    limit, **PDF_TEXT_MEMORY_LIMIT**, in bytes), so that a malformed or
+    very large PDF cannot crash, hang or exhaust the memory of the
+    calling process; :class:`PdfTextError` is raised if extraction times
+    out or fails.  Setting the timeout to 0 or None extracts text in the
+    calling process instead.  The separate process runs the Python
+    interpreter configured as **PDF_TEXT_PYTHON** (by default, the current
+    interpreter), with the same import path as the calling process.
+
+    :param pdfstream: file-like object with PDF content; closed when
+        text extraction is complete
+    :param max_pages: maximum number of pages to extract text from
+    :param max_chars: maximum number of characters of text to return
+    :param layout: use pdfminer layout analysis
+    :param timeout: maximum time for text extraction, in seconds
+    :returns: unicode
+    '''
+    if max_pages is None:
+        max_pages = getattr(settings, 'PDF_TEXT_MAX_PAGES', None)
+    if max_chars is None:
+        max_chars = getattr(settings, 'PDF_TEXT_MAX_CHARS', None)
+    if layout is None:
+        layout = getattr(settings, 'PDF_TEXT_LAYOUT', True)
+    if timeout is None:
+        timeout = getattr(settings, 'PDF_TEXT_TIMEOUT', 120)
+
+    try:
+        if timeout:
+            return _pdf_to_text_subprocess(pdfstream, max_pages, max_chars,
+                                           layout, timeout)
+        return u''.join(pdftext.pdf_text(pdfstream, layout=layout,
+                                         max_pages=max_pages,
+                                         max_chars=max_chars))
+    finally:
+        pdfstream.close()
+
+
+class PdfTextError(Exception):
+    '''Text extraction from a PDF in a separate process timed out or
+    failed.'''
+    pass
+
+
+def _pdf_to_text_subprocess(pdfstream, max_pages, max_chars, layout, timeout):
+    # the child process reads the PDF from a file, not a pipe, so that
+    # pdfminer can seek in it
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as pdf:
+        shutil.copyfileobj(pdfstream, pdf)
+        pdf.flush()
+
+        # under mod_wsgi, sys.executable is not necessarily a python
+        # interpreter (or the virtualenv's), so it can be configured
+        python = getattr(settings, 'PDF_TEXT_PYTHON', None) or sys.executable
+        cmd = [python, '-m', 'openemory.pdftext']
+        if max_pages:
+            cmd.extend(['--max-pages', str(max_pages)])
+        if max_chars:
+            cmd.extend(['--max-chars', str(max_chars)])
+        if not layout:
+            cmd.append('--no-layout')
+        cmd.append(pdf.name)
+
+        # the child imports openemory and pdfminer from the same path as
+        # this process, e.g. site-packages added by mod_wsgi python-path
+        env = dict(os.environ)
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [base_path] + sys.path))
+
+        memory_limit = getattr(settings, 'PDF_TEXT_MEMORY_LIMIT', None)
+        def _limit_memory():
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, close_fds=True, env=env,
+                                preexec_fn=_limit_memory if memory_limit else None)
+        timed_out = threading.Event()
+        def _kill():
+            timed_out.set()
+            proc.kill()
+        timer = threading.Timer(timeout, _kill)
+        timer.start()
+        try:
+            stdout, stderr = proc.communicate()
+        finally:
+            timer.cancel()
+
+    if timed_out.is_set():
+        raise PdfTextError('PDF text extraction timed out after %s sec' % timeout)
+    if proc.returncode != 0:
+        # report the last line of output, i.e. the exception
+        error = (stderr.strip().splitlines() or [''])[-1]
+        raise PdfTextError('PDF text extraction failed (exit code %s): %s' % \
+                           (proc.returncode, error))
+    return stdout.decode('utf-8', 'ignore')
 
 
 def percent_match(str1, str2, percent):